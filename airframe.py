@@ -1,7 +1,8 @@
 from onshape import Part
 from textwrap import dedent
 
-def create_airframe_config(name: str, parts: dict[str, Part]) -> str:
+def create_airframe_config(name: str, parts: dict[str, Part], moment_constant: float = 0.05) -> str:
+    # moment_constant is the rotors' torque to thrust ratio, ccw rotors positive
     header = dedent(f"""\
         #!/bin/sh
         #
@@ -22,19 +23,19 @@ def create_airframe_config(name: str, parts: dict[str, Part]) -> str:
         default_param("CA_ROTOR0_PX", rotor_positions["8x4x3_propeller_ccw_1"][0]),
         default_param("CA_ROTOR0_PY", -rotor_positions["8x4x3_propeller_ccw_1"][1]),
         default_param("CA_ROTOR0_PZ", rotor_positions["8x4x3_propeller_ccw_1"][2]),
-        default_param("CA_ROTOR0_KM", 0.05),
+        default_param("CA_ROTOR0_KM", moment_constant),
         default_param("CA_ROTOR1_PX", rotor_positions["8x4x3_propeller_ccw_2"][0]),
         default_param("CA_ROTOR1_PY", -rotor_positions["8x4x3_propeller_ccw_2"][1]),
         default_param("CA_ROTOR1_PZ", rotor_positions["8x4x3_propeller_ccw_2"][2]),
-        default_param("CA_ROTOR1_KM", 0.05),
+        default_param("CA_ROTOR1_KM", moment_constant),
         default_param("CA_ROTOR2_PX", rotor_positions["8x4x3_propeller_cw_1"][0]),
         default_param("CA_ROTOR2_PY", -rotor_positions["8x4x3_propeller_cw_1"][1]),
         default_param("CA_ROTOR2_PZ", rotor_positions["8x4x3_propeller_cw_1"][2]),
-        default_param("CA_ROTOR2_KM", -0.05),
+        default_param("CA_ROTOR2_KM", -moment_constant),
         default_param("CA_ROTOR3_PX", rotor_positions["8x4x3_propeller_cw_2"][0]),
         default_param("CA_ROTOR3_PY", -rotor_positions["8x4x3_propeller_cw_2"][1]),
         default_param("CA_ROTOR3_PZ", rotor_positions["8x4x3_propeller_cw_2"][2]),
-        default_param("CA_ROTOR3_KM", -0.05),
+        default_param("CA_ROTOR3_KM", -moment_constant),
         default_param("PWM_MAIN_FUNC1", 101),
         default_param("PWM_MAIN_FUNC2", 102),
         default_param("PWM_MAIN_FUNC3", 103),
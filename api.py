@@ -1,25 +1,191 @@
-import requests
+import json
+import os
+import re
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable
+
+from cache import ResponseCache, temporary_path
+from responses import ASSEMBLY, FEATURES, select
+from scheduler import RequestStats, TokenBucket, backoff, retry_after
+from tracing import count
+
+if TYPE_CHECKING:
+    import requests
 
 HEADERS = {'Accept': 'application/json;charset=UTF-8;qs=0.09', 'Content-Type': 'application/json'}
+RETRY_STATUS = {429, 500, 502, 503, 504}
+CHUNK_SIZE = 1 << 20
+
+class OfflineError(Exception):
+    pass
+
+def create_session(access_key: str, secret_key: str, pool_size: int) -> 'requests.Session':
+    # requests takes a while to import, so it only is once something will go over the network
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    session.auth = (access_key, secret_key)
+    # keep enough pooled connections around for concurrent fetches
+    session.mount('https://', HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size))
+    session.mount('http://', HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size))
+    return session
 
 class Client:
-    def __init__(self, base_url: str, access_key: str, secret_key: str):
-        self._session = requests.Session()
-        self._session.auth = (access_key, secret_key)
+    def __init__(self, base_url: str, access_key: str, secret_key: str, pool_size: int = 16, cache: ResponseCache | None = None, offline: bool = False, requests_per_second: float | None = None, max_retries: int = 5, bucket: TokenBucket | None = None):
+        # offline clients never send anything
+        self._session = create_session(access_key, secret_key, pool_size) if not offline else None
         self._base_url = base_url
+        self.cache = cache
+        self.offline = offline
+        self.stats = RequestStats()
+        # a bucket passed in is shared with other clients, e.g. in other processes of a batch import
+        self._bucket = bucket or TokenBucket(requests_per_second, burst=pool_size)
+        self._max_retries = max_retries
+
+    def _send(self, method: str, url: str, endpoint: str, throttle: bool = True, **kwargs) -> 'requests.Response':
+        import requests
+
+        for attempt in range(self._max_retries + 1):
+            start = time.perf_counter()
+            if throttle:
+                self._bucket.acquire()
+                count('rate limit wait ms', round((time.perf_counter() - start) * 1000))
+
+            start = time.perf_counter()
+            count('api requests')
+            try:
+                response = self._session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                self.stats.failure(endpoint)
+                if attempt == self._max_retries:
+                    raise
+                delay = backoff(attempt)
+            else:
+                self.stats.record(endpoint, time.perf_counter() - start)
+                if response.status_code not in RETRY_STATUS:
+                    return response
+
+                self.stats.failure(endpoint)
+                if attempt == self._max_retries:
+                    return response
+
+                # release the connection of a streamed response we are about to throw away
+                response.close()
+                delay = retry_after(response.headers.get('Retry-After'))
+                if delay is None:
+                    delay = backoff(attempt)
+                elif throttle:
+                    self._bucket.block(delay)
+
+            self.stats.retry(endpoint)
+            count('api retries')
+            time.sleep(delay)
+
+    def _api_request(self, method: str, path: str, params={}, body={}) -> 'requests.Response':
+        # group requests by route rather than by the ids in them
+        endpoint = re.sub(r'/(d|w|v|m|e|partid)/[^/]+', r'/\1/*', path)
+        return self._send(method, self._base_url + path, endpoint, params=params, headers=HEADERS, data=body, allow_redirects=False)
+
+    def _cached(self, key: tuple, fetch: Callable[[], bytes], immutable: bool = True) -> bytes:
+        # immutable responses (keyed by microversion) are always served from the cache when present,
+        # workspace responses can change at any time so they are only read back when offline
+        cache_key = ResponseCache.key(*key)
+        if self.cache is not None and (immutable or self.offline):
+            data = self.cache.get(cache_key)
+            if data is not None:
+                return data
+
+        if self.offline:
+            raise OfflineError(f'No cached response for {key[0]} {key[1:]}')
+
+        data = fetch()
+        if self.cache is not None:
+            self.cache.put(cache_key, data)
+
+        return data
+
+    def _cached_json(self, key: tuple, method: str, path: str, params={}, immutable: bool = True, spec: dict | None = None) -> dict:
+        # with a spec only the fields it selects are parsed out of the response, see responses.py
+        def fetch() -> bytes:
+            response = self._api_request(method, path, params=params)
+            # never let an error body into the cache
+            response.raise_for_status()
+            count('bytes downloaded', len(response.content))
+            return response.content
+
+        if spec is not None:
+            return select(self._cached(key, fetch, immutable).decode(), spec)
+
+        return json.loads(self._cached(key, fetch, immutable))
 
-    def _api_request(self, method: str, path: str, params={}, body={}) -> requests.Response:
-        return self._session.request(method, self._base_url + path, params=params, headers=HEADERS, data=body, allow_redirects=False)
-    
     def get_assembly(self, did: str, wid: str, eid: str) -> dict:
-        return self._api_request('get', f'/assemblies/d/{did}/w/{wid}/e/{eid}', params={'includeMateFeatures': 'true', 'includeNonSolids': 'true', 'includeMateConnectors': 'true'}).json()
-    
-    def get_assembly_features(self, did: str, wid: str, eid: str) -> dict:
-        return self._api_request('get', f'/assemblies/d/{did}/w/{wid}/e/{eid}/features').json()
-    
-    def get_parts_stl(self, did: str, mid: str, eid: str, pid: str) -> bytes:
-        redirect = self._api_request('get', f'/parts/d/{did}/m/{mid}/e/{eid}/partid/{pid}/stl', params={'mode': 'binary', 'units': 'meter'}).headers['Location']
-        return self._session.get(redirect).content
-    
+        # mates carry their own connector frames, so the mate connector features aren't needed
+        params = {'includeMateFeatures': 'true', 'includeNonSolids': 'true'}
+        return self._cached_json(('assembly', did, wid, eid, params), 'get', f'/assemblies/d/{did}/w/{wid}/e/{eid}', params, immutable=False, spec=ASSEMBLY)
+
+    def get_assembly_features(self, did: str, wid: str, eid: str, feature_ids: list[str] | None = None) -> dict:
+        # all of the assembly's features, or just these ones
+        params = {'featureId': feature_ids} if feature_ids is not None else {}
+        return self._cached_json(('features', did, wid, eid, params), 'get', f'/assemblies/d/{did}/w/{wid}/e/{eid}/features', params, immutable=False, spec=FEATURES)
+
+    def get_subassembly_features(self, did: str, mid: str, eid: str, configuration: str, feature_ids: list[str]) -> dict:
+        # a subassembly is referenced at a microversion, so its features never change. limits can differ between
+        # configurations, so configured instances get their own
+        params = {'featureId': feature_ids} | ({'configuration': configuration} if configuration != 'default' else {})
+        return self._cached_json(('features', did, mid, eid, params), 'get', f'/assemblies/d/{did}/m/{mid}/e/{eid}/features', params, spec=FEATURES)
+
+    def get_current_microversion(self, did: str, wid: str) -> str:
+        # never cached, this is how changes to the workspace are noticed
+        if self.offline:
+            raise OfflineError('The current microversion is never cached')
+
+        response = self._api_request('get', f'/documents/d/{did}/w/{wid}/currentmicroversion')
+        response.raise_for_status()
+        return response.json()['microversion']
+
+    def download_parts_stl(self, did: str, mid: str, eid: str, pid: str, path: Path, etag: str | None = None) -> str | None:
+        # streams the export to path without holding it in memory, returns its etag if the server sent one
+        params = {'mode': 'binary', 'units': 'meter'}
+        cache_key = ResponseCache.key('stl', did, mid, eid, pid, params)
+        # the etag is cached next to the mesh, the caller's may be for another microversion's export
+        etag_key = ResponseCache.key('stl etag', did, mid, eid, pid, params)
+        if self.cache is not None and self.cache.get_file(cache_key, path):
+            cached_etag = self.cache.get(etag_key)
+            return cached_etag.decode() if cached_etag is not None else None
+
+        if self.offline:
+            raise OfflineError(f'No cached response for stl {(did, mid, eid, pid, params)}')
+
+        response = self._api_request('get', f'/parts/d/{did}/m/{mid}/e/{eid}/partid/{pid}/stl', params=params)
+        response.raise_for_status()
+
+        # the export itself is served from elsewhere, so it doesn't count against the api budget
+        headers = {'If-None-Match': etag} if etag is not None else {}
+        with self._send('get', response.headers['Location'], 'stl download', throttle=False, headers=headers, stream=True) as download:
+            if download.status_code != 304:
+                download.raise_for_status()
+                etag = download.headers.get('ETag')
+
+                temporary = temporary_path(path)
+                try:
+                    with open(temporary, 'wb') as f:
+                        for chunk in download.iter_content(CHUNK_SIZE):
+                            f.write(chunk)
+                            count('bytes downloaded', len(chunk))
+                    os.replace(temporary, path)
+                finally:
+                    temporary.unlink(missing_ok=True)
+
+                # a 304 leaves nothing at path to cache
+                if self.cache is not None:
+                    self.cache.put_file(cache_key, path)
+                    if etag is not None:
+                        self.cache.put(etag_key, etag.encode())
+
+        return etag
+
     def get_mass_properties(self, did: str, mid: str, eid: str, pid: str) -> dict:
-        return self._api_request('get', f'/parts/d/{did}/m/{mid}/e/{eid}/partid/{pid}/massproperties', params={'useMassPropertyOverrides': 'true'}).json()
+        params = {'useMassPropertyOverrides': 'true'}
+        return self._cached_json(('massproperties', did, mid, eid, pid, params), 'get', f'/parts/d/{did}/m/{mid}/e/{eid}/partid/{pid}/massproperties', params)
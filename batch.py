@@ -0,0 +1,133 @@
+import io
+import json
+import os
+import sys
+import time
+import tomllib
+import traceback
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stderr, redirect_stdout
+from dataclasses import dataclass
+from pathlib import Path
+
+from main import create_parser, import_model
+from scheduler import TokenBucket
+
+# imports every model in a manifest, e.g.
+#
+#   models_path = "models"
+#   [defaults]                  # options for every model, named like main.py's without the dashes
+#   merge_meshes = true
+#   [[models]]
+#   name = "scale_tiltwing"
+#   document = "f1acb5938f411c5a47db608c"
+#   workspace = "d20d9753a184585e00e13e9f"
+#   element = "ed0471d8793e2cd4e920b1dd"
+#   density = ["*m3_screw*=7850"]
+#
+# each model is imported in its own process with its output in <model>/import.log, all of them drawing
+# from one rate limit and one response cache
+
+POSITIONAL = ('name', 'models_path', 'document', 'workspace', 'element')
+
+@dataclass
+class ModelResult:
+    name: str
+    seconds: float
+    error: str | None = None
+
+def load_manifest(path: Path) -> dict:
+    with open(path, 'rb') as f:
+        return tomllib.load(f) if path.suffix == '.toml' else json.load(f)
+
+def model_arguments(manifest: dict, model: dict) -> list[str]:
+    # main.py's arguments for a model, raises ValueError if it would refuse them
+    options = {**manifest.get('defaults', {}), **model}
+    options.setdefault('models_path', manifest.get('models_path', '.'))
+    missing = [name for name in POSITIONAL if name not in options]
+    if missing:
+        raise ValueError(f'missing {", ".join(missing)}')
+    # runs in parallel, so each model needs its own stored assembly
+    options.setdefault('stored_assembly', os.path.join(os.getcwd(), 'parts_mates', options['name']))
+
+    arguments = [str(options.pop(name)) for name in POSITIONAL]
+    for name, value in options.items():
+        flag = '--' + name.replace('_', '-')
+        for item in value if isinstance(value, list) else [value]:
+            if item is True:
+                arguments.append(flag)
+            elif item is not False and item is not None:
+                arguments.extend([flag, str(item)])
+
+    # checked here so a bad entry is reported before anything is imported, rather than exiting its worker
+    with redirect_stderr(io.StringIO()) as errors:
+        try:
+            create_parser().parse_args(arguments)
+        except SystemExit:
+            raise ValueError(errors.getvalue().strip().splitlines()[-1].split('error: ', 1)[-1]) from None
+
+    return arguments
+
+_bucket = None
+
+def start_worker(bucket: TokenBucket):
+    global _bucket
+    _bucket = bucket
+
+def run_model(arguments: list[str]) -> ModelResult:
+    args = create_parser().parse_args(arguments)
+    log_path = Path(args.models_path, args.name, 'import.log')
+    log_path.parent.mkdir(exist_ok=True, parents=True)
+
+    start = time.perf_counter()
+    with open(log_path, 'w') as log, redirect_stdout(log), redirect_stderr(log):
+        try:
+            import_model(args, _bucket)
+        except BaseException:
+            # one broken model shouldn't take the rest of the batch down with it
+            traceback.print_exc()
+            return ModelResult(args.name, time.perf_counter() - start, traceback.format_exc().strip().splitlines()[-1])
+
+    return ModelResult(args.name, time.perf_counter() - start)
+
+def main():
+    parser = ArgumentParser(description='Import every model in a manifest in parallel')
+    parser.add_argument('manifest', type=str, help='Manifest of models (.toml or .json)')
+    parser.add_argument('-p', '--processes', type=int, default=os.cpu_count(), help='Models imported at once')
+    parser.add_argument('-r', '--rate', type=float, default=10.0, help='Maximum api requests per second across all models')
+    args = parser.parse_args()
+
+    manifest = load_manifest(Path(args.manifest))
+    models, errors = [], []
+    for i, model in enumerate(manifest.get('models', [])):
+        try:
+            models.append(model_arguments(manifest, model))
+        except ValueError as error:
+            errors.append(f'model {model.get("name", i)}: {error}')
+    if errors:
+        parser.error(f'{args.manifest} has invalid models\n  ' + '\n  '.join(errors))
+    if not models:
+        parser.error(f'{args.manifest} has no models')
+    # rate limited responses block everyone, so the burst is shared too
+    bucket = TokenBucket(args.rate, burst=8, shared=True)
+
+    start = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=min(args.processes, len(models)), initializer=start_worker, initargs=(bucket,)) as executor:
+        futures = [executor.submit(run_model, arguments) for arguments in models]
+        for future in as_completed(futures):
+            result = future.result()
+            print(f'{result.name}: ' + (f'failed after {result.seconds:.1f} s: {result.error}' if result.error else f'done in {result.seconds:.1f} s'))
+            results.append(result)
+
+    print(f'\n{"model":<32} {"seconds":>8}  status')
+    for result in sorted(results, key=lambda result: result.name):
+        print(f'{result.name:<32} {result.seconds:>8.1f}  {"failed: " + result.error if result.error else "ok"}')
+    failed = sum(result.error is not None for result in results)
+    print(f'{len(results) - failed} of {len(results)} models imported in {time.perf_counter() - start:.1f} s')
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
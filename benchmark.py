@@ -0,0 +1,463 @@
+import copy
+import io
+import json
+import os
+import pickle
+import queue
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+import warnings
+from argparse import ArgumentParser
+from contextlib import contextmanager, redirect_stdout
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import numpy as np
+
+from mesh import export_meshes
+from mock_onshape import MockOnshape, instanced_assembly, random_rotation, synthetic_assembly, synthetic_features
+from model import SdfOptions, collect_part_groups, create_link_groups, create_sdf, model_elements, part_group_index, write_sdf
+from onshape import MassProperties, Mate, Part, apply_joint_limits, extract_mates, extract_parts, fetch_assembly, flatten_assembly
+from responses import ASSEMBLY, FEATURES, collection_paused, select
+from snapshot import Snapshot, save_snapshot
+from transforms import euler_xyz
+
+# synthetic assemblies for timing the pipeline stages without onshape
+
+SIZES = [1000, 2000, 5000, 10000]
+
+def synthetic_parts(count: int, seed: int = 0) -> dict[str, Part]:
+    rng = np.random.default_rng(seed)
+    parts = {}
+    for i in range(count):
+        transform = np.identity(4)
+        transform[:3, :3] = random_rotation(rng)
+        transform[:3, 3] = rng.uniform(-1, 1, 3)
+        inertia = np.diag(rng.uniform(1e-6, 1e-4, 3))
+        parts[f'I{i}'] = Part(f'part_{i}', transform, MassProperties(float(rng.uniform(0.001, 1)), rng.uniform(-0.01, 0.01, 3), inertia), ('d', 'm', 'e', f'P{i}'), f'{i:016x}.stl')
+
+    return parts
+
+def synthetic_mates(parts: dict[str, Part], count: int, revolute_ratio: float = 0.05, seed: int = 0) -> dict[str, Mate]:
+    rng = np.random.default_rng(seed)
+    ids = list(parts.keys())
+    mates = {}
+    for i in range(count):
+        # the first mates chain every part to an earlier one like a real assembly tree, the rest are redundant
+        child = i % len(ids)
+        parent = int(rng.integers(0, max(child, 1)))
+        kind = 'REVOLUTE' if rng.random() < revolute_ratio else 'FASTENED'
+        mates[f'M{i}'] = Mate(ids[parent], ids[child], kind, rng.uniform(-0.01, 0.01, 3), np.identity(3), {'lower': -7.0, 'upper': 7.0})
+
+    return mates
+
+def timed(function, *args, repeat: int = 3) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+def bench_grouping(sizes: list[int] = SIZES):
+    print(f'{"parts":>8} {"mates":>8} {"seconds":>10} {"us/mate":>10}')
+    for size in sizes:
+        parts = synthetic_parts(size)
+        mates = synthetic_mates(parts, 2 * size)
+        seconds = timed(lambda: part_group_index(collect_part_groups(parts, mates)))
+        print(f'{size:>8} {len(mates):>8} {seconds:>10.4f} {seconds / len(mates) * 1e6:>10.2f}')
+
+def per_part_mass_properties(grouped_parts: list[list[str]], parts: dict[str, Part]) -> list[MassProperties]:
+    # the one object at a time path the batched arrays replaced, kept as the reference
+    group_mass_props = []
+    for group in grouped_parts:
+        transformed = [parts[part].mass_props.apply_transform(parts[part].transform) for part in group]
+        mass = sum(mass_props.mass for mass_props in transformed)
+        com = sum(mass_props.com * mass_props.mass for mass_props in transformed) / mass
+        inertia = sum(mass_props.inertia_at_point(com) for mass_props in transformed)
+        group_mass_props.append(MassProperties(mass, com, inertia))
+
+    return group_mass_props
+
+def bench_mass(sizes: list[int] = SIZES):
+    print(f'{"parts":>8} {"groups":>8} {"per part":>10} {"batched":>10} {"speedup":>8} {"max error":>10}')
+    for size in sizes:
+        parts = synthetic_parts(size)
+        grouped_parts = collect_part_groups(parts, synthetic_mates(parts, size, revolute_ratio=0.2))
+        reference = per_part_mass_properties(grouped_parts, parts)
+        batched = [group.mass_props for group in create_link_groups(grouped_parts, parts)]
+        error = max(float(np.abs(a.inertia - b.inertia).max() / np.abs(a.inertia).max()) for a, b in zip(reference, batched))
+
+        per_part = timed(lambda: per_part_mass_properties(grouped_parts, parts))
+        seconds = timed(lambda: create_link_groups(grouped_parts, parts))
+        print(f'{size:>8} {len(grouped_parts):>8} {per_part:>10.4f} {seconds:>10.4f} {per_part / seconds:>7.1f}x {error:>10.1e}')
+
+def bench_sdf(sizes: list[int] = SIZES):
+    print(f'{"parts":>8} {"tree":>10} {"stream":>10} {"MB":>8} {"MB (6 digits)":>14} {"identical":>10}')
+    for size in sizes:
+        parts = synthetic_parts(size)
+        mates = synthetic_mates(parts, size, revolute_ratio=0.2)
+        with TemporaryDirectory() as directory, redirect_stdout(io.StringIO()):
+            tree_path, stream_path, rounded_path = Path(directory, 'tree.sdf'), Path(directory, 'stream.sdf'), Path(directory, 'rounded.sdf')
+            tree = timed(lambda: create_sdf('model', parts, mates).write(tree_path, pretty_print=True, xml_declaration=True, encoding='utf-8'), repeat=1)
+            stream = timed(lambda: write_sdf(stream_path, 'model', model_elements('model', parts, mates)), repeat=1)
+            write_sdf(rounded_path, 'model', model_elements('model', parts, mates, SdfOptions(precision=6)))
+            identical = tree_path.read_bytes() == stream_path.read_bytes()
+            sizes_mb = stream_path.stat().st_size / 1e6, rounded_path.stat().st_size / 1e6
+
+        print(f'{size:>8} {tree:>10.4f} {stream:>10.4f} {sizes_mb[0]:>8.2f} {sizes_mb[1]:>14.2f} {str(identical):>10}')
+
+def bench_snapshot(sizes: list[int] = SIZES):
+    print(f'{"parts":>8} {"pickle s":>10} {"snapshot s":>10} {"speedup":>8} {"pickle MB":>10} {"snapshot MB":>12}')
+    for size in sizes:
+        parts = synthetic_parts(size)
+        mates = synthetic_mates(parts, size)
+        with TemporaryDirectory() as directory:
+            pickle_path, snapshot_path = Path(directory, 'parts_mates.pickle'), Path(directory, 'snapshot.npz')
+            pickle_path.write_bytes(pickle.dumps((parts, mates), protocol=pickle.HIGHEST_PROTOCOL))
+            save_snapshot(snapshot_path, parts, mates)
+
+            def load_snapshot():
+                snapshot = Snapshot(snapshot_path)
+                return snapshot.parts, snapshot.mates
+
+            pickled = timed(lambda: pickle.loads(pickle_path.read_bytes()))
+            snapshot = timed(load_snapshot)
+            print(f'{size:>8} {pickled:>10.4f} {snapshot:>10.4f} {pickled / snapshot:>7.1f}x {pickle_path.stat().st_size / 1e6:>10.2f} {snapshot_path.stat().st_size / 1e6:>12.2f}')
+
+def bench_euler(sizes: list[int] = SIZES):
+    # parity with scipy, which euler_xyz replaced when writing poses, over random, axis aligned and gimbal locked rotations
+    from scipy.spatial.transform import Rotation
+
+    print(f'{"rotations":>10} {"scipy s":>10} {"numpy s":>10} {"speedup":>8} {"max error":>10}')
+    for size in sizes:
+        rng = np.random.default_rng(size)
+        angles = rng.uniform(-np.pi, np.pi, (size, 3))
+        # a quarter of them axis aligned and a quarter gimbal locked, both common in cad
+        angles[: size // 4] = np.round(angles[: size // 4] / (np.pi / 2)) * (np.pi / 2)
+        angles[size // 4 : size // 2, 1] = np.pi / 2 * rng.choice([-1, 1], size // 2 - size // 4)
+        rotations = Rotation.from_euler('xyz', angles).as_matrix()
+
+        with warnings.catch_warnings():
+            # scipy warns about every gimbal lock
+            warnings.simplefilter('ignore')
+            expected = Rotation.from_matrix(rotations).as_euler('xyz')
+            # one at a time, the way poses were written, extrapolated from the first thousand
+            scipy_seconds = timed(lambda: [Rotation.from_matrix(rotation).as_euler('xyz') for rotation in rotations[:1000]]) * size / min(size, 1000)
+
+        difference = np.abs(euler_xyz(rotations) - expected)
+        # the same angle either side of a half turn
+        error = float(np.minimum(difference, 2 * np.pi - difference).max())
+        numpy_seconds = timed(lambda: euler_xyz(rotations))
+        print(f'{size:>10} {scipy_seconds:>10.4f} {numpy_seconds:>10.4f} {scipy_seconds / numpy_seconds:>7.0f}x {error:>10.1e}')
+        if error > 1e-9:
+            sys.exit(f'euler_xyz differs from scipy by {error}')
+
+# importing main must not pull these in, they are only needed by some runs
+LAZY_IMPORTS = ('scipy', 'requests')
+
+def bench_startup(sizes: list[int] = SIZES):
+    # python -X importtime, best of five, for the modules main imports directly. the total is compared against the
+    # baseline like the pipeline stages, there is no size so it is recorded under 'import'
+    best = {}
+    for _ in range(5):
+        output = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import main'], capture_output=True, text=True, check=True, cwd=Path(__file__).parent).stderr
+        for line in output.splitlines()[1:]:
+            # nesting is two spaces of indent per level
+            _, cumulative, name = line.removeprefix('import time:').split('|')
+            best[name[1:]] = min(best.get(name[1:], float('inf')), int(cumulative))
+
+    direct = {name.strip(): microseconds for name, microseconds in best.items() if name.startswith('  ') and not name.startswith('   ')}
+    print(f'{"module":<24} {"ms":>8}')
+    for name, microseconds in sorted(direct.items(), key=lambda item: -item[1])[:8]:
+        print(f'{name:<24} {microseconds / 1e3:>8.1f}')
+    print(f'{"main":<24} {best["main"] / 1e3:>8.1f}')
+
+    if loaded := sorted({name.strip().split('.')[0] for name in best} & set(LAZY_IMPORTS)):
+        sys.exit(f'importing main loads {", ".join(loaded)}')
+
+    return {'python': sys.version.split()[0], 'runs': 5}, {'import': {'main': {'seconds': best['main'] / 1e6}}}
+
+def bench_watch(sizes: list[int] = SIZES):
+    # edit-to-sdf latency of the watcher against the stand-in server, from the edit (the microversion bump) until the
+    # model is written, which includes waiting for the next poll
+    from main import create_parser
+    from watch import watch
+
+    os.environ.setdefault('ONSHAPE_ACCESS_KEY', '')
+    os.environ.setdefault('ONSHAPE_SECRET_KEY', '')
+    interval = 0.05
+
+    def moved(assembly: dict):
+        assembly['occurrences'][0]['transform'][3] += 0.01
+
+    def redefined(assembly: dict):
+        assembly['instances'][0]['documentMicroversion'] = 'edited'
+
+    def unchanged(assembly: dict):
+        pass
+
+    print(f'{"parts":>8} {"first s":>8} {"move s":>8} {"redefine s":>10} {"unchanged s":>11}')
+    for size in sizes:
+        with TemporaryDirectory() as directory, MockOnshape() as mock:
+            mock.assembly = synthetic_assembly(size, max(1, size // 20), rotors=True)
+            args = create_parser().parse_args(['model', directory, 'd0', 'w0', 'e0', '--api-url', mock.base_url, '--cache', str(Path(directory, 'cache')), '--rate', '10000', '--stream-sdf'])
+            args.interval = interval
+            updates = queue.Queue()
+            stop = threading.Event()
+
+            def edit(change) -> float:
+                assembly = copy.deepcopy(mock.assembly)
+                change(assembly['rootAssembly'])
+                start = time.perf_counter()
+                mock.bump(assembly)
+                updates.get(timeout=120)
+                return time.perf_counter() - start
+
+            with redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                thread = threading.Thread(target=watch, args=(args, stop, updates.put), daemon=True)
+                thread.start()
+                updates.get(timeout=120)
+                first = time.perf_counter() - start
+                latencies = [edit(change) for change in (moved, redefined, unchanged)]
+                stop.set()
+                thread.join()
+
+        print(f'{size:>8} {first:>8.3f} {latencies[0]:>8.3f} {latencies[1]:>10.3f} {latencies[2]:>11.3f}')
+
+def bench_parsing(sizes: list[int] = SIZES):
+    # assembly and features responses as verbose as onshape's, parsed whole and with only the fields the import reads
+    def peak_mb(function, *args) -> float:
+        tracemalloc.start()
+        try:
+            function(*args)
+            return tracemalloc.get_traced_memory()[1] / 1e6
+        finally:
+            tracemalloc.stop()
+
+    def parse_whole(assembly: bytes, features: bytes) -> tuple[dict, dict]:
+        return json.loads(assembly), json.loads(features)
+
+    def parse_selected(assembly: bytes, features: bytes) -> tuple[dict, dict]:
+        # the way fetch_assembly decodes them
+        with collection_paused():
+            return select(assembly.decode(), ASSEMBLY), select(features.decode(), FEATURES)
+
+    print(f'{"parts":>8} {"MB":>8} {"whole s":>8} {"select s":>9} {"speedup":>8} {"whole MB":>9} {"select MB":>10} {"identical":>10}')
+    for size in sizes:
+        assembly = synthetic_assembly(size, max(1, size // 10), 0.2, 6, full=True)
+        responses = json.dumps(assembly).encode(), json.dumps(synthetic_features(assembly, full=True)).encode()
+        del assembly
+
+        whole = timed(parse_whole, *responses)
+        selected = timed(parse_selected, *responses)
+
+        results = []
+        for parse in (parse_whole, parse_selected):
+            assembly, features = parse(*responses)
+            parts = extract_parts(assembly, {data['id']: None for data in assembly['rootAssembly']['instances']}, {(data['documentId'], data['documentMicroversion'], data['elementId'], data['partId']): '' for data in assembly['rootAssembly']['instances']})
+            mates = extract_mates(assembly)
+            with redirect_stdout(io.StringIO()):
+                apply_joint_limits(mates, features)
+            results.append(([(part.identifier, part.transform.tolist(), part.definition) for part in parts.values()], [(mate.parent, mate.child, mate.kind, np.asarray(mate.origin).tolist(), mate.rotation.tolist(), mate.limits) for mate in mates.values()]))
+            del assembly, features
+
+        size_mb = sum(map(len, responses)) / 1e6
+        print(f'{size:>8} {size_mb:>8.1f} {whole:>8.3f} {selected:>9.3f} {whole / selected:>7.1f}x {peak_mb(parse_whole, *responses):>9.1f} {peak_mb(parse_selected, *responses):>10.1f} {str(results[0] == results[1]):>10}')
+
+def bench_nested(sizes: list[int] = SIZES):
+    # a subassembly of size / 100 parts instanced 10 times in one that is instanced 10 times. flattening should be
+    # linear in parts, and the api should see each part definition and subassembly joint once
+    from api import Client
+
+    print(f'{"parts":>8} {"flatten s":>10} {"fetch s":>8} {"mass props":>11} {"meshes":>7} {"features":>9}')
+    for size in sizes:
+        inner = synthetic_assembly(max(2, size // 100), 20, 0.2, 3)
+        assembly = instanced_assembly(instanced_assembly(inner, 10, 'e1'), 10, 'e2', seed=1)
+        flatten = timed(flatten_assembly, assembly)
+
+        with MockOnshape() as mock, TemporaryDirectory() as directory, redirect_stdout(io.StringIO()):
+            mock.assembly, mock.features = assembly, synthetic_features(assembly)
+            start = time.perf_counter()
+            fetch_assembly(Client(mock.base_url, '', ''), 'd0', 'w0', 'e0', Path(directory), 16)
+            fetch = time.perf_counter() - start
+
+        print(f'{size:>8} {flatten:>10.4f} {fetch:>8.2f} {mock.hits["massproperties"]:>11} {mock.hits["download"]:>7} {mock.hits["features"]:>9}')
+
+SWEEP_SIZES = [100, 1000]
+
+def bench_sweep(sizes: list[int] = SWEEP_SIZES):
+    # sweep variants of a model with rotors per minute, written across every core, and what each costs on disk
+    from gazebo import insert_gazebo_plugins
+    from main import write_tree
+    from sweep import BaseLinks, SweepOptions, sweep_variants, write_variants
+
+    spec = {'samples': 1000, 'parameters': {'mass_scale': {'uniform': [0.9, 1.1]}, 'com_offset': {'normal': [0, 0.002]}, 'rotor.motor_constant': {'uniform': [4.5e-06, 5.5e-06]}}}
+    variants = sweep_variants(spec)
+    print(f'{"parts":>8} {"links":>6} {"variants":>9} {"seconds":>8} {"per minute":>11} {"KB each":>8}')
+    for size in sizes:
+        rng = np.random.default_rng(0)
+        assembly = synthetic_assembly(size, max(1, size // 10), 0.2, 4, rotors=True)
+        instances = assembly['rootAssembly']['instances']
+        mass_props = {data['id']: MassProperties(float(rng.uniform(0.001, 1)), rng.uniform(-0.01, 0.01, 3), np.diag(rng.uniform(1e-6, 1e-4, 3))) for data in instances}
+        parts = extract_parts(assembly, mass_props, {(data['documentId'], data['documentMicroversion'], data['elementId'], data['partId']): f'{data["partId"]}.stl' for data in instances})
+
+        with TemporaryDirectory() as directory, redirect_stdout(io.StringIO()):
+            mates = extract_mates(assembly)
+            sdf = create_sdf('model', parts, mates)
+            insert_gazebo_plugins(sdf)
+            sdf_path = Path(directory, 'model', 'model.sdf')
+            sdf_path.parent.mkdir()
+            write_tree(sdf, sdf_path)
+
+            start = time.perf_counter()
+            names = write_variants(sdf_path, 'model', variants, BaseLinks.from_import(parts, mates), SweepOptions(Path(directory), None, None, None, None))
+            seconds = time.perf_counter() - start
+            kb = sum(path.stat().st_size for name in names for path in Path(directory, name).iterdir()) / len(names) / 1e3
+
+        print(f'{size:>8} {len(sdf.getroot()[0].findall("link")):>6} {len(variants):>9} {seconds:>8.2f} {len(variants) / seconds * 60:>11.0f} {kb:>8.1f}')
+
+# the pipeline benchmark's assembly and stand-in server, baselines are only compared when these match
+PIPELINE = {'definition_ratio': 0.1, 'revolute_ratio': 0.2, 'depth': 6, 'stl_triangles': 200, 'latency': 0.002, 'concurrency': 16}
+PIPELINE_SIZES = [10, 1000, 10000]
+STAGES = ('fetch', 'extract', 'grouping', 'link groups', 'sdf', 'export')
+
+def run_pipeline(mock: MockOnshape, directory: Path, stage):
+    # every stage from the api to exported meshes, each inside stage(name)
+    from api import Client
+
+    meshes_path = Path(directory, 'meshes')
+    meshes_path.mkdir()
+    client = Client(mock.base_url, '', '', pool_size=PIPELINE['concurrency'])
+
+    with stage('fetch'):
+        parts, mates = fetch_assembly(client, 'd0', 'w0', 'e0', meshes_path, PIPELINE['concurrency'])
+    with stage('extract'):
+        parts = extract_parts(mock.assembly, {id: part.mass_props for id, part in parts.items()}, {part.definition: part.mesh for part in parts.values()})
+        extract_mates(mock.assembly)
+    with stage('grouping'):
+        grouped_parts = collect_part_groups(parts, mates)
+    with stage('link groups'):
+        create_link_groups(grouped_parts, parts)
+    with stage('sdf'):
+        write_sdf(Path(directory, 'model.sdf'), 'model', model_elements('model', parts, mates))
+    with stage('export'):
+        export_meshes({part.mesh for part in parts.values()}, meshes_path, None, PIPELINE['concurrency'])
+
+def bench_pipeline(sizes: list[int] = PIPELINE_SIZES) -> tuple[dict, dict]:
+    # best of three timings per stage, then peak traced memory per stage in a separate run (tracing slows everything down)
+    results = {}
+    print(f'{"parts":>8} {"stage":<12} {"seconds":>10} {"peak MB":>10}')
+    for size in sizes:
+        seconds, peak_mb = {}, {}
+
+        @contextmanager
+        def timing(name: str):
+            start = time.perf_counter()
+            yield
+            seconds[name] = min(seconds.get(name, float('inf')), time.perf_counter() - start)
+
+        @contextmanager
+        def memory(name: str):
+            tracemalloc.start()
+            try:
+                yield
+            finally:
+                peak_mb[name] = tracemalloc.get_traced_memory()[1] / 1e6
+                tracemalloc.stop()
+
+        assembly = synthetic_assembly(size, max(1, int(size * PIPELINE['definition_ratio'])), PIPELINE['revolute_ratio'], PIPELINE['depth'])
+        with MockOnshape(PIPELINE['latency'], stl_triangles=PIPELINE['stl_triangles']) as mock, redirect_stdout(io.StringIO()):
+            mock.assembly, mock.features = assembly, synthetic_features(assembly)
+            for stage in (timing, timing, timing, memory):
+                # a fresh directory every run, so nothing is reused from the one before
+                with TemporaryDirectory() as directory:
+                    run_pipeline(mock, Path(directory), stage)
+
+        results[str(size)] = {name: {'seconds': seconds[name], 'peak_mb': peak_mb[name]} for name in STAGES}
+        for name in STAGES:
+            print(f'{size:>8} {name:<12} {seconds[name]:>10.4f} {peak_mb[name]:>10.2f}')
+
+    return PIPELINE, results
+
+def regressions(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    # anything more than tolerance slower or bigger than its baseline, ignoring differences below timer and allocator noise
+    found = []
+    for size, stages in results.items():
+        for name, measured in stages.items():
+            recorded = baseline.get(size, {}).get(name)
+            if recorded is None:
+                continue
+            for key, noise in (('seconds', 0.005), ('peak_mb', 1.0)):
+                # startup has no peak memory
+                if key in measured and measured[key] > recorded[key] * (1 + tolerance) + noise:
+                    found.append(f'{size if size == "import" else f"{size} parts"}, {name}: {key} {measured[key]:.4g}, baseline {recorded[key]:.4g}')
+
+    return found
+
+BENCHMARKS = {
+    'grouping': bench_grouping,
+    'mass': bench_mass,
+    'sdf': bench_sdf,
+    'snapshot': bench_snapshot,
+    'euler': bench_euler,
+    'startup': bench_startup,
+    'watch': bench_watch,
+    'parsing': bench_parsing,
+    'nested': bench_nested,
+    'sweep': bench_sweep,
+    'pipeline': bench_pipeline,
+}
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Benchmark pipeline stages on synthetic assemblies')
+    parser.add_argument('benchmarks', nargs='*', default=list(BENCHMARKS), help=f'Benchmarks to run: {", ".join(BENCHMARKS)} (default all)')
+    parser.add_argument('-s', '--sizes', type=int, nargs='+', default=None, help=f'Part counts (default {" ".join(map(str, SIZES))}, {" ".join(map(str, PIPELINE_SIZES))} for pipeline, {" ".join(map(str, SWEEP_SIZES))} for sweep)')
+    parser.add_argument('--baseline', type=str, default=str(Path(__file__).with_name('benchmark_baseline.json')), help='Recorded results that benchmarks with baselines are compared against, recorded by the first run on each machine')
+    parser.add_argument('--record', action='store_true', help='Record these results as the new baseline instead of comparing')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='Fail when a stage is more than this fraction slower or bigger than its baseline')
+    args = parser.parse_args()
+    if unknown := set(args.benchmarks) - set(BENCHMARKS):
+        parser.error(f'unknown benchmarks: {", ".join(sorted(unknown))}')
+
+    baseline_path = Path(args.baseline)
+    baseline = json.loads(baseline_path.read_text()) if baseline_path.exists() else {}
+    failures = []
+    recorded_names = []
+    for name in args.benchmarks:
+        print(f'# {name}')
+        measured = BENCHMARKS[name](args.sizes) if args.sizes else BENCHMARKS[name]()
+        if measured is None:
+            continue
+
+        settings, results = measured
+        # timings only compare on the machine they were taken on, so the baseline is never shared
+        if args.record or name not in baseline:
+            if not args.record:
+                print(f'No {name} baseline yet, this run is recorded as the baseline')
+            recorded = baseline.get(name, {}).get('results', {}) if baseline.get(name, {}).get('settings') == settings else {}
+            baseline[name] = {'settings': settings, 'results': recorded | results}
+            recorded_names.append(name)
+        elif baseline[name]['settings'] != settings:
+            print(f'The {name} baseline was recorded with different settings, record a new one with --record')
+        else:
+            found = regressions(results, baseline[name]['results'], args.tolerance)
+            print('\n'.join(f'REGRESSION {line}' for line in found) or f'Within {args.tolerance:.0%} of the baseline')
+            failures += found
+            # sizes run for the first time are recorded too
+            new = {size: stages for size, stages in results.items() if size not in baseline[name]['results']}
+            if new:
+                print(f'No baseline yet at {", ".join(new)} parts, this run is recorded as it')
+                baseline[name]['results'] |= new
+                recorded_names.append(name)
+
+    if recorded_names:
+        baseline_path.write_text(json.dumps(baseline, indent=2) + '\n')
+        print(f'Recorded {", ".join(recorded_names)} in {baseline_path}')
+
+    sys.exit(1 if failures else 0)
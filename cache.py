@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+
+from tracing import count
+
+# anything fetched for a given microversion never changes, so responses can be stored by the request that produced them
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    stored_bytes: int = 0
+
+    def __str__(self) -> str:
+        lookups = self.hits + self.misses
+        rate = self.hits / lookups if lookups else 0.0
+        return f'{self.hits} hits, {self.misses} misses ({rate:.0%} hit rate), {self.evictions} evictions, {self.stored_bytes / 1e6:.1f} MB stored'
+
+class ResponseCache:
+    def __init__(self, path: Path, max_bytes: int = 1 << 30):
+        self._path = Path(path)
+        self._path.mkdir(exist_ok=True, parents=True)
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.stats = CacheStats()
+        self._scan()
+
+    @staticmethod
+    def key(*parts) -> str:
+        return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+    def get(self, key: str) -> bytes | None:
+        entry = self._lookup(key)
+        if entry is None:
+            return None
+
+        try:
+            return entry.read_bytes()
+        except FileNotFoundError:
+            # evicted by another thread in the meantime
+            return None
+
+    def get_file(self, key: str, destination: Path) -> bool:
+        entry = self._lookup(key)
+        if entry is None:
+            return False
+
+        try:
+            atomic_copy(entry, destination)
+        except FileNotFoundError:
+            return False
+
+        return True
+
+    def put(self, key: str, data: bytes):
+        entry = self._entry(key)
+        temporary = temporary_path(entry)
+        temporary.write_bytes(data)
+        os.replace(temporary, entry)
+        self._stored(key, len(data))
+
+    def put_file(self, key: str, source: Path):
+        atomic_copy(source, self._entry(key))
+        self._stored(key, source.stat().st_size)
+
+    def _lookup(self, key: str) -> Path | None:
+        with self._lock:
+            if key not in self._sizes:
+                # other processes sharing the directory may have stored it since we listed it
+                try:
+                    self._sizes[key] = self._entry(key).stat().st_size
+                    self.stats.stored_bytes += self._sizes[key]
+                except FileNotFoundError:
+                    self.stats.misses += 1
+                    count('cache misses')
+                    return None
+
+            # move to the back of the lru order, and persist that order across runs
+            self._sizes[key] = self._sizes.pop(key)
+            entry = self._entry(key)
+            try:
+                os.utime(entry)
+            except FileNotFoundError:
+                # evicted by another process
+                self.stats.stored_bytes -= self._sizes.pop(key)
+                self.stats.misses += 1
+                count('cache misses')
+                return None
+
+            self.stats.hits += 1
+            count('cache hits')
+
+        return entry
+
+    def _scan(self):
+        # oldest access first, so eviction can pop from the front
+        entries = []
+        for entry in self._path.glob('*.bin'):
+            try:
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.stem, stat.st_size))
+            except FileNotFoundError:
+                # evicted by another process
+                pass
+
+        self._sizes = {key: size for _, key, size in sorted(entries)}
+        self.stats.stored_bytes = sum(self._sizes.values())
+        self._unscanned = 0
+
+    def _stored(self, key: str, size: int):
+        with self._lock:
+            self.stats.stored_bytes += size - self._sizes.pop(key, 0)
+            self._sizes[key] = size
+            # processes sharing the directory (a batch import) don't see each other's entries, so the sizes are
+            # read back from disk every sixteenth of the budget written, and together they stay close to it
+            self._unscanned += size
+            if self._unscanned > self._max_bytes // 16:
+                self._scan()
+            self._evict()
+
+    def _evict(self):
+        while self.stats.stored_bytes > self._max_bytes and len(self._sizes) > 1:
+            key = next(iter(self._sizes))
+            self.stats.stored_bytes -= self._sizes.pop(key)
+            self.stats.evictions += 1
+            self._entry(key).unlink(missing_ok=True)
+
+    def _entry(self, key: str) -> Path:
+        return Path(self._path, key).with_suffix('.bin')
+
+def temporary_path(path: Path) -> Path:
+    # unique per thread, and in the same directory so the final rename is atomic
+    return path.with_name(f'.{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+
+def atomic_copy(source: Path, destination: Path):
+    temporary = temporary_path(destination)
+    shutil.copyfile(source, temporary)
+    os.replace(temporary, destination)
@@ -0,0 +1,123 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from fnmatch import fnmatch
+from pathlib import Path
+
+import numpy as np
+
+from cache import temporary_path
+from mesh import read_stl, weld, write_stl
+from onshape import Part
+
+# the cheapest collider that stays within a volume error of the part: sphere, cylinder, box, then convex hull
+
+@dataclass
+class CollisionShape:
+    kind: str
+    # box: full extents, cylinder: radius and length (along z), sphere: radius, hull: unused
+    size: list[float]
+    # pose of the shape in the part's mesh frame
+    transform: list[list[float]]
+    # hull mesh relative to the meshes directory
+    mesh: str | None = None
+    volume_error: float = 0.0
+
+def mesh_volume(triangles: np.ndarray) -> float:
+    triangles = triangles.astype(np.float64)
+    return float(abs(np.einsum('ij,ij->i', triangles[:, 0], np.cross(triangles[:, 1], triangles[:, 2])).sum()) / 6)
+
+def principal_frame(points: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # oriented bounding box along the principal axes of the points, returns rotation, center and extents
+    mean = points.mean(axis=0)
+    _, axes = np.linalg.eigh(np.cov((points - mean).T))
+    if np.linalg.det(axes) < 0:
+        axes[:, 0] = -axes[:, 0]
+
+    local = (points - mean) @ axes
+    low, high = local.min(axis=0), local.max(axis=0)
+    return axes, mean + axes @ ((low + high) / 2), high - low
+
+def pose(rotation: np.ndarray, translation: np.ndarray) -> list[list[float]]:
+    transform = np.identity(4)
+    transform[:3, :3] = rotation
+    transform[:3, 3] = translation
+    return transform.tolist()
+
+def fit_collision(triangles: np.ndarray, max_volume_error: float, hull_path: Path) -> CollisionShape | None:
+    # scipy is slow to import and only needed here
+    from scipy.spatial import ConvexHull, QhullError
+
+    vertices, _ = weld(triangles)
+    try:
+        hull = ConvexHull(vertices.astype(np.float64))
+    except QhullError:
+        # a flat part (a plate or decal) has no hull and no volume to fit, it keeps its mesh
+        return None
+    points = hull.points[hull.vertices]
+    volume = max(mesh_volume(triangles), 1e-12)
+
+    rotation, center, extents = principal_frame(points)
+    local = (points - center) @ rotation
+
+    radius = float(np.linalg.norm(local, axis=1).max())
+    sphere = (4 / 3 * np.pi * radius ** 3, 'sphere', [radius], rotation)
+
+    cylinders = []
+    # sdf cylinders run along z, so cycle the chosen principal axis last
+    for order in ([1, 2, 0], [2, 0, 1], [0, 1, 2]):
+        radius = float(np.linalg.norm(local[:, order[:2]], axis=1).max())
+        length = float(extents[order[2]])
+        cylinders.append((np.pi * radius ** 2 * length, 'cylinder', [radius, length], rotation[:, order]))
+    cylinder = min(cylinders, key=lambda candidate: candidate[0])
+
+    box = (float(np.prod(extents)), 'box', extents.tolist(), rotation)
+
+    for shape_volume, kind, size, shape_rotation in (sphere, cylinder, box):
+        error = shape_volume / volume - 1
+        if error <= max_volume_error:
+            return CollisionShape(kind, size, pose(shape_rotation, center), volume_error=float(error))
+
+    error = hull.volume / volume - 1
+    if error <= max_volume_error:
+        faces = hull.simplices.copy()
+        # qhull doesn't orient its facets, flip the ones facing inwards
+        inward = np.einsum('ij,ij->i', hull.equations[:, :3], np.cross(hull.points[faces[:, 1]] - hull.points[faces[:, 0]], hull.points[faces[:, 2]] - hull.points[faces[:, 0]])) < 0
+        faces[inward] = faces[inward][:, ::-1]
+        write_stl(hull_path, hull.points[faces].astype(np.float32))
+        return CollisionShape('hull', [], pose(np.identity(3), np.zeros(3)), hull_path.name, float(error))
+
+    return None
+
+def fit_collision_shapes(parts: dict[str, Part], meshes_path: Path, patterns: list[str], max_volume_error: float, max_workers: int = 8) -> dict[str, CollisionShape]:
+    # returns a fitted shape for every part whose identifier matches one of the patterns and has an adequate fit,
+    # fits are made once per mesh and stored next to the collision meshes so reruns are free
+    collision_path = Path(meshes_path, 'collision')
+    collision_path.mkdir(exist_ok=True)
+    selected = {id: part for id, part in parts.items() if any(fnmatch(part.identifier, pattern) for pattern in patterns)}
+    meshes = sorted({part.mesh for part in selected.values()})
+
+    def fit(mesh: str) -> CollisionShape | None:
+        stem = f'{Path(mesh).stem}_p{max_volume_error:g}'
+        fit_path = Path(collision_path, f'{stem}.json')
+        if fit_path.exists():
+            data = json.loads(fit_path.read_text())
+            return CollisionShape(**data) if data is not None else None
+
+        shape = fit_collision(read_stl(Path(meshes_path, mesh)), max_volume_error, Path(collision_path, f'{stem}_hull.stl'))
+        if shape is not None and shape.mesh is not None:
+            shape.mesh = f'collision/{shape.mesh}'
+
+        temporary = temporary_path(fit_path)
+        temporary.write_text(json.dumps(asdict(shape) if shape is not None else None))
+        os.replace(temporary, fit_path)
+        return shape
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        shapes = dict(zip(meshes, executor.map(fit, meshes)))
+
+    for mesh, shape in shapes.items():
+        print(f'Collision shape {mesh}: ' + (f'{shape.kind} ({shape.volume_error:+.0%} volume)' if shape is not None else 'no adequate fit, keeping mesh'))
+
+    return {id: shapes[part.mesh] for id, part in selected.items() if shapes[part.mesh] is not None}
@@ -1,19 +1,18 @@
-import numpy as np
-from scipy.spatial.transform import Rotation
 from dataclasses import dataclass
-from pathlib import Path
 from lxml import etree
 
-def insert_gazebo_plugins(sdf: etree._ElementTree):
+from tracing import span
+
+def insert_gazebo_plugins(sdf: etree._ElementTree, rotor: 'RotorParameters | None' = None, channel: 'ChannelParameters | None' = None):
     print('Inserting Gazebo plugins')
 
-    # insert_rotor_plugins(sdf, RotorParameters(time_constant_up=0.1, time_constant_down=0.2, max_rot_velocity=1100, motor_constant=9.0e-06, moment_constant=0.08, rotor_drag_coefficient=0.000175, rolling_moment_coefficient=0.8e-06, rotor_velocity_slowdown_sim=10))
-    insert_rotor_plugins(sdf, RotorParameters(time_constant_up=0.1, time_constant_down=0.2, max_rot_velocity=600, motor_constant=5.0e-06, moment_constant=0.06, rotor_drag_coefficient=0.000175, rolling_moment_coefficient=0.8e-06, rotor_velocity_slowdown_sim=50))
-    # include_sensor(sdf, 'model://gps')
-    insert_imu_plugin(sdf)
-    insert_barometer_plugin(sdf)
-    insert_magnetometer_plugin(sdf)
-    insert_mavlink_plugin(sdf, ChannelParameters(input_offset=0, input_scaling=1000, zero_position_disarmed=0, zero_position_armed=100))
+    with span('gazebo plugins'):
+        insert_rotor_plugins(sdf, rotor or ROTOR)
+        # include_sensor(sdf, 'model://gps')
+        insert_imu_plugin(sdf)
+        insert_barometer_plugin(sdf)
+        insert_magnetometer_plugin(sdf)
+        insert_mavlink_plugin(sdf, channel or CHANNEL)
 
 def create_gazebo_config(name: str) -> etree._ElementTree:
     model = etree.Element('model')
@@ -35,6 +34,9 @@ class RotorParameters:
     rolling_moment_coefficient: float
     rotor_velocity_slowdown_sim: int
 
+# ROTOR = RotorParameters(time_constant_up=0.1, time_constant_down=0.2, max_rot_velocity=1100, motor_constant=9.0e-06, moment_constant=0.08, rotor_drag_coefficient=0.000175, rolling_moment_coefficient=0.8e-06, rotor_velocity_slowdown_sim=10)
+ROTOR = RotorParameters(time_constant_up=0.1, time_constant_down=0.2, max_rot_velocity=600, motor_constant=5.0e-06, moment_constant=0.06, rotor_drag_coefficient=0.000175, rolling_moment_coefficient=0.8e-06, rotor_velocity_slowdown_sim=50)
+
 def insert_rotor_plugins(tree: etree._ElementTree, parameters: RotorParameters):
     model = tree.getroot()[0]
     base_link = next(link.attrib['name'] for link in model.findall('link'))
@@ -144,6 +146,8 @@ class ChannelParameters:
     zero_position_disarmed: float
     zero_position_armed: float
 
+CHANNEL = ChannelParameters(input_offset=0, input_scaling=1000, zero_position_disarmed=0, zero_position_armed=100)
+
 def insert_mavlink_plugin(tree: etree._ElementTree, parameters: ChannelParameters):
     model = tree.getroot()[0]
 
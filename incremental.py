@@ -0,0 +1,90 @@
+import json
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+
+from cache import temporary_path
+from onshape import MassProperties, Mate, Part
+
+# what the previous import of a model produced, so the next one only has to redo what changed
+
+STATE_VERSION = 2
+
+@dataclass
+class ImportState:
+    parts: dict[str, dict]
+    mates: dict[str, dict]
+    groups: dict[str, dict]
+
+    @classmethod
+    def from_import(cls, parts: dict[str, Part], mates: dict[str, Mate], group_cache: dict[str, MassProperties]) -> 'ImportState':
+        return cls(
+            {id: {'identifier': part.identifier, 'definition': list(part.definition), 'transform': part.transform.flatten().tolist(), 'mass_props': part.mass_props.to_data(), 'mass_source': part.mass_source} for id, part in parts.items()},
+            {id: mate_data(mate) for id, mate in mates.items()},
+            {signature: mass_props.to_data() for signature, mass_props in group_cache.items()},
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> 'ImportState | None':
+        if not path.exists():
+            return None
+
+        data = json.loads(path.read_text())
+        if data.get('version') != STATE_VERSION:
+            print(f'Ignoring import state with version {data.get("version")}, expected {STATE_VERSION}')
+            return None
+
+        return cls(data['parts'], data['mates'], data['groups'])
+
+    def save(self, path: Path):
+        temporary = temporary_path(path)
+        temporary.write_text(json.dumps({'version': STATE_VERSION, 'parts': self.parts, 'mates': self.mates, 'groups': self.groups}))
+        os.replace(temporary, path)
+
+    def known_mass_props(self) -> dict[tuple[str, str, str, str], MassProperties]:
+        # only what the api returned, mass properties computed from meshes depend on the densities of that import
+        return {tuple(part['definition']): MassProperties.from_data(part['mass_props']) for part in self.parts.values() if part['mass_source'] == 'api'}
+
+    def group_cache(self) -> dict[str, MassProperties]:
+        return {signature: MassProperties.from_data(data) for signature, data in self.groups.items()}
+
+def mate_data(mate: Mate) -> dict:
+    return {'parent': mate.parent, 'child': mate.child, 'kind': mate.kind, 'origin': np.asarray(mate.origin, dtype=float).tolist(), 'rotation': np.asarray(mate.rotation, dtype=float).tolist(), 'limits': mate.limits}
+
+@dataclass
+class AssemblyDiff:
+    added: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+    redefined: list[str] = field(default_factory=list)
+    moved: list[str] = field(default_factory=list)
+    unchanged: list[str] = field(default_factory=list)
+    mates_changed: list[str] = field(default_factory=list)
+
+    def __str__(self) -> str:
+        lines = [f'{len(self.unchanged)} parts unchanged, {len(self.added)} added, {len(self.removed)} removed, {len(self.redefined)} redefined, {len(self.moved)} moved, {len(self.mates_changed)} mates changed']
+        for label, identifiers in (('Added', self.added), ('Removed', self.removed), ('Redefined', self.redefined), ('Moved', self.moved), ('Mates changed', self.mates_changed)):
+            if identifiers:
+                lines.append(f'  {label}: {", ".join(identifiers)}')
+
+        return '\n'.join(lines)
+
+def diff_import(previous: ImportState, current: ImportState) -> AssemblyDiff:
+    diff = AssemblyDiff()
+
+    for id, part in current.parts.items():
+        before = previous.parts.get(id)
+        if before is None:
+            diff.added.append(part['identifier'])
+        elif before['definition'] != part['definition']:
+            diff.redefined.append(part['identifier'])
+        elif before['transform'] != part['transform']:
+            diff.moved.append(part['identifier'])
+        else:
+            diff.unchanged.append(part['identifier'])
+
+    diff.removed = [part['identifier'] for id, part in previous.parts.items() if id not in current.parts]
+    diff.mates_changed = [id for id in sorted(previous.mates.keys() | current.mates.keys()) if previous.mates.get(id) != current.mates.get(id)]
+
+    return diff
@@ -0,0 +1,81 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from onshape import MassProperties, MassPropertiesArray
+
+# physics engines step stably with valid, not too small inertias and no extreme mass ratios across joints,
+# so link inertias are conditioned before they are written out
+
+@dataclass
+class InertiaChange:
+    link: str
+    mass: tuple[float, float]
+    moments: tuple[np.ndarray, np.ndarray]
+    reasons: list[str]
+
+    def __str__(self) -> str:
+        before, after = self.moments
+        mass = f', mass {self.mass[0]:.4g} -> {self.mass[1]:.4g} kg' if self.mass[0] != self.mass[1] else ''
+        return f'{self.link}: principal moments [{" ".join(f"{moment:.3g}" for moment in before)}] -> [{" ".join(f"{moment:.3g}" for moment in after)}] kg m^2{mass} ({", ".join(self.reasons)})'
+
+def limit_mass_ratios(mass: np.ndarray, joints: list[tuple[int, int]], max_mass_ratio: float) -> np.ndarray:
+    # raises the lighter link of every joint to within max_mass_ratio of the heavier one, links only ever get heavier
+    # so this settles within one pass per link
+    mass = mass.copy()
+    for _ in range(len(mass)):
+        changed = False
+        for parent, child in joints:
+            light, heavy = (parent, child) if mass[parent] < mass[child] else (child, parent)
+            if mass[heavy] > mass[light] * max_mass_ratio * (1 + 1e-9):
+                mass[light] = mass[heavy] / max_mass_ratio
+                changed = True
+        if not changed:
+            break
+
+    return mass
+
+def condition_inertias(mass_props: list[MassProperties], names: list[str], joints: list[tuple[int, int]], min_moment: float | None = None, max_mass_ratio: float | None = None) -> tuple[list[MassProperties], list[InertiaChange]]:
+    # joints are (parent, child) indices into mass_props. tensors that need nothing are returned as they are,
+    # the rest are rebuilt from their principal axes with:
+    # - inertias scaled with any mass added to meet max_mass_ratio, keeping the radii of gyration
+    # - negative principal moments (from rounding, or bad mass properties) raised to zero, then to min_moment
+    # - the largest principal moment no more than the sum of the others (the triangle inequality of real bodies)
+    if not mass_props:
+        return [], []
+
+    batch = MassPropertiesArray.stack(mass_props)
+    mass = limit_mass_ratios(batch.mass, joints, max_mass_ratio) if max_mass_ratio is not None else batch.mass
+    scale = np.divide(mass, batch.mass, out=np.ones_like(mass), where=batch.mass > 0)
+
+    moments, axes = np.linalg.eigh((batch.inertia + batch.inertia.transpose(0, 2, 1)) / 2)
+    original = moments.copy()
+    moments = moments * scale[:, None]
+
+    negative = (moments < 0).any(axis=1)
+    moments = np.maximum(moments, 0)
+
+    small = np.zeros(len(moments), dtype=bool)
+    if min_moment is not None:
+        small = (moments < min_moment).any(axis=1)
+        moments = np.maximum(moments, min_moment)
+
+    # eigh sorts ascending, so the last moment is the largest, share the shortfall between the other two
+    shortfall = np.maximum(moments[:, 2] - moments[:, 0] - moments[:, 1], 0)
+    triangle = shortfall > 1e-12 * moments[:, 2]
+    moments[triangle, :2] += shortfall[triangle, None] / 2
+
+    rebuilt = np.einsum('nij,nj,nkj->nik', axes, moments, axes)
+
+    conditioned = []
+    changes = []
+    for i, props in enumerate(mass_props):
+        reasons = [reason for reason, flagged in (('mass ratio', scale[i] != 1), ('negative moment', negative[i]), ('below minimum', small[i]), ('triangle inequality', triangle[i])) if flagged]
+        if not reasons:
+            conditioned.append(props)
+            continue
+
+        conditioned.append(MassProperties(float(mass[i]), props.com, rebuilt[i]))
+        changes.append(InertiaChange(names[i], (float(props.mass), float(mass[i])), (original[i], moments[i]), reasons))
+
+    return conditioned, changes
@@ -1,17 +1,32 @@
-from argparse import ArgumentParser
+from argparse import ArgumentParser, Namespace
 from pathlib import Path
-import numpy as np
+from typing import TYPE_CHECKING
 import os
-from airframe import create_airframe_config
-import pickle
-import pprint as pp
 
-from api import Client
-from gazebo import create_gazebo_config, insert_gazebo_plugins
-from onshape import fetch_assembly
-from model import create_sdf
+from lxml import etree
 
-def main():
+from cache import ResponseCache, temporary_path
+from scheduler import TokenBucket
+from snapshot import Snapshot, save_snapshot
+from incremental import ImportState, diff_import
+from gazebo import create_gazebo_config, insert_gazebo_plugins
+from onshape import MassProperties, Mate, Part, check_mass_properties, fetch_assembly
+from model import SdfOptions, create_sdf, mesh_uris, model_elements, replace_mesh_uris, write_sdf
+from mesh import export_meshes, simplify_collision_meshes
+from collision import fit_collision_shapes
+from tracing import span, start_trace, stop_trace
+
+if TYPE_CHECKING:
+    from api import Client
+
+def exported_elements(elements, name: str, meshes_path: Path, precision: int | None, max_workers: int):
+    # a streamed sdf is never whole, so each element's meshes are exported just before it is written
+    for element in elements:
+        with span('export meshes'):
+            replace_mesh_uris(element, name, export_meshes(mesh_uris(element, name), meshes_path, precision, max_workers))
+        yield element
+
+def create_parser() -> ArgumentParser:
     parser = ArgumentParser(description='Onshape To Gazebo SDF Importing Tool')
     parser.add_argument('name', type=str, help='Model name')
     parser.add_argument('models_path', type=str, help='Models directory')
@@ -19,46 +34,161 @@ def main():
     parser.add_argument('workspace', type=str, help='Onshape workspace id')
     parser.add_argument('element', type=str, help='Onshape element id')
     parser.add_argument('-t', '--testing', action='store_true', help='Used previously fetched assembly, prevents unnecessary api calls')
-    args = parser.parse_args()
-
+    parser.add_argument('--stored-assembly', type=str, default=os.path.join(os.getcwd(), 'parts_mates'), help='Where the fetched assembly snapshot is stored for --testing')
+    parser.add_argument('-j', '--concurrency', type=int, default=8, help='Maximum number of concurrent api requests')
+    parser.add_argument('-r', '--rate', type=float, default=10.0, help='Maximum api requests per second')
+    parser.add_argument('--cache', type=str, default=os.path.join(os.getcwd(), 'cache'), help='Response cache directory')
+    parser.add_argument('--cache-size', type=int, default=1024, help='Maximum response cache size (MB)')
+    parser.add_argument('-i', '--incremental', action='store_true', help='Reuse mass properties and link groups from the previous import of this model')
+    parser.add_argument('--collision-triangles', type=int, default=None, help='Simplify collision meshes to at most this many triangles')
+    parser.add_argument('--collision-tolerance', type=float, default=None, help='Simplify collision meshes, moving no vertex further than this (meters)')
+    parser.add_argument('--collision-primitives', type=str, action='append', default=[], help='Replace the collision mesh of parts matching this identifier pattern with a fitted box, cylinder, sphere or convex hull (repeatable)')
+    parser.add_argument('--primitive-tolerance', type=float, default=0.25, help='Maximum relative volume error of a fitted collision shape')
+    parser.add_argument('--merge-meshes', action='store_true', help='Bake each link group into a single visual and collision mesh')
+    parser.add_argument('--export-obj', action='store_true', help='Write every referenced mesh as an indexed obj with welded vertices and reference that instead')
+    parser.add_argument('--mesh-precision', type=int, default=None, help='Round exported mesh vertices to this many decimals (meters)')
+    parser.add_argument('--density', type=str, action='append', default=[], help='Compute mass properties locally from the mesh for parts matching PATTERN=KG_PER_M3 instead of fetching them (repeatable)')
+    parser.add_argument('--check-mass-properties', action='store_true', help='Compare fetched mass properties with ones computed from the meshes')
+    parser.add_argument('--stream-sdf', action='store_true', help='Write the SDF one link and joint at a time instead of building the whole tree in memory')
+    parser.add_argument('--sdf-precision', type=int, default=None, help='Write SDF numbers with this many significant digits instead of full precision')
+    parser.add_argument('--min-inertia', type=float, default=None, help='Raise every link principal moment of inertia to at least this (kg m^2), e.g. 1e-6')
+    parser.add_argument('--max-mass-ratio', type=float, default=None, help='Add mass (and inertia) to the lighter link of any joint heavier than this ratio')
+    parser.add_argument('--api-url', type=str, default='https://cad.onshape.com/api/v6', help='Onshape api base url')
+    parser.add_argument('--trace', type=str, nargs='?', const='', default=None, help='Time every stage and count api requests, cache hits, parts and joints, writing a chrome trace (default <model>/trace.json) and printing a summary')
+    parser.add_argument('--profile', type=str, default=None, metavar='STAGE', help='Run every span named STAGE (e.g. fetch, sdf, "link groups") under cProfile, implies --trace')
+    parser.add_argument('--profile-memory', type=str, default=None, metavar='STAGE', help='Trace allocations in every span named STAGE with tracemalloc, implies --trace')
+    parser.add_argument('--offline', action='store_true', help='Only use cached responses, fails if anything is missing')
+    return parser
+
+def create_client(args: Namespace, bucket: TokenBucket | None = None) -> 'Client':
+    # bucket replaces the client's own rate limit, so several imports can share one budget
+    from api import Client
+
+    cache = ResponseCache(Path(args.cache), args.cache_size * 1024 * 1024)
+    if args.offline:
+        return Client(args.api_url, '', '', pool_size=args.concurrency, cache=cache, offline=True)
+
+    return Client(args.api_url, os.environ['ONSHAPE_ACCESS_KEY'], os.environ['ONSHAPE_SECRET_KEY'], pool_size=args.concurrency, cache=cache, requests_per_second=args.rate, bucket=bucket)
+
+def parse_densities(args: Namespace) -> dict[str, float]:
+    return {pattern: float(density) for pattern, density in (argument.rsplit('=', 1) for argument in args.density)}
+
+def import_model(args: Namespace, bucket: TokenBucket | None = None):
+    if args.trace is None and args.profile is None and args.profile_memory is None:
+        return run_import(args, bucket)
+
+    trace = start_trace(args.profile, args.profile_memory)
+    try:
+        run_import(args, bucket)
+    finally:
+        stop_trace()
+        trace_path = Path(args.trace) if args.trace else Path(args.models_path, args.name, 'trace.json')
+        # the import can fail before the model's directory exists, and that is the error to see
+        try:
+            trace_path.parent.mkdir(exist_ok=True, parents=True)
+            trace.write(trace_path)
+        except OSError as error:
+            print(f'Could not write the trace: {error}')
+        else:
+            print(trace.summary())
+            print(f'Trace written to {trace_path}')
+
+def run_import(args: Namespace, bucket: TokenBucket | None = None):
     model_path = Path(args.models_path, args.name)
     model_path.mkdir(exist_ok=True, parents=True)
 
     meshes_path = Path(model_path, 'meshes/')
     meshes_path.mkdir(exist_ok=True)
 
-    parts_mates = Path(os.path.join(os.getcwd(), 'parts_mates'))
-    if not args.testing:
-        client = Client('https://cad.onshape.com/api/v6', os.environ['ONSHAPE_ACCESS_KEY'], os.environ['ONSHAPE_SECRET_KEY'])
-        parts, mates = fetch_assembly(client, args.document, args.workspace, args.element, meshes_path)
+    state_path = Path(model_path, '.import_state.json')
+    previous = ImportState.load(state_path) if args.incremental else None
 
-        parts_mates.mkdir(exist_ok=True)
-
-        with open(os.path.join(parts_mates, 'parts.pickle'), 'wb') as handle:
-            pickle.dump(parts, handle, protocol=pickle.HIGHEST_PROTOCOL)
+    parts_mates = Path(args.stored_assembly)
+    if not args.testing:
+        client = create_client(args, bucket)
+        with span('fetch'):
+            parts, mates = fetch_assembly(client, args.document, args.workspace, args.element, meshes_path, args.concurrency, previous.known_mass_props() if previous else None, parse_densities(args))
+        print(f'Response cache: {client.cache.stats}')
+        print(client.stats)
 
-        with open(os.path.join(parts_mates, 'mates.pickle'), 'wb') as handle:
-            pickle.dump(mates, handle, protocol=pickle.HIGHEST_PROTOCOL)
+        parts_mates.mkdir(exist_ok=True, parents=True)
+        with span('snapshot'):
+            save_snapshot(Path(parts_mates, 'snapshot.npz'), parts, mates)
 
     else:
         print('Using stored assembly')
-        # NOTE: might want to add a check for whether the files or the directory exits or not
-        with open(os.path.join(parts_mates, 'parts.pickle'), 'rb') as handle:
-            parts = pickle.load(handle)
+        with span('snapshot'):
+            snapshot = Snapshot(Path(parts_mates, 'snapshot.npz'))
+            parts, mates = snapshot.parts, snapshot.mates
 
-        with open(os.path.join(parts_mates, 'mates.pickle'), 'rb') as handle:
-            mates = pickle.load(handle)
+    group_cache = previous.group_cache() if previous else {}
+    write_model(args, parts, mates, model_path, group_cache)
 
-    sdf = create_sdf(args.name, parts, mates)
-    insert_gazebo_plugins(sdf)
-    sdf.write(Path(model_path, f'{args.name}.sdf'), pretty_print=True, xml_declaration=True, encoding='utf-8')
-
-    config = create_gazebo_config(args.name)
-    config.write(Path(model_path, 'model.config'), pretty_print=True, xml_declaration=True, encoding='utf-8')
+    # the group cache is filled in while the sdf is created
+    with span('state'):
+        state = ImportState.from_import(parts, mates, group_cache)
+        if previous:
+            print(diff_import(previous, state))
+        state.save(state_path)
 
     # airframe = create_airframe_config(args.name, parts)
     # open('airframe', 'w').write(airframe)
 
+def write_model(args: Namespace, parts: dict[str, Part], mates: dict[str, Mate], model_path: Path, group_cache: dict[str, MassProperties]):
+    # everything after fetching, each output replaces the previous one in a single rename so a simulator
+    # (re)loading the model never sees a half written file
+    meshes_path = Path(model_path, 'meshes/')
+    if args.check_mass_properties:
+        with span('check mass properties'):
+            check_mass_properties(parts, meshes_path)
+
+    collision_meshes = None
+    if args.collision_triangles is not None or args.collision_tolerance is not None:
+        print('Simplifying collision meshes')
+        with span('collision meshes'):
+            collision_meshes = simplify_collision_meshes({part.mesh for part in parts.values()}, meshes_path, args.collision_triangles, args.collision_tolerance, args.concurrency)
+
+    collision_shapes = None
+    if args.collision_primitives:
+        print('Fitting collision shapes')
+        with span('collision shapes'):
+            collision_shapes = fit_collision_shapes(parts, meshes_path, args.collision_primitives, args.primitive_tolerance, args.concurrency)
+
+    sdf_path = Path(model_path, f'{args.name}.sdf')
+    sdf_options = SdfOptions(collision_meshes=collision_meshes, collision_shapes=collision_shapes, merge_meshes_path=meshes_path if args.merge_meshes else None, precision=args.sdf_precision, min_inertia=args.min_inertia, max_mass_ratio=args.max_mass_ratio)
+
+    if args.stream_sdf:
+        elements = model_elements(args.name, parts, mates, sdf_options, group_cache)
+        if args.export_obj:
+            print('Exporting meshes')
+            elements = exported_elements(elements, args.name, meshes_path, args.mesh_precision, args.concurrency)
+
+        # everything happens as the elements are written
+        with span('sdf'):
+            write_sdf(sdf_path, args.name, elements, insert_gazebo_plugins)
+    else:
+        with span('sdf'):
+            sdf = create_sdf(args.name, parts, mates, sdf_options, group_cache)
+
+        if args.export_obj:
+            print('Exporting meshes')
+            with span('export meshes'):
+                replace_mesh_uris(sdf, args.name, export_meshes(mesh_uris(sdf, args.name), meshes_path, args.mesh_precision, args.concurrency))
+
+        insert_gazebo_plugins(sdf)
+        with span('write sdf'):
+            write_tree(sdf, sdf_path)
+
+    write_tree(create_gazebo_config(args.name), Path(model_path, 'model.config'))
+
+def write_tree(tree: etree._ElementTree, path: Path):
+    temporary = temporary_path(path)
+    tree.write(temporary, pretty_print=True, xml_declaration=True, encoding='utf-8')
+    os.replace(temporary, path)
+
+def main():
+    import_model(create_parser().parse_args())
+
 if __name__ == '__main__':
     main()
 
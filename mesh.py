@@ -0,0 +1,261 @@
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from cache import temporary_path
+
+# binary stl: 80 byte header, triangle count, then one 50 byte record per triangle
+STL_DTYPE = np.dtype([('normal', '<f4', (3,)), ('vertices', '<f4', (3, 3)), ('attribute', '<u2')])
+
+def read_stl(path: Path) -> np.ndarray:
+    # maps the triangle records straight from disk, the returned (n, 3, 3) vertices are a view without copying anything
+    with open(path, 'rb') as f:
+        f.seek(80)
+        header = f.read(4)
+
+    # a truncated download or an ascii stl would otherwise fail deep inside numpy without saying which mesh
+    count = int.from_bytes(header, 'little') if len(header) == 4 else None
+    size = path.stat().st_size
+    if count is None or size != 84 + count * STL_DTYPE.itemsize:
+        raise ValueError(f'{path} is not a binary stl: {size} bytes' + (f' for {count} triangles' if count is not None else ''))
+
+    if count == 0:
+        return np.empty((0, 3, 3), dtype=np.float32)
+
+    return np.memmap(path, dtype=STL_DTYPE, mode='r', offset=84, shape=(count,))['vertices']
+
+# volumes below this fraction of the mesh's bounding cube are rounding error, the mesh is flat (a surface or decal)
+MIN_RELATIVE_VOLUME = 1e-9
+
+def volume_properties(triangles: np.ndarray) -> tuple[float, np.ndarray, np.ndarray]:
+    # volume, centroid and inertia about the centroid (at unit density) of a closed mesh,
+    # summed over the signed tetrahedra each triangle makes with the origin
+    a, b, c = (triangles[:, i].astype(np.float64) for i in range(3))
+    determinants = np.einsum('ij,ij->i', a, np.cross(b, c))
+    sums = a + b + c
+
+    volume = determinants.sum() / 6
+    extent = np.ptp(triangles.reshape(-1, 3), axis=0).max() if len(triangles) else 0.0
+    if abs(volume) <= MIN_RELATIVE_VOLUME * extent ** 3:
+        raise ValueError(f'the mesh encloses no volume ({len(triangles)} triangles)')
+
+    centroid = np.einsum('i,ij->j', determinants, sums) / (24 * volume)
+
+    # second moment about the origin, each tetrahedron contributes det / 120 * (aa' + bb' + cc' + ss')
+    second_moment = sum(np.einsum('i,ij,ik->jk', determinants, vertices, vertices) for vertices in (a, b, c, sums)) / 120
+    if volume < 0:
+        # inside out
+        volume, second_moment = -volume, -second_moment
+    second_moment -= volume * np.outer(centroid, centroid)
+    inertia = np.trace(second_moment) * np.identity(3) - second_moment
+
+    return float(volume), centroid, inertia
+
+def write_stl(path: Path, triangles: np.ndarray):
+    records = np.zeros(len(triangles), dtype=STL_DTYPE)
+    records['vertices'] = triangles
+
+    normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    records['normal'] = np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
+
+    temporary = temporary_path(path)
+    with open(temporary, 'wb') as f:
+        f.write(bytes(80))
+        f.write(np.uint32(len(records)).tobytes())
+        records.tofile(f)
+    temporary.replace(path)
+
+def merge_meshes(sources: list[tuple[Path, np.ndarray]], offset: np.ndarray, output: Path):
+    # bakes each (mesh, 4x4 transform) into one mesh, with offset as the new origin
+    loaded = {}
+    merged = []
+    for path, transform in sources:
+        if path not in loaded:
+            loaded[path] = read_stl(path).astype(np.float64)
+
+        merged.append(loaded[path] @ transform[:3, :3].T + (transform[:3, 3] - offset))
+
+    write_stl(output, np.concatenate(merged).astype(np.float32))
+
+def weld(triangles: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # stl is triangle soup, merge the bitwise identical copies of each vertex into an indexed mesh
+    vertices = np.ascontiguousarray(triangles, dtype=np.float32).reshape(-1, 3)
+    bits = vertices.view(np.uint32).astype(np.uint64)
+    # sorting one 64 bit hash is much faster than sorting 12 byte records, collisions are checked for below
+    keys = (bits[:, 0] * np.uint64(0x9E3779B97F4A7C15)) ^ (bits[:, 1] * np.uint64(0xC2B2AE3D27D4EB4F)) ^ (bits[:, 2] * np.uint64(0x165667B19E3779F9))
+    _, index, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    if not np.array_equal(vertices[index][inverse].view(np.uint32), vertices.view(np.uint32)):
+        _, index, inverse = np.unique(vertices.view(np.dtype((np.void, 12))).ravel(), return_index=True, return_inverse=True)
+
+    return vertices[index], inverse.reshape(-1, 3)
+
+def cluster_vertices(vertices: np.ndarray, faces: np.ndarray, cell_size: float) -> tuple[np.ndarray, np.ndarray]:
+    # vertex clustering: snap every vertex to a grid cell, merge each cell into its mean vertex and drop collapsed triangles
+    vertices = vertices.astype(np.float64)
+    origin = vertices.min(axis=0)
+    extent = vertices.max(axis=0) - origin
+
+    # keep the cell grid small enough for a single int64 key per cell
+    cell_size = max(cell_size, float(extent.max()) / (1 << 20), np.finfo(np.float32).eps)
+    dims = (extent / cell_size).astype(np.int64) + 1
+    cells = np.minimum(((vertices - origin) / cell_size).astype(np.int64), dims - 1)
+    keys = (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+
+    _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    clustered = np.stack([np.bincount(inverse, weights=vertices[:, axis], minlength=len(counts)) for axis in range(3)], axis=1) / counts[:, None]
+
+    faces = inverse[faces]
+    faces = faces[(faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 0] != faces[:, 2])]
+    # faces that collapsed onto the same three clusters are duplicates, whichever way round they wind
+    ordered = np.sort(faces, axis=1)
+    if len(counts) < 1 << 21:
+        _, unique = np.unique((ordered[:, 0] * len(counts) + ordered[:, 1]) * len(counts) + ordered[:, 2], return_index=True)
+    else:
+        _, unique = np.unique(ordered, axis=0, return_index=True)
+
+    return clustered.astype(np.float32), faces[np.sort(unique)]
+
+def decimate(triangles: np.ndarray, max_triangles: int | None = None, tolerance: float | None = None) -> np.ndarray:
+    if tolerance is None and (max_triangles is None or len(triangles) <= max_triangles):
+        return triangles
+
+    vertices, faces = weld(triangles)
+    if tolerance is not None:
+        # no vertex moves further than the diagonal of its cell
+        clustered, faces = cluster_vertices(vertices, faces, tolerance / np.sqrt(3))
+        return clustered[faces]
+
+    # search (in log space) for the smallest cell size that meets the budget
+    diagonal = float(np.linalg.norm(vertices.max(axis=0) - vertices.min(axis=0)))
+    low, high = np.log(diagonal * 1e-4), np.log(diagonal)
+    best = cluster_vertices(vertices, faces, diagonal)
+    for _ in range(12):
+        middle = (low + high) / 2
+        candidate = cluster_vertices(vertices, faces, float(np.exp(middle)))
+        if len(candidate[1]) <= max_triangles:
+            best, high = candidate, middle
+        else:
+            low = middle
+
+    clustered, faces = best
+    return clustered[faces]
+
+@dataclass
+class ReductionStats:
+    mesh: str
+    input_triangles: int
+    output_triangles: int
+    seconds: float
+    cached: bool
+
+    def __str__(self) -> str:
+        if self.cached:
+            return f'{self.mesh}: cached'
+
+        return f'{self.mesh}: {self.input_triangles} -> {self.output_triangles} triangles ({self.output_triangles / max(self.input_triangles, 1):.1%}) in {self.seconds * 1e3:.0f} ms'
+
+def simplify_collision_meshes(meshes: set[str], meshes_path: Path, max_triangles: int | None = None, tolerance: float | None = None, max_workers: int = 8) -> dict[str, str]:
+    # returns the collision mesh (relative to meshes_path) to use for each visual mesh,
+    # outputs are named after the input mesh (itself a content hash) and the settings, so reruns are free
+    collision_path = Path(meshes_path, 'collision')
+    collision_path.mkdir(exist_ok=True)
+    settings = f'e{tolerance:g}' if tolerance is not None else f't{max_triangles}'
+    meshes = sorted(meshes)
+
+    def simplify(mesh: str) -> tuple[str, ReductionStats]:
+        output = Path(collision_path, f'{Path(mesh).stem}_{settings}.stl')
+        if output.exists():
+            return output.relative_to(meshes_path).as_posix(), ReductionStats(mesh, 0, 0, 0.0, True)
+
+        start = time.perf_counter()
+        triangles = read_stl(Path(meshes_path, mesh))
+        simplified = decimate(triangles, max_triangles, tolerance)
+        if len(simplified) == 0:
+            # collapsed entirely, small parts keep their full mesh
+            simplified = triangles
+
+        write_stl(output, simplified)
+        return output.relative_to(meshes_path).as_posix(), ReductionStats(mesh, len(triangles), len(simplified), time.perf_counter() - start, False)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = dict(zip(meshes, executor.map(simplify, meshes)))
+
+    for _, stats in results.values():
+        print(f'Collision mesh {stats}')
+
+    return {mesh: collision for mesh, (collision, _) in results.items()}
+
+def write_obj(path: Path, triangles: np.ndarray, precision: int | None = None):
+    # indexed obj of the welded vertices, normals are left to the loader since text normals would cost more than stl saves
+    triangles = np.asarray(triangles, dtype=np.float64)
+    if precision is not None:
+        # rounding first also welds vertices that only differed below the precision
+        triangles = np.round(triangles, precision)
+    vertices, faces = weld(triangles.astype(np.float32))
+
+    number = f'%.{precision}f' if precision is not None else '%.9g'
+    buffer = io.BytesIO()
+    np.savetxt(buffer, vertices, fmt=f'v {number} {number} {number}')
+    np.savetxt(buffer, faces + 1, fmt='f %d %d %d')
+
+    temporary = temporary_path(path)
+    temporary.write_bytes(buffer.getvalue())
+    temporary.replace(path)
+
+def read_obj(path: Path) -> np.ndarray:
+    # only what write_obj produces, where every line is a keyword and three numbers
+    tokens = np.array(path.read_bytes().split()).reshape(-1, 4)
+    vertices = tokens[tokens[:, 0] == b'v', 1:].astype(np.float32)
+    faces = tokens[tokens[:, 0] == b'f', 1:].astype(np.int64)
+    return vertices[faces - 1]
+
+@dataclass
+class ExportStats:
+    mesh: str
+    stl_bytes: int
+    obj_bytes: int
+    stl_load: float
+    obj_load: float
+
+    def __str__(self) -> str:
+        return f'{self.mesh}: {self.stl_bytes / 1e3:.0f} kB -> {self.obj_bytes / 1e3:.0f} kB ({self.obj_bytes / max(self.stl_bytes, 1):.0%}), load {self.stl_load * 1e3:.1f} ms -> {self.obj_load * 1e3:.1f} ms'
+
+def export_meshes(meshes: set[str], meshes_path: Path, precision: int | None = None, max_workers: int = 8) -> dict[str, str]:
+    # returns the obj (relative to meshes_path) written for each stl, stls are content addressed so existing objs are reused
+    suffix = f'_q{precision}.obj' if precision is not None else '.obj'
+    meshes = sorted(meshes)
+
+    def export(mesh: str) -> tuple[str, ExportStats | None]:
+        source = Path(meshes_path, mesh)
+        output = source.with_name(source.stem + suffix)
+        exported = output.relative_to(meshes_path).as_posix()
+        if output.exists():
+            return exported, None
+
+        write_obj(output, read_stl(source), precision)
+
+        start = time.perf_counter()
+        np.array(read_stl(source))
+        stl_load = time.perf_counter() - start
+        start = time.perf_counter()
+        read_obj(output)
+        obj_load = time.perf_counter() - start
+
+        return exported, ExportStats(mesh, source.stat().st_size, output.stat().st_size, stl_load, obj_load)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = dict(zip(meshes, executor.map(export, meshes)))
+
+    exported = [stats for _, stats in results.values() if stats is not None]
+    for stats in exported:
+        print(f'Exported {stats}')
+    if exported:
+        stl_bytes, obj_bytes = sum(stats.stl_bytes for stats in exported), sum(stats.obj_bytes for stats in exported)
+        print(f'Exported {len(exported)} meshes: {stl_bytes / 1e6:.1f} MB -> {obj_bytes / 1e6:.1f} MB ({obj_bytes / max(stl_bytes, 1):.0%}), {len(meshes) - len(exported)} already exported')
+
+    return {mesh: obj for mesh, (obj, _) in results.items()}
@@ -0,0 +1,329 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from argparse import ArgumentParser
+from urllib.parse import parse_qs, urlsplit
+from collections import Counter
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from mesh import STL_DTYPE
+
+# local stand-in for the onshape api, used to measure the fetch stage without touching the real service
+
+MASS_PROPERTIES = re.compile(r'/parts/d/(\w+)/m/(\w+)/e/(\w+)/partid/([^/]+)/massproperties')
+STL = re.compile(r'/parts/d/(\w+)/m/(\w+)/e/(\w+)/partid/([^/]+)/stl')
+DOWNLOAD = re.compile(r'/download/(\w+)/(\w+)/(\w+)/([^/]+)')
+ASSEMBLY = re.compile(r'/assemblies/d/(\w+)/w/(\w+)/e/(\w+)')
+FEATURES = re.compile(r'/assemblies/d/(\w+)/[wm]/(\w+)/e/(\w+)/features')
+MICROVERSION = re.compile(r'/documents/d/(\w+)/w/(\w+)/currentmicroversion')
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # the default backlog of 5 stalls concurrent clients on syn retransmits
+    request_queue_size = 128
+
+class MockOnshape:
+    def __init__(self, latency: float = 0.0, throttle_every: int = 0, retry_after: float = 0.1, stl_triangles: int = 1):
+        self.latency = latency
+        self.stl_triangles = stl_triangles
+        # answer every nth request with a 429, like onshape does when the rate limit is hit
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.hits = Counter()
+        # the workspace, served for any document, workspace and element id
+        self.assembly = synthetic_assembly(1, 1)
+        self.features = synthetic_features(self.assembly)
+        self.microversion = 0
+        self._count = 0
+        self._lock = threading.Lock()
+        self._server = Server(('127.0.0.1', 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f'http://127.0.0.1:{self._server.server_port}'
+
+    def __enter__(self) -> 'MockOnshape':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def bump(self, assembly: dict | None = None, features: dict | None = None):
+        # an edit in the workspace, which always moves it to a new microversion
+        with self._lock:
+            self.assembly = assembly if assembly is not None else self.assembly
+            self.features = features if features is not None else self.features
+            self.microversion += 1
+
+    def mass_properties(self, did: str, mid: str, eid: str, pid: str) -> dict:
+        return {'bodies': {pid: {'mass': [1.0, 0.0, 0.0], 'centroid': [0.0] * 9, 'inertia': [1.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 1.0] + [0.0] * 3}}}
+
+    def stl(self, did: str, mid: str, eid: str, pid: str) -> bytes:
+        return cylinder_stl(self.stl_triangles, int(hashlib.sha1(pid.encode()).hexdigest()[:8], 16) / 2 ** 32)
+
+    def _hit(self, name: str):
+        # handlers run in one thread per request, and counter increments are not atomic
+        with self._lock:
+            self.hits[name] += 1
+
+    def _throttled(self) -> bool:
+        with self._lock:
+            self._count += 1
+            return self.throttle_every > 0 and self._count % self.throttle_every == 0
+
+    def _handler(self) -> type[BaseHTTPRequestHandler]:
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlsplit(self.path)
+                path = url.path
+                time.sleep(mock.latency)
+
+                if mock._throttled():
+                    mock._hit('throttled')
+                    self.send_response(429)
+                    self.send_header('Retry-After', str(mock.retry_after))
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                elif MICROVERSION.fullmatch(path):
+                    mock._hit('microversion')
+                    self._send_json({'microversion': f'm{mock.microversion}'})
+                elif ASSEMBLY.fullmatch(path):
+                    mock._hit('assembly')
+                    self._send_json(mock.assembly)
+                elif FEATURES.fullmatch(path):
+                    mock._hit('features')
+                    feature_ids = parse_qs(url.query).get('featureId')
+                    features = mock.features if feature_ids is None else mock.features | {'features': [feature for feature in mock.features['features'] if feature['featureId'] in set(feature_ids)]}
+                    self._send_json(features)
+                elif match := MASS_PROPERTIES.fullmatch(path):
+                    mock._hit('massproperties')
+                    self._send_json(mock.mass_properties(*match.groups()))
+                elif match := STL.fullmatch(path):
+                    mock._hit('stl')
+                    self.send_response(307)
+                    self.send_header('Location', f'{mock.base_url}/download/{"/".join(match.groups())}')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                elif match := DOWNLOAD.fullmatch(path):
+                    body = mock.stl(*match.groups())
+                    etag = f'"{hashlib.md5(body).hexdigest()}"'
+                    if self.headers.get('If-None-Match') == etag:
+                        mock._hit('not modified')
+                        self.send_response(304)
+                        self.end_headers()
+                    else:
+                        mock._hit('download')
+                        self.send_response(200)
+                        self.send_header('ETag', etag)
+                        self.send_header('Content-Length', str(len(body)))
+                        self.end_headers()
+                        self.wfile.write(body)
+                else:
+                    self.send_error(404)
+
+            def _send_json(self, data: dict):
+                body = json.dumps(data).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *_):
+                pass
+
+        return Handler
+
+@lru_cache(maxsize=4096)
+def cylinder_stl(triangles: int, size: float) -> bytes:
+    # a closed cylinder of about this many triangles (at least 12, a single triangle for 1) sized between 1 and 10 cm,
+    # so parts have distinct meshes and real volumes
+    if triangles <= 1:
+        return bytes(80) + (1).to_bytes(4, 'little') + bytes(48) + bytes(2)
+
+    segments = max(3, triangles // 4)
+    radius, height = 0.01 + 0.04 * size, 0.01 + 0.09 * size
+    angles = np.linspace(0, 2 * np.pi, segments, endpoint=False)
+    ring = np.stack((radius * np.cos(angles), radius * np.sin(angles), np.zeros(segments)), axis=1)
+    bottom, top = ring, ring + [0.0, 0.0, height]
+    next_bottom, next_top = np.roll(bottom, -1, axis=0), np.roll(top, -1, axis=0)
+    centers = np.broadcast_to([0.0, 0.0, 0.0], ring.shape), np.broadcast_to([0.0, 0.0, height], ring.shape)
+
+    records = np.zeros(4 * segments, dtype=STL_DTYPE)
+    records['vertices'] = np.concatenate((
+        np.stack((bottom, next_bottom, next_top), axis=1),
+        np.stack((bottom, next_top, top), axis=1),
+        np.stack((centers[0], next_bottom, bottom), axis=1),
+        np.stack((centers[1], top, next_top), axis=1),
+    ))
+    return bytes(80) + len(records).to_bytes(4, 'little') + records.tobytes()
+
+def random_rotation(rng: np.random.Generator) -> np.ndarray:
+    q, r = np.linalg.qr(rng.normal(size=(3, 3)))
+    q *= np.sign(np.diag(r))
+    return q if np.linalg.det(q) > 0 else -q
+
+# the joints the gazebo plugins drive, as part names
+ROTORS = ('back l foot', 'front r foot', 'back r foot', 'front l foot')
+
+def mate_feature(id: str, kind: str, parent: str, child: str, frame: np.ndarray) -> dict:
+    # parent and child are occurrence paths, instance ids joined with '/'. frame is a 4x4 transform, its columns are
+    # the mate connector axes and origin
+    mated_cs = {'origin': frame[:3, 3].tolist(), 'xAxis': frame[:3, 0].tolist(), 'yAxis': frame[:3, 1].tolist(), 'zAxis': frame[:3, 2].tolist()}
+    return {'id': id, 'featureData': {'mateType': kind, 'matedEntities': [{'matedOccurrence': child.split('/'), 'matedCS': mated_cs}, {'matedOccurrence': parent.split('/'), 'matedCS': mated_cs}]}}
+
+def synthetic_assembly(instance_count: int, definition_count: int, revolute_ratio: float = 0.05, depth: int = 4, microversion: str = 'm0', rotors: bool = False, seed: int = 0, full: bool = False) -> dict:
+    # an /assemblies response: instances of definition_count part studio parts, randomly posed, and a tree of
+    # depth levels of mates from the first instance, each one revolute with probability revolute_ratio.
+    # with rotors, the first parts below the root are the model's propellers, spinning on it. with full, it also
+    # has everything else onshape sends that the import doesn't read (configurations, mate connectors, part list)
+    rng = np.random.default_rng(seed)
+    names = [f'part {i % definition_count} <{i}>' for i in range(instance_count)]
+    # the root is level 0, the rest fill levels 1 to depth in order, so every parent comes before its children
+    levels = [0] + [1 + (i - 1) * depth // (instance_count - 1) for i in range(1, instance_count)]
+    level_start = {}
+    for i, level in enumerate(levels):
+        level_start.setdefault(level, i)
+
+    transforms = np.tile(np.identity(4), (instance_count, 1, 1))
+    features = []
+    for i in range(1, instance_count):
+        parent = int(rng.integers(level_start[levels[i] - 1], level_start[levels[i]]))
+        kind = 'REVOLUTE' if rng.random() < revolute_ratio else 'FASTENED'
+        if rotors and i <= len(ROTORS):
+            names[i], parent, kind = f'{ROTORS[i - 1]} <1>', 0, 'REVOLUTE'
+
+        transforms[i, :3, :3] = random_rotation(rng)
+        transforms[i, :3, 3] = transforms[parent, :3, 3] + rng.uniform(-0.1, 0.1, 3)
+        frame = np.identity(4)
+        frame[:3, :3] = random_rotation(rng)
+        frame[:3, 3] = rng.uniform(-0.01, 0.01, 3)
+        features.append(mate_feature(f'M{i}', kind, f'I{parent}', f'I{i}', frame))
+
+    instances = [{
+        'id': f'I{i}',
+        'name': name,
+        'type': 'Part',
+        'documentId': 'd0',
+        'documentMicroversion': microversion,
+        'elementId': 'e0',
+        'partId': f'P{i % definition_count}',
+    } for i, name in enumerate(names)]
+
+    occurrences = [{'path': [f'I{i}'], 'transform': transform.flatten().tolist(), 'fixed': i == 0, 'hidden': False} for i, transform in enumerate(transforms)]
+    if not full:
+        return {'rootAssembly': {'instances': instances, 'occurrences': occurrences, 'features': features}}
+
+    configuration = {'configuration': 'default', 'fullConfiguration': 'default', 'documentVersion': '', 'isStandardContent': False}
+    instances = [instance | configuration | {'suppressed': False, 'partNumber': None, 'revision': None} for instance in instances]
+    connector = mate_feature('', '', '', '', np.identity(4))['featureData']['matedEntities'][0]['matedCS']
+    for feature in features:
+        feature |= {'featureType': 'mate', 'suppressed': False}
+        feature['featureData']['name'] = f'{feature["featureData"]["mateType"].title()} {feature["id"]}'
+    features += [{'id': f'C{i}', 'featureType': 'mateConnector', 'suppressed': False, 'featureData': {'name': f'Mate connector {i}', 'occurrence': [f'I{i}'], 'mateConnectorCS': connector}} for i in range(instance_count)]
+    parts = [{'documentId': 'd0', 'documentMicroversion': microversion, 'elementId': 'e0', 'partId': f'P{i}', 'bodyType': 'solid', 'mateConnectors': []} | configuration for i in range(definition_count)]
+
+    return {'rootAssembly': {'instances': instances, 'occurrences': occurrences, 'features': features, 'fullConfiguration': 'default', 'configuration': 'default', 'documentId': 'd0', 'elementId': 'e0', 'documentMicroversion': microversion}, 'subAssemblies': [], 'parts': parts, 'partStudioFeatures': []}
+
+def first_part(assembly: dict, level: dict | None = None) -> str:
+    # the occurrence path of the first part, looking into subassemblies
+    data = (level or assembly['rootAssembly'])['instances'][0]
+    if data['type'] == 'Part':
+        return data['id']
+
+    subassembly = next(subassembly for subassembly in assembly['subAssemblies'] if subassembly['elementId'] == data['elementId'])
+    return f'{data["id"]}/{first_part(assembly, subassembly)}'
+
+def instanced_assembly(assembly: dict, copies: int, element_id: str, seed: int = 0) -> dict:
+    # an assembly of copies instances of the given one as a subassembly (element_id), randomly posed, each fastened
+    # to the first by their first parts. nesting it again gives deeper trees
+    rng = np.random.default_rng(seed)
+    root = assembly['rootAssembly']
+    microversion = root['instances'][0]['documentMicroversion']
+    definition = {'documentId': 'd0', 'documentMicroversion': microversion, 'elementId': element_id, 'fullConfiguration': 'default', 'instances': root['instances'], 'features': root['features']}
+    transforms = np.array([np.reshape(data['transform'], (4, 4)) for data in root['occurrences']])
+    paths = [data['path'] for data in root['occurrences']]
+    anchor = first_part(assembly)
+
+    instances, occurrences, features = [], [], []
+    for j in range(copies):
+        pose = np.identity(4)
+        pose[:3, :3] = random_rotation(rng)
+        pose[:3, 3] = rng.uniform(-1.0, 1.0, 3)
+        instances.append({'id': f'S{j}', 'name': f'{element_id} <{j}>', 'type': 'Assembly', 'documentId': 'd0', 'documentMicroversion': microversion, 'elementId': element_id, 'fullConfiguration': 'default'})
+        # onshape gives every occurrence its transform relative to the root
+        occurrences.append({'path': [f'S{j}'], 'transform': pose.flatten().tolist()})
+        occurrences += [{'path': [f'S{j}'] + path, 'transform': transform.flatten().tolist()} for path, transform in zip(paths, pose @ transforms)]
+        if j > 0:
+            features.append(mate_feature(f'F{j}', 'FASTENED', f'S0/{anchor}', f'S{j}/{anchor}', np.identity(4)))
+
+    return {'rootAssembly': {'instances': instances, 'occurrences': occurrences, 'features': features}, 'subAssemblies': assembly.get('subAssemblies', []) + [definition]}
+
+def quantity_parameter(parameter_id: str, expression: str) -> dict:
+    return {'btType': 'BTMParameterQuantity-147', 'parameterId': parameter_id, 'expression': expression, 'units': '', 'value': 0.0, 'isInteger': False, 'nodeId': hashlib.md5(parameter_id.encode()).hexdigest()[:24]}
+
+def query_parameter(parameter_id: str, occurrences: list[str]) -> dict:
+    queries = [{'btType': 'BTMIndividualQuery-138', 'queryStatement': None, 'queryString': f'query = qCompressed(1.0, "%B5$QueryM4S12$disambiguationDataA0S4$typeS{len(occurrence)}${occurrence}", id);', 'deterministicIds': [f'J{j}C' for j in range(4)], 'path': [occurrence]} for occurrence in occurrences]
+    return {'btType': 'BTMParameterQueryWithOccurrenceList-67', 'parameterId': parameter_id, 'queries': queries, 'nodeId': hashlib.md5(parameter_id.encode()).hexdigest()[:24]}
+
+def synthetic_features(assembly: dict, limit: float = 90.0, full: bool = False) -> dict:
+    # the /features response for an assembly's mates, revolute ones limited to +-limit degrees. the parameters around
+    # the limits stand in for the many others onshape sends with every mate, with full they are as many and as
+    # verbose as onshape's
+    features = []
+    # the mates of every subassembly too, the mock serves them all for any element
+    for feature in assembly['rootAssembly']['features'] + [feature for subassembly in assembly.get('subAssemblies', []) for feature in subassembly['features']]:
+        if 'matedEntities' not in feature['featureData']:
+            continue
+        if full:
+            occurrences = [entity['matedOccurrence'][0] for entity in feature['featureData']['matedEntities']]
+            parameters = [{'btType': 'BTMParameterEnum-145', 'parameterId': 'mateType', 'value': feature['featureData']['mateType'], 'enumName': 'Mate type'}, query_parameter('mateConnectorsQuery', occurrences), query_parameter('secondaryAxisQuery', occurrences)]
+            parameters += [quantity_parameter(parameter_id, '0 mm') for parameter_id in ('limitZMin', 'limitZMax', 'offsetX', 'offsetY', 'offsetZ')]
+            parameters += [quantity_parameter(parameter_id, '0 deg') for parameter_id in ('rotationX', 'rotationY', 'rotationZ')]
+            if feature['featureData']['mateType'] == 'REVOLUTE':
+                parameters += [quantity_parameter('limitAxialZMin', f'{-limit:g} deg'), quantity_parameter('limitAxialZMax', f'{limit:g} deg')]
+            features.append({'btType': 'BTMMate-64', 'featureId': feature['id'], 'featureType': 'mate', 'name': feature['id'], 'suppressed': False, 'namespace': '', 'nodeId': feature['id'], 'returnAfterSubfeatures': False, 'subFeatures': [], 'parameters': parameters})
+            continue
+
+        parameters = [{'parameterId': 'mateType', 'value': feature['featureData']['mateType']}, {'parameterId': 'mateConnectorsQuery', 'queries': []}, {'parameterId': 'limitsEnabled', 'value': feature['featureData']['mateType'] == 'REVOLUTE'}]
+        if feature['featureData']['mateType'] == 'REVOLUTE':
+            parameters += [{'parameterId': 'limitAxialZMin', 'expression': f'{-limit:g} deg'}, {'parameterId': 'limitAxialZMax', 'expression': f'{limit:g} deg'}]
+        features.append({'featureId': feature['id'], 'featureType': 'mate', 'name': feature['id'], 'suppressed': False, 'parameters': parameters + [{'parameterId': 'primaryAxisAlignment', 'value': False}]})
+
+    return {'features': features, 'serializationVersion': '1.2.5', 'sourceMicroversion': 'm0', 'rejectMicroversionSkew': False, 'microversionSkew': False, 'libraryVersion': 2000} if full else {'features': features}
+
+if __name__ == '__main__':
+    from api import Client
+    from onshape import get_mass_properties
+
+    parser = ArgumentParser(description='Measure mass property fetching against a local stand-in server')
+    parser.add_argument('-n', '--instances', type=int, default=300, help='Number of instances in the assembly')
+    parser.add_argument('-u', '--unique', type=int, default=60, help='Number of unique part definitions')
+    parser.add_argument('-l', '--latency', type=float, default=0.05, help='Artificial latency per request (seconds)')
+    parser.add_argument('-j', '--concurrency', type=int, default=16, help='Maximum number of concurrent requests')
+    parser.add_argument('-r', '--rate', type=float, default=None, help='Client request budget (requests per second)')
+    parser.add_argument('--throttle-every', type=int, default=0, help='Answer every nth request with a 429')
+    args = parser.parse_args()
+
+    assembly = synthetic_assembly(args.instances, args.unique)
+
+    with MockOnshape(args.latency, args.throttle_every) as mock:
+        client = Client(mock.base_url, '', '', pool_size=args.concurrency, requests_per_second=args.rate)
+
+        for max_workers in (1, args.concurrency):
+            mock.hits.clear()
+            start = time.perf_counter()
+            get_mass_properties(assembly, client, max_workers)
+            print(f'max_workers={max_workers}: {time.perf_counter() - start:.2f}s, {mock.hits["massproperties"]} requests for {args.instances} instances, {mock.hits["throttled"]} throttled')
+
+        print(client.stats)
@@ -1,126 +1,417 @@
+import hashlib
+import os
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+
 import numpy as np
-from scipy.spatial.transform import Rotation
 from dataclasses import dataclass
 from lxml import etree
 
-from onshape import MassProperties, Mate, Part
+from cache import temporary_path
+from collision import CollisionShape
+from inertia import condition_inertias
+from mesh import merge_meshes
+from onshape import MassProperties, MassPropertiesArray, Mate, Part
+from tracing import count, span
+from transforms import euler_xyz
 
-def create_sdf(name: str, parts: dict[str, Part], mates: dict[str, Mate]) -> etree._ElementTree:
+@dataclass
+class SdfOptions:
+    # collision_meshes maps a part's visual mesh to a simplified one, collision_shapes maps a part to a fitted shape,
+    # with merge_meshes_path each link's meshes are merged into one there. the rest are main.py's options
+    collision_meshes: dict[str, str] | None = None
+    collision_shapes: dict[str, CollisionShape] | None = None
+    merge_meshes_path: Path | None = None
+    precision: int | None = None
+    min_inertia: float | None = None
+    max_mass_ratio: float | None = None
+
+def create_sdf(name: str, parts: dict[str, Part], mates: dict[str, Mate], options: SdfOptions | None = None, group_cache: dict[str, MassProperties] | None = None) -> etree._ElementTree:
+    sdf_root = etree.Element('sdf', version='1.6')
+    model_element = etree.SubElement(sdf_root, 'model', name=name)
+    model_element.extend(list(model_elements(name, parts, mates, options, group_cache)))
 
-    grouped_parts = collect_part_groups(parts, mates)
+    return etree.ElementTree(sdf_root)
+
+def model_elements(name: str, parts: dict[str, Part], mates: dict[str, Mate], options: SdfOptions | None = None, group_cache: dict[str, MassProperties] | None = None) -> Iterator[etree._Element]:
+    # the model's links, joints and settings one element at a time, create_sdf builds the tree from them and write_sdf streams them
+    options = options or SdfOptions()
+    with span('grouping'):
+        grouped_parts = collect_part_groups(parts, mates)
+    count('groups', len(grouped_parts))
 
     for group in grouped_parts:
         members = ", ".join(parts[id].identifier for id in group[1:])
         print(f'Group: {parts[group[0]].identifier} {"(" + members + ")" if members else ""}')
 
-    link_groups = create_link_groups(grouped_parts, parts)
+    group_index = part_group_index(grouped_parts)
+    with span('link groups'):
+        link_groups = create_link_groups(grouped_parts, parts, group_cache)
+    with span('conditioning'):
+        condition_link_groups(link_groups, grouped_parts, group_index, parts, mates, options.min_inertia, options.max_mass_ratio)
 
-    print('Creating SDF')
-    sdf_root = etree.Element('sdf', version='1.6')
-    model_element = etree.SubElement(sdf_root, 'model', name=name)
+    merged_meshes = None
+    if options.merge_meshes_path is not None:
+        print('Merging link group meshes')
+        with span('merge meshes'):
+            merged_meshes = merge_link_group_meshes(link_groups, options.merge_meshes_path, options.collision_meshes, options.collision_shapes)
 
-    insert_link_groups(model_element, link_groups, name)
-    insert_joints(model_element, link_groups, parts, mates)
-    etree.SubElement(model_element, 'self_collide').text = 'false'
-
-    return etree.ElementTree(sdf_root)
+    print('Creating SDF')
+    yield from link_elements(link_groups, name, options.collision_meshes, options.collision_shapes, merged_meshes, options.precision)
+    yield from joint_elements(link_groups, group_index, parts, mates, options.precision)
+
+    self_collide = etree.Element('self_collide')
+    self_collide.text = 'false'
+    yield self_collide
+
+def write_sdf(path: Path, name: str, elements: Iterable[etree._Element], finish: Callable[[etree._ElementTree], None] | None = None):
+    # writes the same bytes as the create_sdf tree written with pretty_print, but only ever holds one model element.
+    # finish gets an outline of the written model (elements with their attributes and leaf values, e.g. a joint's child)
+    # to insert into the way gazebo plugins are inserted into the full tree, and whatever it appends is written last
+    outline_root = etree.Element('sdf', version='1.6')
+    outline = etree.SubElement(outline_root, 'model', name=name)
+
+    temporary = temporary_path(path)
+    with open(temporary, 'wb') as f:
+        # the tree writer capitalises the encoding, xmlfile's write_declaration doesn't
+        f.write(b"<?xml version='1.0' encoding='UTF-8'?>\n")
+        with etree.xmlfile(f, encoding='utf-8') as xf:
+            with xf.element('sdf', version='1.6'):
+                xf.write('\n  ')
+                with xf.element('model', name=name):
+                    def write(element: etree._Element):
+                        etree.indent(element, level=2)
+                        xf.write('\n    ')
+                        xf.write(element)
+
+                    for element in elements:
+                        write(element)
+                        outline.append(outline_element(element))
+
+                    if finish is not None:
+                        written = len(outline)
+                        finish(etree.ElementTree(outline_root))
+                        for element in outline[written:]:
+                            write(element)
+
+                    xf.write('\n  ')
+                xf.write('\n')
+        f.write(b'\n')
+    os.replace(temporary, path)
+
+def outline_element(element: etree._Element) -> etree._Element:
+    outline = etree.Element(element.tag, element.attrib)
+    for child in element:
+        if len(child) == 0:
+            etree.SubElement(outline, child.tag, child.attrib).text = child.text
+
+    return outline
+
+def number(value: float, precision: int | None = None) -> str:
+    # full precision by default, otherwise rounded to significant digits
+    return str(value) if precision is None else f'{float(value):.{precision}g}'
+
+def numbers(values: Iterable[float], precision: int | None = None) -> str:
+    return ' '.join(number(value, precision) for value in values)
 
 @dataclass
 class LinkGroup:
     parts: dict[str, Part]
     mass_props: MassProperties
 
-def collect_part_groups(parts: dict[str, Part], mates: dict[str, Mate]) -> list[list[str]]:
-    groups = list([part] for part in parts.keys())
+class DisjointSet:
+    # union by rank with path compression. to keep the order collect_part_groups always had, each set also keeps its
+    # members as a linked list (the parent's members first), so a set's first member is the part that heads the group
+    def __init__(self, count: int):
+        self._parent = list(range(count))
+        self._rank = [0] * count
+        self._first = list(range(count))
+        self._last = list(range(count))
+        self._next = [-1] * count
+
+    def find(self, item: int) -> int:
+        root = item
+        while self._parent[root] != root:
+            root = self._parent[root]
+        while self._parent[item] != root:
+            self._parent[item], item = root, self._parent[item]
+
+        return root
+
+    def union(self, parent: int, child: int):
+        parent_root, child_root = self.find(parent), self.find(child)
+        if parent_root == child_root:
+            return
+
+        first, last = self._first[parent_root], self._last[child_root]
+        self._next[self._last[parent_root]] = self._first[child_root]
+
+        if self._rank[parent_root] < self._rank[child_root]:
+            parent_root, child_root = child_root, parent_root
+        elif self._rank[parent_root] == self._rank[child_root]:
+            self._rank[parent_root] += 1
+
+        self._parent[child_root] = parent_root
+        self._first[parent_root] = first
+        self._last[parent_root] = last
+
+    def sets(self) -> list[list[int]]:
+        # ordered by first member
+        sets = []
+        for root in sorted({self.find(item) for item in range(len(self._parent))}, key=lambda root: self._first[root]):
+            members = []
+            item = self._first[root]
+            while item != -1:
+                members.append(item)
+                item = self._next[item]
+            sets.append(members)
+
+        return sets
 
-    def part_group_index(part: str) -> int:
-        return next(i for i, group in enumerate(groups) if part in group)
+def collect_part_groups(parts: dict[str, Part], mates: dict[str, Mate]) -> list[list[str]]:
+    ids = list(parts.keys())
+    index = {part: i for i, part in enumerate(ids)}
+    groups = DisjointSet(len(ids))
+    unknown = []
 
-    for mate in mates.values():
+    for mate_id, mate in mates.items():
         # we only group together fastened parts
         if mate.kind == 'FASTENED':
-            # NOTE: try except for parts with no next?
-            try:
-                parent_group = part_group_index(mate.parent)
-                child_group = part_group_index(mate.child)
-            except:
+            if mate.parent not in index or mate.child not in index:
+                unknown.append(mate_id)
                 continue
-            # merge the two groups
-            if parent_group != child_group:
-                groups[parent_group].extend(groups[child_group])
-                groups.pop(child_group)
 
-    return groups
+            groups.union(index[mate.parent], index[mate.child])
 
-def create_link_groups(grouped_parts: list[list[str]], parts: dict[str, Part]) -> list[LinkGroup]:
-    link_groups = []
-    for group in grouped_parts:
-        link_frame_mass_props = [parts[part].mass_props.apply_transform(parts[part].transform) for part in group]
+    if unknown:
+        print(f'Skipping {len(unknown)} fastened mates with parts missing from the assembly: {", ".join(unknown)}')
+
+    return [[ids[i] for i in members] for members in groups.sets()]
+
+def part_group_index(grouped_parts: list[list[str]]) -> dict[str, int]:
+    return {part: i for i, group in enumerate(grouped_parts) for part in group}
 
-        group_mass = sum(mass_props.mass for mass_props in link_frame_mass_props)
-        group_com = sum(mass_props.mass * mass_props.com for mass_props in link_frame_mass_props) / group_mass
-        group_inertia = sum(mass_props.inertia_at_point(group_com) for mass_props in link_frame_mass_props)
+def group_signature(group: list[str], parts: dict[str, Part]) -> str:
+    # identifies a group by what its mass properties depend on: its members, their definitions, placements and
+    # mass properties (which for the same definition differ with --density)
+    signature = hashlib.sha1()
+    for part in sorted(group):
+        mass_props = parts[part].mass_props
+        signature.update(repr((part, parts[part].definition)).encode())
+        for values in (parts[part].transform, mass_props.mass, mass_props.com, mass_props.inertia):
+            signature.update(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+
+    return signature.hexdigest()
+
+def link_group_mass_properties(grouped_parts: list[list[str]], parts: dict[str, Part]) -> MassPropertiesArray:
+    # every part in one batch: rotate into the link frame, then sum each group's run of rows
+    members = [part for group in grouped_parts for part in group]
+    starts = np.cumsum([0] + [len(group) for group in grouped_parts[:-1]])
+    transforms = np.array([parts[part].transform for part in members], dtype=np.float64).reshape(-1, 4, 4)
+
+    return MassPropertiesArray.stack([parts[part].mass_props for part in members]).apply_transforms(transforms).reduce(starts)
+
+def create_link_groups(grouped_parts: list[list[str]], parts: dict[str, Part], group_cache: dict[str, MassProperties] | None = None) -> list[LinkGroup]:
+    # group_cache holds the previous import's group mass properties by signature, it is updated in place with this import's groups
+    previous = dict(group_cache or {})
+    if group_cache is not None:
+        group_cache.clear()
+
+    signatures = [group_signature(group, parts) if group_cache is not None else None for group in grouped_parts]
+    group_mass_props = [previous.get(signature) for signature in signatures]
+
+    changed = [i for i, mass_props in enumerate(group_mass_props) if mass_props is None]
+    if changed:
+        computed = link_group_mass_properties([grouped_parts[i] for i in changed], parts)
+        for row, i in enumerate(changed):
+            group_mass_props[i] = computed[row]
+
+    link_groups = [LinkGroup({part: parts[part] for part in group}, mass_props) for group, mass_props in zip(grouped_parts, group_mass_props)]
+    if group_cache is not None:
+        group_cache.update(zip(signatures, group_mass_props))
+
+    if previous:
+        print(f'Reused {len(link_groups) - len(changed)} of {len(link_groups)} link groups')
 
-        link_groups.append(LinkGroup({part: parts[part] for part in group}, MassProperties(group_mass, group_com, group_inertia)))
-    
     return link_groups
 
-def insert_link_groups(model_element: etree._Element, link_groups: list[LinkGroup], model_name: str):
+def link_joints(group_index: dict[str, int], mates: dict[str, Mate]) -> list[tuple[int, int]]:
+    # (parent, child) group indices of every joint
+    return [(group_index[mate.parent], group_index[mate.child]) for mate in mates.values() if mate.kind != 'FASTENED' and mate.parent in group_index and mate.child in group_index]
+
+def condition_link_groups(link_groups: list[LinkGroup], grouped_parts: list[list[str]], group_index: dict[str, int], parts: dict[str, Part], mates: dict[str, Mate], min_inertia: float | None = None, max_mass_ratio: float | None = None):
+    # replaces the mass properties of groups whose inertia needs conditioning, the group cache keeps the originals
+    names = [f'group_{i} ({parts[group[0]].identifier})' for i, group in enumerate(grouped_parts)]
+    conditioned, changes = condition_inertias([group.mass_props for group in link_groups], names, link_joints(group_index, mates), min_inertia, max_mass_ratio)
+    for group, mass_props in zip(link_groups, conditioned):
+        group.mass_props = mass_props
+
+    for change in changes:
+        print(f'Conditioned inertia {change}')
+
+def merge_link_group_meshes(link_groups: list[LinkGroup], meshes_path: Path, collision_meshes: dict[str, str] | None = None, collision_shapes: dict[str, CollisionShape] | None = None) -> list[tuple[str, str | None]]:
+    # bakes every group's part meshes into one visual and one collision mesh in the link frame (at the group com),
+    # parts with a fitted collision shape keep it and are left out of the merged collision mesh,
+    # outputs are named after everything that goes into them, so unchanged groups are not rebuilt
+    collision_meshes = collision_meshes or {}
+    collision_shapes = collision_shapes or {}
+    merged_path = Path(meshes_path, 'merged')
+    merged_path.mkdir(exist_ok=True)
+
+    def merge(meshes: list[tuple[str, np.ndarray]], offset: np.ndarray) -> str | None:
+        if not meshes:
+            return None
+
+        signature = hashlib.sha1()
+        for mesh, transform in meshes:
+            signature.update(mesh.encode())
+            signature.update(np.ascontiguousarray(transform, dtype=np.float64).tobytes())
+        signature.update(np.ascontiguousarray(offset, dtype=np.float64).tobytes())
+
+        output = Path(merged_path, f'{signature.hexdigest()[:16]}.stl')
+        if not output.exists():
+            merge_meshes([(Path(meshes_path, mesh), transform) for mesh, transform in meshes], offset, output)
+
+        return output.relative_to(meshes_path).as_posix()
+
+    merged_meshes = []
+    for group in link_groups:
+        visual = merge([(part.mesh, part.transform) for part in group.parts.values()], group.mass_props.com)
+        collision = merge([(collision_meshes.get(part.mesh, part.mesh), part.transform) for id, part in group.parts.items() if id not in collision_shapes], group.mass_props.com)
+        merged_meshes.append((visual, collision))
+
+    # stale merges go, along with anything exported from them
+    current = {Path(mesh).stem for meshes in merged_meshes for mesh in meshes if mesh is not None}
+    for path in merged_path.iterdir():
+        if path.name[:16] not in current:
+            path.unlink()
+
+    return merged_meshes
+
+def link_elements(link_groups: list[LinkGroup], model_name: str, collision_meshes: dict[str, str] | None = None, collision_shapes: dict[str, CollisionShape] | None = None, merged_meshes: list[tuple[str, str | None]] | None = None, precision: int | None = None) -> Iterator[etree._Element]:
+    # collision_meshes maps a part's visual mesh to a simplified one, collision_shapes maps a part to a fitted primitive or hull,
+    # parts without either collide with their visual mesh. merged_meshes holds each group's baked visual and collision mesh
+    collision_meshes = collision_meshes or {}
+    collision_shapes = collision_shapes or {}
+
     for i, group in enumerate(link_groups):
-        link = etree.SubElement(model_element, 'link', name=f'group_{i}')
+        link = etree.Element('link', name=f'group_{i}')
+        etree.SubElement(link, 'pose').text = numbers(group.mass_props.com, precision) + ' 0 0 0'
 
-        com_x, com_y, com_z = group.mass_props.com
-        etree.SubElement(link, 'pose').text = f'{com_x} {com_y} {com_z} 0 0 0'
+        if merged_meshes is not None:
+            insert_merged_meshes(link, f'group_{i}', merged_meshes[i], model_name)
+
+        # every part's orientation in one go
+        part_angles = euler_xyz(np.array([part.transform[:3, :3] for part in group.parts.values()]))
+
+        for (id, part), (roll, pitch, yaw) in zip(group.parts.items(), part_angles):
+            if merged_meshes is not None:
+                if id in collision_shapes:
+                    collision = etree.SubElement(link, 'collision', name=f'{part.identifier}_collision')
+                    insert_collision_shape(collision, collision_shapes[id], part, group, model_name, precision)
+                continue
 
-        for part in group.parts.values():
             # HACK: does link transform always have no rotation?
             (x, y, z) = part.transform[:3, 3] - group.mass_props.com
-            (roll, pitch, yaw) = Rotation.from_matrix(part.transform[:3, :3]).as_euler('xyz')
-            mesh_path = f'model://{model_name}/meshes/{part.identifier}.stl'
+            mesh_path = f'model://{model_name}/meshes/{part.mesh}'
+            collision_mesh_path = f'model://{model_name}/meshes/{collision_meshes.get(part.mesh, part.mesh)}'
 
             visual = etree.SubElement(link, 'visual', name=part.identifier)
-            etree.SubElement(visual, 'pose').text = f'{x} {y} {z} {roll} {pitch} {yaw}'
+            etree.SubElement(visual, 'pose').text = numbers((x, y, z, roll, pitch, yaw), precision)
             geometry = etree.SubElement(visual, 'geometry')
             mesh = etree.SubElement(geometry, 'mesh')
             etree.SubElement(mesh, 'uri').text = mesh_path
 
             collision = etree.SubElement(link, 'collision', name=f'{part.identifier}_collision')
-            etree.SubElement(collision, 'pose').text = f'{x} {y} {z} {roll} {pitch} {yaw}'
-            geometry = etree.SubElement(collision, 'geometry')
-            mesh = etree.SubElement(geometry, 'mesh')
-            etree.SubElement(mesh, 'uri').text = mesh_path
+            if id in collision_shapes:
+                insert_collision_shape(collision, collision_shapes[id], part, group, model_name, precision)
+            else:
+                etree.SubElement(collision, 'pose').text = numbers((x, y, z, roll, pitch, yaw), precision)
+                geometry = etree.SubElement(collision, 'geometry')
+                mesh = etree.SubElement(geometry, 'mesh')
+                etree.SubElement(mesh, 'uri').text = collision_mesh_path
 
         inertial = etree.SubElement(link, 'inertial')
         etree.SubElement(inertial, 'pose').text = f'0 0 0 0 0 0'
-        etree.SubElement(inertial, 'mass').text = str(group.mass_props.mass)
+        etree.SubElement(inertial, 'mass').text = number(group.mass_props.mass, precision)
 
         inertia = etree.SubElement(inertial, 'inertia')
-        etree.SubElement(inertia, 'ixx').text = str(max(0, group.mass_props.inertia[0, 0]))
-        etree.SubElement(inertia, 'ixy').text = str(max(0, group.mass_props.inertia[0, 1]))
-        etree.SubElement(inertia, 'ixz').text = str(max(0, group.mass_props.inertia[0, 2]))
-        etree.SubElement(inertia, 'iyy').text = str(max(0, group.mass_props.inertia[1, 1]))
-        etree.SubElement(inertia, 'iyz').text = str(max(0, group.mass_props.inertia[1, 2]))
-        etree.SubElement(inertia, 'izz').text = str(max(0, group.mass_props.inertia[2, 2]))
-
-def insert_joints(model_element: etree._Element, link_groups: list[LinkGroup], parts: dict[str, Part], mates: dict[str, Mate]):
-    def find_group(part: str) -> int:
-        for i, group in enumerate(link_groups):
-            if part in group.parts:
-                return i
-        
-        return None
-
-    for mate in mates.values():
+        etree.SubElement(inertia, 'ixx').text = number(group.mass_props.inertia[0, 0], precision)
+        etree.SubElement(inertia, 'ixy').text = number(group.mass_props.inertia[0, 1], precision)
+        etree.SubElement(inertia, 'ixz').text = number(group.mass_props.inertia[0, 2], precision)
+        etree.SubElement(inertia, 'iyy').text = number(group.mass_props.inertia[1, 1], precision)
+        etree.SubElement(inertia, 'iyz').text = number(group.mass_props.inertia[1, 2], precision)
+        etree.SubElement(inertia, 'izz').text = number(group.mass_props.inertia[2, 2], precision)
+
+        yield link
+
+def insert_merged_meshes(link: etree._Element, name: str, meshes: tuple[str, str | None], model_name: str):
+    visual_mesh, collision_mesh = meshes
+
+    visual = etree.SubElement(link, 'visual', name=name)
+    etree.SubElement(visual, 'pose').text = '0 0 0 0 0 0'
+    geometry = etree.SubElement(visual, 'geometry')
+    mesh = etree.SubElement(geometry, 'mesh')
+    etree.SubElement(mesh, 'uri').text = f'model://{model_name}/meshes/{visual_mesh}'
+
+    if collision_mesh is not None:
+        collision = etree.SubElement(link, 'collision', name=f'{name}_collision')
+        etree.SubElement(collision, 'pose').text = '0 0 0 0 0 0'
+        geometry = etree.SubElement(collision, 'geometry')
+        mesh = etree.SubElement(geometry, 'mesh')
+        etree.SubElement(mesh, 'uri').text = f'model://{model_name}/meshes/{collision_mesh}'
+
+def insert_collision_shape(collision: etree._Element, shape: CollisionShape, part: Part, group: LinkGroup, model_name: str, precision: int | None = None):
+    transform = np.dot(part.transform, shape.transform)
+    (x, y, z) = transform[:3, 3] - group.mass_props.com
+    (roll, pitch, yaw) = euler_xyz(transform[:3, :3])
+    etree.SubElement(collision, 'pose').text = numbers((x, y, z, roll, pitch, yaw), precision)
+
+    geometry = etree.SubElement(collision, 'geometry')
+    if shape.kind == 'box':
+        box = etree.SubElement(geometry, 'box')
+        etree.SubElement(box, 'size').text = numbers(shape.size, precision)
+    elif shape.kind == 'cylinder':
+        cylinder = etree.SubElement(geometry, 'cylinder')
+        etree.SubElement(cylinder, 'radius').text = number(shape.size[0], precision)
+        etree.SubElement(cylinder, 'length').text = number(shape.size[1], precision)
+    elif shape.kind == 'sphere':
+        sphere = etree.SubElement(geometry, 'sphere')
+        etree.SubElement(sphere, 'radius').text = number(shape.size[0], precision)
+    else:
+        mesh = etree.SubElement(geometry, 'mesh')
+        etree.SubElement(mesh, 'uri').text = f'model://{model_name}/meshes/{shape.mesh}'
+
+def mesh_uris(sdf: etree._ElementTree | etree._Element, model_name: str) -> set[str]:
+    # every mesh the sdf references, relative to the model's meshes directory
+    prefix = f'model://{model_name}/meshes/'
+    return {uri.text.removeprefix(prefix) for uri in sdf.iterfind('.//mesh/uri')}
+
+def replace_mesh_uris(sdf: etree._ElementTree | etree._Element, model_name: str, meshes: dict[str, str]):
+    # points every mesh uri at its exported replacement (paths relative to the model's meshes directory)
+    prefix = f'model://{model_name}/meshes/'
+    for uri in sdf.iterfind('.//mesh/uri'):
+        mesh = uri.text.removeprefix(prefix)
+        if mesh in meshes:
+            uri.text = prefix + meshes[mesh]
+
+def joint_elements(link_groups: list[LinkGroup], group_index: dict[str, int], parts: dict[str, Part], mates: dict[str, Mate], precision: int | None = None) -> Iterator[etree._Element]:
+    for mate_id, mate in mates.items():
         if mate.kind != 'FASTENED':
+            if mate.parent not in group_index or mate.child not in group_index:
+                print(f'Skipping joint {mate.kind} {mate_id}: parts missing from the assembly')
+                continue
+
             print(f'Joint {mate.kind}: {parts[mate.parent].identifier} -> {parts[mate.child].identifier}')
+            count('joints')
 
             parent_identifier = parts[mate.parent].identifier
             child_identifier = parts[mate.child].identifier
 
-            parent_group = find_group(mate.parent)
-            child_group = find_group(mate.child)
+            parent_group = group_index[mate.parent]
+            child_group = group_index[mate.child]
 
-            joint = etree.SubElement(model_element, 'joint', name=f'{child_identifier}_joint', type=mate.kind.lower())
+            joint = etree.Element('joint', name=f'{child_identifier}_joint', type=mate.kind.lower())
 
             # local_transform = np.identity(4)
             # local_transform[:3, 3] = mate.origin
@@ -141,8 +432,8 @@ def insert_joints(model_element: etree._Element, link_groups: list[LinkGroup], p
 
             # (x, y, z) = transform[:3, 3] # same as (0, 0, 0)?
             (x, y, z) = (link_groups[parent_group].parts[mate.parent].transform[:3, 3] + np.dot(link_groups[parent_group].parts[mate.parent].transform[:3, :3], mate.origin)) - link_groups[child_group].mass_props.com
-            (roll, pitch, yaw) = Rotation.from_matrix(np.dot(link_groups[parent_group].parts[mate.parent].transform[:3, :3], mate.rotation)).as_euler('xyz')
-            etree.SubElement(joint, 'pose').text = f'{x} {y} {z} {roll} {pitch} {yaw}'
+            (roll, pitch, yaw) = euler_xyz(np.dot(link_groups[parent_group].parts[mate.parent].transform[:3, :3], mate.rotation))
+            etree.SubElement(joint, 'pose').text = numbers((x, y, z, roll, pitch, yaw), precision)
 
             etree.SubElement(joint, 'parent').text = f'group_{parent_group}'
             etree.SubElement(joint, 'child').text = f'group_{child_group}'
@@ -157,12 +448,14 @@ def insert_joints(model_element: etree._Element, link_groups: list[LinkGroup], p
             limit = etree.SubElement(axis, 'limit')
             # TODO: review, use ±7 as default values as ±7 radians is outside the ± 365 degree range, need equivalent of rust option
             if mate.limits['lower'] > -7:
-                etree.SubElement(limit, 'lower').text = f'{mate.limits['lower']}'
+                etree.SubElement(limit, 'lower').text = number(mate.limits['lower'], precision)
             if mate.limits['upper'] < 7:
-                etree.SubElement(limit, 'upper').text = f'{mate.limits['upper']}'
+                etree.SubElement(limit, 'upper').text = number(mate.limits['upper'], precision)
             etree.SubElement(limit, 'effort').text = '1'
             etree.SubElement(limit, 'velocity').text = '20'
 
             dynamics = etree.SubElement(axis, 'dynamics')
             etree.SubElement(dynamics, 'friction').text = '0.1'
             etree.SubElement(dynamics, 'damping').text = '0.1'
+
+            yield joint
@@ -1,44 +1,215 @@
+import hashlib
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
+from fnmatch import fnmatch
+from itertools import batched
 from pathlib import Path
+from typing import TYPE_CHECKING
 
 import numpy as np
-from api import Client
+from cache import temporary_path
+from mesh import read_stl, volume_properties
+from responses import collection_paused
+from tracing import count, span
 
-import pprint as pp
+if TYPE_CHECKING:
+    from api import Client
 
-def fetch_assembly(client: Client, document_id: str, workspace_id: str, element_id: str, meshes_path: Path) -> tuple[dict[str, 'Part'], dict[str, 'Mate']]:    
+def fetch_assembly(client: 'Client', document_id: str, workspace_id: str, element_id: str, meshes_path: Path, max_workers: int = 8, known_mass_props: dict[tuple[str, str, str, str], 'MassProperties'] | None = None, densities: dict[str, float] | None = None) -> tuple[dict[str, 'Part'], dict[str, 'Mate']]:    
     print('Fetching assembly')
-    assembly = client.get_assembly(document_id, workspace_id, element_id)
-    assembly_features = client.get_assembly_features(document_id, workspace_id, element_id)
+    with span('assembly'), collection_paused():
+        assembly = flatten_assembly(client.get_assembly(document_id, workspace_id, element_id))
+        assembly_features = get_joint_features(client, assembly, document_id, workspace_id, element_id, max_workers)
+    print('Downloading part meshes')
+    with span('meshes'):
+        meshes = download_part_meshes(client, assembly, meshes_path, max_workers)
     print('Fetching mass properties')
-    mass_props = get_mass_properties(assembly, client)
+    with span('mass properties'):
+        computed = mesh_mass_properties(assembly, meshes, meshes_path, densities) if densities else {}
+        mass_props = get_mass_properties(assembly, client, max_workers, dict(known_mass_props or {}) | computed)
+
+    with span('extract'):
+        parts = extract_parts(assembly, mass_props, meshes)
+        # so they are never mistaken for the api's by the next import
+        for part in parts.values():
+            if part.definition in computed:
+                part.mass_source = 'mesh'
+        mates = extract_mates(assembly)
+    count('parts', len(parts))
+    count('mates', len(mates))
+
+    with span('joint limits'):
+        apply_joint_limits(mates, assembly_features)
+
+    return parts, mates
+
+FEATURE_BATCH = 100
+
+# onshape quantity units in si (radians and meters)
+UNITS = {
+    'rad': 1.0, 'radian': 1.0, 'radians': 1.0, 'deg': np.pi / 180, 'degree': np.pi / 180, 'degrees': np.pi / 180,
+    'm': 1.0, 'meter': 1.0, 'meters': 1.0, 'cm': 0.01, 'centimeter': 0.01, 'centimeters': 0.01,
+    'mm': 0.001, 'millimeter': 0.001, 'millimeters': 0.001, 'in': 0.0254, 'inch': 0.0254, 'inches': 0.0254,
+    'ft': 0.3048, 'foot': 0.3048, 'feet': 0.3048, 'yd': 0.9144, 'yard': 0.9144, 'yards': 0.9144,
+}
+CONSTANTS = {'pi': np.pi}
+TOKEN = re.compile(r'\s*(?:((?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)|([A-Za-z_]\w*)|(\S))')
+
+def parse_quantity(expression: str) -> float:
+    # the value of a quantity expression like '45 deg', '-0.5 rad', '1 ft + 3 in' or '(pi / 4) rad' in si units,
+    # raises ValueError for anything else (e.g. variables). a unit only ever directly follows a number, a constant or
+    # parentheses, and applies to just that
+    tokens = TOKEN.findall(expression)
+    position = 0
+
+    def peek() -> tuple[str, str, str] | None:
+        return tokens[position] if position < len(tokens) else None
 
-    parts = extract_parts(assembly, mass_props)
-    mates = extract_mates(assembly)
+    def take() -> tuple[str, str, str]:
+        nonlocal position
+        if position == len(tokens):
+            raise ValueError(f'Unexpected end of {expression!r}')
+        position += 1
+        return tokens[position - 1]
 
-    # print("\n\n\n                  --------------\n\ngetting assembly features")
-    for feature in assembly_features['features']:
+    def unit(value: float) -> float:
+        token = peek()
+        if token is not None and token[1] in UNITS:
+            take()
+            return value * UNITS[token[1]]
+        return value
+
+    def factor() -> float:
+        number, name, symbol = take()
+        if symbol in ('-', '+'):
+            return -factor() if symbol == '-' else factor()
+        if symbol == '(':
+            value = sum_()
+            if take()[2] != ')':
+                raise ValueError(f'Unbalanced parentheses in {expression!r}')
+            return unit(value)
+        if number:
+            return unit(float(number))
+        if name in CONSTANTS:
+            return unit(CONSTANTS[name])
+        raise ValueError(f'Unexpected {name or symbol!r} in {expression!r}')
+
+    def product() -> float:
+        value = factor()
+        while (token := peek()) is not None and token[2] in ('*', '/'):
+            value = value * factor() if take()[2] == '*' else value / factor()
+        return value
+
+    def sum_() -> float:
+        value = product()
+        while (token := peek()) is not None and token[2] in ('+', '-'):
+            value += product() if take()[2] == '+' else -product()
+        return value
+
+    value = sum_()
+    if peek() is not None:
+        raise ValueError(f'Unexpected {"".join(take())!r} in {expression!r}')
+
+    return value
+
+def apply_joint_limits(mates: dict[str, 'Mate'], features: dict):
+    for feature in features['features']:
+        # each feature's parameters are indexed once, they are looked up by id
+        parameters = {parameter['parameterId']: parameter for parameter in feature['parameters']}
+        mate = mates.get(feature['featureId'])
+        if mate is None:
+            continue
 
-        # get joint limits (could also hardcode the index since it should always be the same from the api) 
         # TODO: review, should we rely on onshape api? and can limits ever be 0.0?
-        min_z_index = next((i for i, e in enumerate(feature['parameters']) if e['parameterId'] == 'limitAxialZMin'), None)
-        if min_z_index:
-            lower = float(feature['parameters'][min_z_index]['expression'][:-3]) * (np.pi / 180)
-            if lower != 0.0:
-                mates[feature['featureId']].limits['lower'] = lower
-        
-        max_z_index = next((i for i, e in enumerate(feature['parameters']) if e['parameterId'] == 'limitAxialZMax'), None)
-        if max_z_index:
-            upper = float(feature['parameters'][max_z_index]['expression'][:-3]) * (np.pi / 180)
-            if upper != 0.0:
-                mates[feature['featureId']].limits['upper'] = upper
-
-
-    # uncomment when making changes in onshape
-    print('Downloading part meshes')
-    # download_part_meshes(client, assembly, meshes_path)
+        for key, parameter_id in (('lower', 'limitAxialZMin'), ('upper', 'limitAxialZMax')):
+            parameter = parameters.get(parameter_id)
+            if parameter is None or parameter.get('expression') is None:
+                continue
 
-    return parts, mates
+            try:
+                limit = parse_quantity(parameter['expression'])
+            except (ValueError, ZeroDivisionError) as error:
+                print(f'Ignoring {key} limit of {mate.kind.lower()} mate {feature["featureId"]}: {error}')
+                continue
+
+            if limit != 0.0:
+                mate.limits[key] = limit
+
+def subassembly_definition(data: dict) -> tuple[str, str, str, str]:
+    return (data['documentId'], data['documentMicroversion'], data['elementId'], data.get('fullConfiguration', 'default'))
+
+@dataclass
+class Expansion:
+    # every part and mate below an assembly, with occurrence paths relative to it
+    parts: list[tuple[tuple[str, ...], dict]]
+    # the path of the subassembly each mate is in, and the definition it comes from (None for the root)
+    mates: list[tuple[tuple[str, ...], tuple[str, str, str, str] | None, dict]]
+
+def expand_assembly(assembly: dict, subassemblies: dict[tuple[str, str, str, str], dict], expansions: dict[tuple[str, str, str, str], Expansion], definition: tuple[str, str, str, str] | None = None) -> Expansion:
+    # each subassembly definition is expanded once and reused for every instance of it, at any depth
+    parts, mates = [], [((), definition, feature) for feature in assembly['features']]
+    for data in assembly['instances']:
+        if data.get('suppressed'):
+            continue
+        if data['type'] == 'Part':
+            parts.append(((data['id'],), data))
+        elif data['type'] == 'Assembly':
+            key = subassembly_definition(data)
+            if key not in expansions:
+                expansions[key] = expand_assembly(subassemblies[key], subassemblies, expansions, key)
+
+            # names are prefixed so parts of different instances get different identifiers
+            prefix = (data['id'],)
+            parts += [(prefix + path, part | {'name': f'{data["name"]} {part["name"]}'}) for path, part in expansions[key].parts]
+            mates += [(prefix + path, source, feature) for path, source, feature in expansions[key].mates]
+
+    return Expansion(parts, mates)
+
+def flatten_assembly(assembly: dict) -> dict:
+    # replaces subassemblies by their parts and mates. instances are identified by their occurrence path joined with
+    # '/', so parts and mates of the root keep their ids, and each mate records the definition and feature it came from
+    root = assembly['rootAssembly']
+    subassemblies = {subassembly_definition(data): data for data in assembly.get('subAssemblies', [])}
+    expansions = {}
+    expansion = expand_assembly(root, subassemblies, expansions)
+    count('subassembly definitions', len(expansions))
+
+    # occurrence transforms are already relative to the root at every depth
+    transforms = {tuple(data['path']): data['transform'] for data in root['occurrences']}
+    instances = [part | {'id': '/'.join(path)} for path, part in expansion.parts]
+    occurrences = [{'path': ['/'.join(path)], 'transform': transforms[path]} for path, _ in expansion.parts]
+    features = [{
+        'id': '/'.join(path + (feature['id'],)),
+        'source': (definition, feature['id']),
+        'featureData': feature['featureData'] | {'matedEntities': [entity | {'matedOccurrence': ['/'.join(path + tuple(entity['matedOccurrence']))]} for entity in feature['featureData']['matedEntities']]},
+    } for path, definition, feature in expansion.mates]
+
+    return {'rootAssembly': {'instances': instances, 'occurrences': occurrences, 'features': features}}
+
+def get_joint_features(client: 'Client', assembly: dict, document_id: str, workspace_id: str, element_id: str, max_workers: int = 8) -> dict:
+    # only joints have limits, so only their features are fetched. a mate's feature is in the (sub)assembly it's in,
+    # and is fetched once however many times that subassembly is instanced, a few at a time so the urls stay short
+    sources = {}
+    for feature in assembly['rootAssembly']['features']:
+        if feature['featureData']['mateType'] != 'FASTENED':
+            definition, feature_id = feature['source']
+            sources.setdefault(definition, {}).setdefault(feature_id, []).append(feature['id'])
+
+    batches = [(definition, list(batch)) for definition, ids in sources.items() for batch in batched(ids, FEATURE_BATCH)]
+
+    def fetch(definition: tuple[str, str, str, str] | None, feature_ids: list[str]) -> dict:
+        if definition is None:
+            return client.get_assembly_features(document_id, workspace_id, element_id, feature_ids)
+        return client.get_subassembly_features(*definition, feature_ids)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        responses = list(executor.map(lambda batch: fetch(*batch), batches))
+
+    # every instance of a mate shares its feature, features that weren't asked for are skipped
+    return {'features': [feature | {'featureId': id} for (definition, _), response in zip(batches, responses) for feature in response['features'] for id in sources[definition].get(feature['featureId'], [])]}
 
 def part_identifier(name: str):
     clean = name.replace('<', '').replace('>', '')
@@ -64,33 +235,180 @@ class MassProperties:
     def from_data(cls, data):
         return cls(data['mass'][0], np.reshape(data['centroid'][:3], 3), np.reshape(data['inertia'][:9], (3, 3)))
 
-def get_mass_properties(assembly: dict, client: Client) -> dict[str, MassProperties]:
-    mass_props = {}
+    @classmethod
+    def from_mesh(cls, path: Path, density: float | None = None, mass: float | None = None):
+        volume, com, inertia = volume_properties(read_stl(path))
+        if mass is None:
+            mass = density * volume
+
+        return cls(mass, com, inertia * mass / volume)
+
+    def to_data(self) -> dict:
+        return {'mass': [float(self.mass)], 'centroid': self.com.tolist(), 'inertia': self.inertia.flatten().tolist()}
+
+@dataclass
+class MassPropertiesArray:
+    # structure of arrays for many parts at once, indexing gives a MassProperties view onto a row
+    mass: np.ndarray
+    com: np.ndarray
+    inertia: np.ndarray
+
+    @classmethod
+    def stack(cls, mass_props: list[MassProperties]) -> 'MassPropertiesArray':
+        return cls(np.array([props.mass for props in mass_props], dtype=np.float64).reshape(-1), np.array([props.com for props in mass_props], dtype=np.float64).reshape(-1, 3), np.array([props.inertia for props in mass_props], dtype=np.float64).reshape(-1, 3, 3))
+
+    def __len__(self) -> int:
+        return len(self.mass)
+
+    def __getitem__(self, index: int) -> MassProperties:
+        return MassProperties(float(self.mass[index]), self.com[index], self.inertia[index])
+
+    def apply_transforms(self, transforms: np.ndarray) -> 'MassPropertiesArray':
+        rotations = transforms[:, :3, :3]
+        com = np.einsum('nij,nj->ni', rotations, self.com) + transforms[:, :3, 3]
+        inertia = np.einsum('nij,njk,nlk->nil', rotations, self.inertia, rotations, optimize=True)
+        return MassPropertiesArray(self.mass, com, inertia)
+
+    def reduce(self, starts: np.ndarray) -> 'MassPropertiesArray':
+        # combines consecutive runs of rows into one rigid body each, runs begin at starts
+        mass = np.add.reduceat(self.mass, starts)
+        com = np.add.reduceat(self.mass[:, None] * self.com, starts) / mass[:, None]
+
+        # parallel axis theorem about each run's combined com
+        offsets = self.com - np.repeat(com, np.diff(np.append(starts, len(self))), axis=0)
+        squared = np.einsum('ni,ni->n', offsets, offsets)
+        shifted = self.inertia + self.mass[:, None, None] * (squared[:, None, None] * np.identity(3) - np.einsum('ni,nj->nij', offsets, offsets))
+        return MassPropertiesArray(mass, com, np.add.reduceat(shifted, starts))
+
+def part_definition(data: dict) -> tuple[str, str, str, str]:
+    return (data['documentId'], data['documentMicroversion'], data['elementId'], data['partId'])
+
+def get_mass_properties(assembly: dict, client: 'Client', max_workers: int = 8, known: dict[tuple[str, str, str, str], MassProperties] | None = None) -> dict[str, MassProperties]:
+    instances = assembly['rootAssembly']['instances']
+    known = known or {}
+    # repeated parts (fasteners, props) share a definition, so each one is only fetched once,
+    # and definitions from a previous import never change so they aren't fetched at all
+    definitions = [definition for definition in dict.fromkeys(part_definition(data) for data in instances) if definition not in known]
+
+    def fetch(definition: tuple[str, str, str, str]) -> MassProperties:
+        mass_data = client.get_mass_properties(*definition)
+        return MassProperties.from_data(next(iter(mass_data['bodies'].values())))
 
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        fetched = known | dict(zip(definitions, executor.map(fetch, definitions)))
+
+    count('mass properties fetched', len(definitions))
+    print(f'Fetched {len(definitions)} mass properties, {len(set(map(part_definition, instances))) - len(definitions)} reused')
+    return {data['id']: fetched[part_definition(data)] for data in instances}
+
+def mesh_mass_properties(assembly: dict, meshes: dict[tuple[str, str, str, str], str], meshes_path: Path, densities: dict[str, float]) -> dict[tuple[str, str, str, str], MassProperties]:
+    # parts of a known material (by identifier pattern) are computed from their mesh instead of asking the api
+    mass_props = {}
+    tried = set()
     for data in assembly['rootAssembly']['instances']:
-        mass_data = client.get_mass_properties(data['documentId'], data['documentMicroversion'], data['elementId'], data['partId'])
-        mass_props[data['id']] = MassProperties.from_data(next(iter(mass_data['bodies'].values())))
+        definition = part_definition(data)
+        density = next((density for pattern, density in densities.items() if fnmatch(part_identifier(data['name']), pattern)), None)
+        if density is not None and definition not in tried:
+            tried.add(definition)
+            try:
+                mass_props[definition] = MassProperties.from_mesh(Path(meshes_path, meshes[definition]), density=density)
+            except ValueError as error:
+                # left for the api
+                print(f'Fetching the mass properties of {part_identifier(data["name"])} instead: {error}')
 
+    print(f'Computed {len(mass_props)} mass properties from meshes')
     return mass_props
 
-def download_part_meshes(client: Client, assembly: dict, meshes_path: Path):
-    for data in assembly['rootAssembly']['instances']:
-        mesh = client.get_parts_stl(data['documentId'], data['documentMicroversion'], data['elementId'], data['partId'])
+def check_mass_properties(parts: dict[str, 'Part'], meshes_path: Path):
+    # compares onshape's mass properties with ones computed from the meshes at the same mass
+    print(f'{"part":<40} {"density":>10} {"com error mm":>12} {"inertia error":>13}')
+    checked = set()
+    for part in parts.values():
+        if part.mesh in checked:
+            continue
+        checked.add(part.mesh)
+
+        try:
+            volume, com, inertia = volume_properties(read_stl(Path(meshes_path, part.mesh)))
+        except ValueError as error:
+            print(f'{part.identifier:<40} {error}')
+            continue
+
+        density = part.mass_props.mass / volume
+        com_error = np.linalg.norm(com - part.mass_props.com) * 1e3
+        inertia_error = np.linalg.norm(inertia * density - part.mass_props.inertia) / max(np.linalg.norm(part.mass_props.inertia), 1e-12)
+        print(f'{part.identifier:<40} {density:>10.1f} {com_error:>12.3f} {inertia_error:>13.2%}')
+
+# downloaded meshes and the files exported from them
+MESH_NAME = re.compile(r'([0-9a-f]{16})(_q\d+)?\.(stl|obj)')
+
+def content_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(1 << 20):
+            digest.update(chunk)
+
+    return digest.hexdigest()[:16]
+
+def download_part_meshes(client: 'Client', assembly: dict, meshes_path: Path, max_workers: int = 8) -> dict[tuple[str, str, str, str], str]:
+    # meshes are downloaded once per part definition and stored by content hash, so identical parts share one file,
+    # the manifest records which microversion (and etag) each definition's mesh came from so unchanged meshes are skipped
+    manifest_path = Path(meshes_path, 'manifest.json')
+    manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() else {}
+    definitions = list(dict.fromkeys(part_definition(data) for data in assembly['rootAssembly']['instances']))
+
+    def download(definition: tuple[str, str, str, str]) -> tuple[dict, bool]:
+        did, mid, eid, pid = definition
+        entry = manifest.get(f'{did}/{eid}/{pid}')
+        if entry is not None and not Path(meshes_path, entry['mesh']).exists():
+            entry = None
+        if entry is not None and entry['microversion'] == mid:
+            return entry, False
+
+        download_path = Path(meshes_path, f'.{hashlib.sha1(repr(definition).encode()).hexdigest()[:16]}.download')
+        download_path.unlink(missing_ok=True)
+        etag = client.download_parts_stl(*definition, download_path, etag=entry['etag'] if entry is not None else None)
+        if not download_path.exists():
+            # not modified since the microversion we already have
+            return entry | {'microversion': mid}, False
+
+        mesh = f'{content_hash(download_path)}.stl'
+        os.replace(download_path, Path(meshes_path, mesh))
+        return {'microversion': mid, 'etag': etag, 'mesh': mesh}, True
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = dict(zip(definitions, executor.map(download, definitions)))
+
+    manifest = {f'{did}/{eid}/{pid}': entry for (did, _, eid, pid), (entry, _) in results.items()}
+    temporary = temporary_path(manifest_path)
+    temporary.write_text(json.dumps(manifest, indent=2))
+    os.replace(temporary, manifest_path)
+
+    meshes = {definition: entry['mesh'] for definition, (entry, _) in results.items()}
+    for path in meshes_path.iterdir():
+        if (match := MESH_NAME.fullmatch(path.name)) and f'{match.group(1)}.stl' not in meshes.values():
+            path.unlink()
 
-        with open(Path(meshes_path, part_identifier(data['name'])).with_suffix('.stl'), 'wb') as f:
-            f.write(mesh)
+    downloaded = sum(changed for _, changed in results.values())
+    count('meshes downloaded', downloaded)
+    print(f'Updated {downloaded} meshes, {len(definitions) - downloaded} unchanged, {len(set(meshes.values()))} unique')
+    return meshes
 
 @dataclass
 class Part:
     identifier: str
     transform: np.ndarray
     mass_props: MassProperties
+    definition: tuple[str, str, str, str]
+    mesh: str
+    # 'api', or 'mesh' when computed from the mesh with a --density
+    mass_source: str = 'api'
 
-def extract_parts(assembly: dict, mass_props: dict[str, MassProperties]) -> dict[str, Part]:
+def extract_parts(assembly: dict, mass_props: dict[str, MassProperties], meshes: dict[tuple[str, str, str, str], str]) -> dict[str, Part]:
     # for data in assembly['rootAssembly']['occurrences']:
     #     print('\n\n\n\nhello', data['transform'], np.reshape(data['transform'], (4, 4)))
     part_transforms = {data['path'][0]: np.reshape(data['transform'], (4, 4)) for data in assembly['rootAssembly']['occurrences']}
-    return {data['id']: Part(part_identifier(data['name']), part_transforms[data['id']], mass_props[data['id']]) for data in assembly['rootAssembly']['instances']}
+    return {data['id']: Part(part_identifier(data['name']), part_transforms[data['id']], mass_props[data['id']], part_definition(data), meshes[part_definition(data)]) for data in assembly['rootAssembly']['instances']}
 
 @dataclass
 class Mate:
@@ -0,0 +1,134 @@
+import gc
+import json
+import re
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+# assembly and features responses run to tens of megabytes, nearly all of it (configurations, queries, parameters of
+# every feature) never read. rather than building the whole object tree, they are decoded one array element at a
+# time from the response text, and each element is cut down to the fields the import uses before the next is read.
+# specs mirror the response: a dict descends into an object (keys not in it are skipped), a function is applied to
+# every element of an array and elements it returns None for are dropped
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+_decoder = json.JSONDecoder()
+
+def fields(*keys: str) -> Callable[[dict], dict]:
+    return lambda element: {key: element[key] for key in keys if key in element}
+
+def mate_feature(element: dict) -> dict | None:
+    data = element.get('featureData', {})
+    if 'matedEntities' not in data:
+        return None
+
+    return {'id': element['id'], 'featureData': {'mateType': data['mateType'], 'matedEntities': [{'matedOccurrence': entity['matedOccurrence'], 'matedCS': entity['matedCS']} for entity in data['matedEntities']]}}
+
+LIMIT_PARAMETERS = {'limitAxialZMin', 'limitAxialZMax'}
+
+def limit_feature(element: dict) -> dict | None:
+    parameters = [{'parameterId': parameter['parameterId'], 'expression': parameter.get('expression')} for parameter in element.get('parameters', []) if parameter['parameterId'] in LIMIT_PARAMETERS]
+    return {'featureId': element['featureId'], 'parameters': parameters} if parameters else None
+
+instance = fields('id', 'name', 'type', 'suppressed', 'documentId', 'documentMicroversion', 'elementId', 'partId', 'fullConfiguration')
+
+def subassembly(element: dict) -> dict:
+    # one per subassembly definition, its instances and mates are relative to it
+    features = [feature for feature in map(mate_feature, element.get('features', [])) if feature is not None]
+    return fields('documentId', 'documentMicroversion', 'elementId', 'fullConfiguration')(element) | {'instances': list(map(instance, element['instances'])), 'features': features}
+
+ASSEMBLY = {
+    'rootAssembly': {
+        'instances': instance,
+        'occurrences': fields('path', 'transform'),
+        'features': mate_feature,
+    },
+    'subAssemblies': subassembly,
+}
+FEATURES = {'features': limit_feature}
+
+@contextmanager
+def collection_paused() -> Iterator[None]:
+    # decoding creates no reference cycles, so the cycle collector only slows it down by scanning every new container.
+    # the collector is process wide, so it is paused by the one thread waiting on all the decoding, never by the
+    # decoding threads themselves (interleaved, they can leave it off for good)
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+def select(text: str, spec: dict) -> dict:
+    value, end = _select(text, _skip_whitespace(text, 0), spec)
+    if _skip_whitespace(text, end) != len(text):
+        raise json.JSONDecodeError('Extra data', text, end)
+
+    return value
+
+def _skip_whitespace(text: str, index: int) -> int:
+    return WHITESPACE.match(text, index).end()
+
+def _expect(text: str, index: int, character: str) -> int:
+    if text[index:index + 1] != character:
+        raise json.JSONDecodeError(f'Expecting {character!r}', text, index)
+
+    return _skip_whitespace(text, index + 1)
+
+def _key(text: str, index: int) -> tuple[str, int]:
+    # an object key and the index of its value
+    if text[index:index + 1] != '"':
+        raise json.JSONDecodeError('Expecting property name enclosed in double quotes', text, index)
+
+    key, index = json.decoder.scanstring(text, index + 1)
+    return key, _expect(text, _skip_whitespace(text, index), ':')
+
+def _container(text: str, index: int, member: Callable[[int], int]) -> int:
+    # calls member with the index of each member of the object or array at index, it returns where the member ends.
+    # returns the index after the closing bracket
+    closing = '}' if text[index:index + 1] == '{' else ']'
+    index = _skip_whitespace(text, index + 1)
+    if text[index:index + 1] == closing:
+        return index + 1
+
+    while True:
+        index = _skip_whitespace(text, member(index))
+        if text[index:index + 1] == closing:
+            return index + 1
+        index = _expect(text, index, ',')
+
+def _select(text: str, index: int, spec) -> tuple[object, int]:
+    if isinstance(spec, dict) and text[index:index + 1] == '{':
+        value = {}
+
+        def member(index: int) -> int:
+            key, index = _key(text, index)
+            if key not in spec:
+                return _skip(text, index)
+            value[key], index = _select(text, index, spec[key])
+            return index
+
+        return value, _container(text, index, member)
+
+    if callable(spec) and text[index:index + 1] == '[':
+        records = []
+
+        def element(index: int) -> int:
+            data, index = _decoder.raw_decode(text, index)
+            if (record := spec(data)) is not None:
+                records.append(record)
+            return index
+
+        return records, _container(text, index, element)
+
+    # not the shape the spec expects (e.g. null), kept as it is
+    return _decoder.raw_decode(text, index)
+
+def _skip(text: str, index: int) -> int:
+    # large unused values (subassemblies, part lists) are decoded and dropped a member at a time
+    if text[index:index + 1] == '{':
+        return _container(text, index, lambda index: _skip(text, _key(text, index)[1]))
+    if text[index:index + 1] == '[':
+        return _container(text, index, lambda index: _decoder.raw_decode(text, index)[1])
+
+    return _decoder.raw_decode(text, index)[1]
@@ -0,0 +1,108 @@
+import multiprocessing
+import random
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+class TokenBucket:
+    def __init__(self, rate: float | None, burst: int = 1, shared: bool = False):
+        self._rate = rate
+        self._burst = max(burst, 1)
+        # tokens, last refill and blocked until. shared buckets keep these in shared memory so every process
+        # started with the bucket draws from the same budget (the monotonic clock is system wide)
+        state = [float(self._burst), time.monotonic(), 0.0]
+        if shared:
+            self._state = multiprocessing.Array('d', state)
+            self._lock = self._state.get_lock()
+        else:
+            self._state = state
+            self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                tokens, updated, blocked_until = self._state[:]
+                if now >= blocked_until:
+                    if self._rate is None:
+                        return
+
+                    tokens = min(self._burst, tokens + (now - updated) * self._rate)
+                    self._state[0], self._state[1] = tokens, now
+                    if tokens >= 1:
+                        self._state[0] = tokens - 1
+                        return
+
+                    wait = (1 - tokens) / self._rate
+                else:
+                    wait = blocked_until - now
+
+            time.sleep(wait)
+
+    def block(self, seconds: float):
+        # the server asked everyone to back off, not just the request that got told
+        with self._lock:
+            blocked_until = max(self._state[2], time.monotonic() + seconds)
+            self._state[:] = [0.0, blocked_until, blocked_until]
+
+def retry_after(value: str | None) -> float | None:
+    if value is None:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def backoff(attempt: int, base: float = 0.5, cap: float = 30.0) -> float:
+    # full jitter, so concurrent workers that failed together don't retry together
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+@dataclass
+class EndpointStats:
+    requests: int = 0
+    retries: int = 0
+    failures: int = 0
+    total_latency: float = 0.0
+    max_latency: float = 0.0
+
+    @property
+    def mean_latency(self) -> float:
+        return self.total_latency / self.requests if self.requests else 0.0
+
+class RequestStats:
+    def __init__(self):
+        self.endpoints: dict[str, EndpointStats] = {}
+        self._lock = threading.Lock()
+
+    def _endpoint(self, endpoint: str) -> EndpointStats:
+        return self.endpoints.setdefault(endpoint, EndpointStats())
+
+    def record(self, endpoint: str, latency: float):
+        with self._lock:
+            stats = self._endpoint(endpoint)
+            stats.requests += 1
+            stats.total_latency += latency
+            stats.max_latency = max(stats.max_latency, latency)
+
+    def retry(self, endpoint: str):
+        with self._lock:
+            self._endpoint(endpoint).retries += 1
+
+    def failure(self, endpoint: str):
+        with self._lock:
+            self._endpoint(endpoint).failures += 1
+
+    def __str__(self) -> str:
+        lines = [f'{"endpoint":<56} {"requests":>8} {"retries":>8} {"failures":>8} {"mean ms":>8} {"max ms":>8}']
+        for endpoint, stats in sorted(self.endpoints.items()):
+            lines.append(f'{endpoint:<56} {stats.requests:>8} {stats.retries:>8} {stats.failures:>8} {stats.mean_latency * 1e3:>8.1f} {stats.max_latency * 1e3:>8.1f}')
+
+        return '\n'.join(lines)
@@ -0,0 +1,62 @@
+import json
+import os
+from functools import cached_property
+from pathlib import Path
+
+import numpy as np
+
+from cache import temporary_path
+from onshape import MassPropertiesArray, Mate, Part
+
+# a fetched assembly as one uncompressed npz: every number in stacked arrays, and a small json index (also inside the
+# npz) with the identifiers, definitions (with their source microversions) and meshes. members are only read when
+# first used, and parts and mates are views into the arrays rather than many small copies
+
+SNAPSHOT_VERSION = 2
+
+def save_snapshot(path: Path, parts: dict[str, Part], mates: dict[str, Mate]):
+    index = {
+        'version': SNAPSHOT_VERSION,
+        'parts': {'ids': list(parts), 'identifiers': [part.identifier for part in parts.values()], 'definitions': [list(part.definition) for part in parts.values()], 'meshes': [part.mesh for part in parts.values()], 'mass_sources': [part.mass_source for part in parts.values()]},
+        'mates': {'ids': list(mates), 'parents': [mate.parent for mate in mates.values()], 'children': [mate.child for mate in mates.values()], 'kinds': [mate.kind for mate in mates.values()]},
+    }
+    mass_props = MassPropertiesArray.stack([part.mass_props for part in parts.values()])
+
+    temporary = temporary_path(path)
+    with open(temporary, 'wb') as f:
+        np.savez(
+            f,
+            index=np.frombuffer(json.dumps(index).encode(), dtype=np.uint8),
+            part_transforms=np.array([part.transform for part in parts.values()], dtype=np.float64).reshape(-1, 4, 4),
+            part_mass=mass_props.mass,
+            part_com=mass_props.com,
+            part_inertia=mass_props.inertia,
+            mate_origins=np.array([mate.origin for mate in mates.values()], dtype=np.float64).reshape(-1, 3),
+            mate_rotations=np.array([mate.rotation for mate in mates.values()], dtype=np.float64).reshape(-1, 3, 3),
+            mate_limits=np.array([[mate.limits['lower'], mate.limits['upper']] for mate in mates.values()], dtype=np.float64).reshape(-1, 2),
+        )
+    os.replace(temporary, path)
+
+class Snapshot:
+    def __init__(self, path: Path):
+        self._arrays = np.load(path)
+        self.index = json.loads(self._arrays['index'].tobytes())
+        if self.index.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(f'{path} is a version {self.index.get("version")} snapshot, expected {SNAPSHOT_VERSION}, fetch the assembly again')
+
+    @cached_property
+    def mass_props(self) -> MassPropertiesArray:
+        return MassPropertiesArray(self._arrays['part_mass'], self._arrays['part_com'], self._arrays['part_inertia'])
+
+    @cached_property
+    def parts(self) -> dict[str, Part]:
+        index = self.index['parts']
+        transforms = self._arrays['part_transforms']
+        mass_props = self.mass_props
+        return {id: Part(identifier, transforms[i], mass_props[i], tuple(definition), mesh, source) for i, (id, identifier, definition, mesh, source) in enumerate(zip(index['ids'], index['identifiers'], index['definitions'], index['meshes'], index['mass_sources']))}
+
+    @cached_property
+    def mates(self) -> dict[str, Mate]:
+        index = self.index['mates']
+        origins, rotations, limits = self._arrays['mate_origins'], self._arrays['mate_rotations'], self._arrays['mate_limits'].tolist()
+        return {id: Mate(parent, child, kind, origins[i], rotations[i], {'lower': limits[i][0], 'upper': limits[i][1]}) for i, (id, parent, child, kind) in enumerate(zip(index['ids'], index['parents'], index['children'], index['kinds']))}
@@ -0,0 +1,205 @@
+import io
+import itertools
+import json
+import os
+import time
+from argparse import Namespace
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from dataclasses import dataclass, fields, replace
+from pathlib import Path
+
+import numpy as np
+from lxml import etree
+
+from airframe import create_airframe_config
+from batch import load_manifest
+from gazebo import CHANNEL, ROTOR, create_gazebo_config, insert_gazebo_plugins
+from inertia import condition_inertias
+from main import create_parser, import_model, write_tree
+from model import collect_part_groups, link_group_mass_properties, link_joints, number, numbers, part_group_index
+from onshape import MassProperties, MassPropertiesArray, Mate, Part
+from snapshot import Snapshot
+
+# many variants of one model for monte carlo runs, from a parameter grid or random samples, e.g.
+#
+#   samples = 1000                                      # leave out for every combination of the values instead
+#   seed = 0
+#   [parameters]
+#   mass_scale = {uniform = [0.9, 1.1]}                 # every link's mass and inertia
+#   inertia_scale = {normal = [1.0, 0.05]}              # every link's inertia, [mean, standard deviation]
+#   com_offset = {normal = [0, 0.002]}                  # moves every link's center of mass (meters)
+#   "rotor.motor_constant" = [4.5e-06, 5e-06, 5.5e-06]  # any gazebo RotorParameters or ChannelParameters field
+#   "channel.input_scaling" = {uniform = [900, 1100]}
+#
+# the assembly is fetched, grouped and written once as the base model. a variant is the base model's sdf with its
+# link inertials and gazebo plugins replaced, and its mesh uris still pointing at the base model's meshes, so
+# variants only cost their sdf and model.config (and airframe) on disk
+
+DEFAULTS = {
+    'mass_scale': 1.0,
+    'inertia_scale': 1.0,
+    'com_offset': [0.0, 0.0, 0.0],
+    **{f'rotor.{field.name}': getattr(ROTOR, field.name) for field in fields(ROTOR)},
+    **{f'channel.{field.name}': getattr(CHANNEL, field.name) for field in fields(CHANNEL)},
+}
+
+def sample(rng: np.random.Generator, distribution, default, samples: int) -> list:
+    # samples values shaped like the default from a list of values or a distribution
+    shape = (samples, *np.shape(default))
+    if isinstance(distribution, list):
+        return [distribution[i] for i in rng.integers(len(distribution), size=samples)]
+    if isinstance(distribution, dict) and 'uniform' in distribution:
+        return rng.uniform(*distribution['uniform'], size=shape).tolist()
+    if isinstance(distribution, dict) and 'normal' in distribution:
+        return rng.normal(*distribution['normal'], size=shape).tolist()
+
+    raise ValueError(f'Unknown distribution {distribution}, expected a list of values, uniform or normal')
+
+def sweep_variants(spec: dict) -> list[dict]:
+    # each variant's parameter values, parameters left out keep their defaults
+    parameters = spec.get('parameters', {})
+    unknown = set(parameters) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f'Unknown sweep parameters {", ".join(sorted(unknown))}, expected any of {", ".join(DEFAULTS)}')
+
+    if 'samples' not in spec:
+        if not all(isinstance(values, list) for values in parameters.values()):
+            raise ValueError('Distributions need samples, a grid only takes lists of values')
+        return [dict(zip(parameters, values)) for values in itertools.product(*parameters.values())]
+
+    rng = np.random.default_rng(spec.get('seed', 0))
+    columns = {name: sample(rng, distribution, DEFAULTS[name], spec['samples']) for name, distribution in parameters.items()}
+    return [{name: column[i] for name, column in columns.items()} for i in range(spec['samples'])]
+
+# the elements a variant rewrites in each link's inertial, and the inertia tensor entries they hold
+INERTIAL = ('pose', 'mass', 'inertia/ixx', 'inertia/ixy', 'inertia/ixz', 'inertia/iyy', 'inertia/iyz', 'inertia/izz')
+INERTIA = ([0, 0, 0, 1, 1, 2], [0, 1, 2, 1, 2, 2])
+
+@dataclass
+class BaseLinks:
+    # every link's mass properties as the import computed them, before conditioning and --sdf-precision rounding,
+    # so variants are scaled from the same values however the base model was written, and the joints between them
+    mass_props: MassPropertiesArray
+    joints: list[tuple[int, int]]
+
+    @classmethod
+    def from_import(cls, parts: dict[str, Part], mates: dict[str, Mate]) -> 'BaseLinks':
+        # the links are written in the order of their groups
+        grouped_parts = collect_part_groups(parts, mates)
+        return cls(link_group_mass_properties(grouped_parts, parts), link_joints(part_group_index(grouped_parts), mates))
+
+@dataclass
+class BaseModel:
+    # the written base model, with the elements of every link's inertial pose, mass and inertia
+    tree: etree._ElementTree
+    inertials: list[list[etree._Element]]
+    names: list[str]
+    links: BaseLinks
+
+    @classmethod
+    def read(cls, path: Path, links: BaseLinks) -> 'BaseModel':
+        # blank text is dropped so the variants are pretty printed the same way throughout
+        tree = etree.parse(str(path), etree.XMLParser(remove_blank_text=True))
+        elements = tree.getroot()[0].findall('link')
+        if len(elements) != len(links.mass_props):
+            raise ValueError(f'{path} has {len(elements)} links, its assembly groups into {len(links.mass_props)}')
+
+        inertials = [[link.find(f'inertial/{path}') for path in INERTIAL] for link in elements]
+        return cls(tree, inertials, [link.get('name') for link in elements], links)
+
+@dataclass
+class SweepOptions:
+    models_path: Path
+    precision: int | None
+    min_inertia: float | None
+    max_mass_ratio: float | None
+    # for airframes, None to leave them out
+    parts: dict[str, Part] | None
+
+_base = None
+_options = None
+
+def start_worker(sdf_path: Path, links: BaseLinks, options: SweepOptions):
+    # every worker reads the base model once, then reuses its tree for every variant it writes
+    global _base, _options
+    _base = BaseModel.read(sdf_path, links)
+    _options = options
+
+def write_variant(name: str, values: dict):
+    base, options = _base, _options
+    rotor = replace(ROTOR, **{key.removeprefix('rotor.'): value for key, value in values.items() if key.startswith('rotor.')})
+    channel = replace(CHANNEL, **{key.removeprefix('channel.'): value for key, value in values.items() if key.startswith('channel.')})
+
+    # every link's mass properties in one batch, conditioned again like the base model's
+    mass_scale = values.get('mass_scale', 1.0)
+    mass = base.links.mass_props.mass * mass_scale
+    inertia = base.links.mass_props.inertia * (mass_scale * values.get('inertia_scale', 1.0))
+    mass_props, _ = condition_inertias([MassProperties(float(m), np.zeros(3), i) for m, i in zip(mass, inertia)], base.names, base.links.joints, options.min_inertia, options.max_mass_ratio)
+
+    # links are posed at the base model's centers of mass, so a moved center of mass is the inertial's pose
+    pose = numbers(values['com_offset'], options.precision) + ' 0 0 0' if 'com_offset' in values else '0 0 0 0 0 0'
+    conditioned = MassPropertiesArray.stack(mass_props)
+    for elements, row in zip(base.inertials, np.column_stack((conditioned.mass, conditioned.inertia[:, *INERTIA])).tolist()):
+        elements[0].text = pose
+        for element, value in zip(elements[1:], row):
+            element.text = number(value, options.precision)
+
+    model = base.tree.getroot()[0]
+    model.set('name', name)
+    for plugin in model.findall('plugin'):
+        model.remove(plugin)
+    with redirect_stdout(io.StringIO()):
+        insert_gazebo_plugins(base.tree, rotor, channel)
+
+    model_path = Path(options.models_path, name)
+    model_path.mkdir(exist_ok=True)
+    write_tree(base.tree, Path(model_path, f'{name}.sdf'))
+    write_tree(create_gazebo_config(name), Path(model_path, 'model.config'))
+    if options.parts is not None:
+        # the airframe's own moment constant unless one is swept
+        moment_constant = {'moment_constant': values['rotor.moment_constant']} if 'rotor.moment_constant' in values else {}
+        Path(model_path, 'airframe').write_text(create_airframe_config(name, options.parts, **moment_constant))
+
+def write_variants(sdf_path: Path, name: str, variants: list[dict], links: BaseLinks, options: SweepOptions, processes: int | None = None) -> list[str]:
+    # writes <name>_<i> for every variant across processes, returns their names
+    names = [f'{name}_{i:0{len(str(len(variants) - 1))}d}' for i in range(len(variants))]
+    processes = max(1, min(processes or os.cpu_count(), len(variants)))
+    with ProcessPoolExecutor(max_workers=processes, initializer=start_worker, initargs=(sdf_path, links, options)) as executor:
+        # a few dozen variants per task, so the work is spread evenly but not sent one at a time
+        list(executor.map(write_variant, names, variants, chunksize=max(1, len(variants) // (processes * 4))))
+
+    return names
+
+def sweep(args: Namespace, variants: list[dict]):
+    import_model(args)
+
+    print(f'Writing {len(variants)} variants')
+    start = time.perf_counter()
+    # every import stores its assembly, fetched or not
+    snapshot = Snapshot(Path(args.stored_assembly, 'snapshot.npz'))
+    options = SweepOptions(Path(args.models_path), args.sdf_precision, args.min_inertia, args.max_mass_ratio, snapshot.parts if args.airframe else None)
+    names = write_variants(Path(args.models_path, args.name, f'{args.name}.sdf'), args.name, variants, BaseLinks.from_import(snapshot.parts, snapshot.mates), options, args.processes)
+
+    # which values each variant got, for reading the results of the runs
+    Path(args.models_path, args.name, 'variants.json').write_text(json.dumps(dict(zip(names, variants)), indent=2))
+    seconds = time.perf_counter() - start
+    print(f'Wrote {len(variants)} variants in {seconds:.1f} s ({len(variants) / seconds * 60:.0f} per minute)')
+
+def main():
+    parser = create_parser()
+    parser.description = 'Generate variants of a model with different mass properties and gazebo plugin parameters'
+    parser.add_argument('spec', type=str, help='Sweep spec (.toml or .json), see the top of sweep.py')
+    parser.add_argument('-p', '--processes', type=int, default=os.cpu_count(), help='Variants written at once')
+    parser.add_argument('--airframe', action='store_true', help='Also write each variant\'s px4 airframe config')
+    args = parser.parse_args()
+
+    try:
+        variants = sweep_variants(load_manifest(Path(args.spec)))
+    except ValueError as error:
+        parser.error(str(error))
+
+    sweep(args, variants)
+
+if __name__ == '__main__':
+    main()
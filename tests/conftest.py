@@ -0,0 +1,8 @@
+import pytest
+
+from mock_onshape import MockOnshape
+
+@pytest.fixture
+def mock():
+    with MockOnshape() as mock:
+        yield mock
@@ -0,0 +1,110 @@
+import copy
+
+import numpy as np
+import pytest
+
+from mock_onshape import instanced_assembly, synthetic_assembly, synthetic_features
+from onshape import flatten_assembly, get_joint_features, parse_quantity
+
+@pytest.mark.parametrize('expression, value', [
+    ('45 deg', np.pi / 4),
+    ('-0.5 rad', -0.5),
+    ('1 ft + 3 in', 0.381),
+    ('(pi / 4) rad', np.pi / 4),
+    ('pi / 4', np.pi / 4),
+    ('2 * 10 mm', 0.02),
+    ('1.5e1 cm', 0.15),
+])
+def test_quantities(expression: str, value: float):
+    assert parse_quantity(expression) == pytest.approx(value)
+
+@pytest.mark.parametrize('expression', ['3 deg 4', '3 4', 'deg', '4 * deg', '3 deg deg', '#limit', '(1 + 2', '1 +'])
+def test_malformed_quantities(expression: str):
+    with pytest.raises(ValueError):
+        parse_quantity(expression)
+
+class FeaturesClient:
+    # records the features requests and answers them from the mock's features
+    def __init__(self, assembly: dict):
+        self.features = synthetic_features(assembly)
+        self.requests = []
+
+    def get_assembly_features(self, did: str, wid: str, eid: str, feature_ids: list[str]) -> dict:
+        self.requests.append(('root', feature_ids))
+        return self.select(feature_ids)
+
+    def get_subassembly_features(self, did: str, mid: str, eid: str, configuration: str, feature_ids: list[str]) -> dict:
+        self.requests.append((configuration, feature_ids))
+        return self.select(feature_ids)
+
+    def select(self, feature_ids: list[str]) -> dict:
+        return {'features': [feature for feature in self.features['features'] if feature['featureId'] in feature_ids]}
+
+def test_configured_subassemblies_get_their_own_features():
+    # two instances of one subassembly, in different configurations
+    assembly = instanced_assembly(synthetic_assembly(10, 3, revolute_ratio=0.5, seed=1), 2, 'sub')
+    client = FeaturesClient(assembly)
+    configured = copy.deepcopy(assembly['subAssemblies'][0]) | {'fullConfiguration': 'Size=Large'}
+    assembly['subAssemblies'].append(configured)
+    assembly['rootAssembly']['instances'][1]['fullConfiguration'] = 'Size=Large'
+
+    flat = flatten_assembly(assembly)
+    features = get_joint_features(client, flat, 'd0', 'w0', 'e0')
+
+    assert sorted(configuration for configuration, _ in client.requests) == ['Size=Large', 'default']
+    joints = [feature['id'] for feature in flat['rootAssembly']['features'] if feature['featureData']['mateType'] != 'FASTENED']
+    assert sorted(feature['featureId'] for feature in features['features']) == sorted(joints)
+
+class UnfilteredClient(FeaturesClient):
+    # a server that answers with every feature, whichever were asked for
+    def select(self, feature_ids: list[str]) -> dict:
+        return self.features
+
+def test_unrequested_features_are_skipped():
+    assembly = flatten_assembly(synthetic_assembly(20, 4, revolute_ratio=0.3, seed=5))
+    features = get_joint_features(UnfilteredClient(assembly), assembly, 'd0', 'w0', 'e0')
+    joints = [feature['id'] for feature in assembly['rootAssembly']['features'] if feature['featureData']['mateType'] != 'FASTENED']
+    assert len(joints) < len(assembly['rootAssembly']['features'])
+    assert sorted(feature['featureId'] for feature in features['features']) == sorted(joints)
+
+def nested_assembly() -> dict:
+    # two copies of a subassembly of three copies of a part studio assembly
+    return instanced_assembly(instanced_assembly(synthetic_assembly(6, 2, revolute_ratio=0.5, seed=2), 3, 'inner', seed=3), 2, 'outer', seed=4)
+
+def test_flattened_occurrence_ids():
+    assembly = nested_assembly()
+    flat = flatten_assembly(assembly)['rootAssembly']
+    ids = [data['id'] for data in flat['instances']]
+
+    assert ids == [f'S{i}/S{j}/I{k}' for i in range(2) for j in range(3) for k in range(6)]
+    assert [data['path'] for data in flat['occurrences']] == [[id] for id in ids]
+    # names are prefixed with every level's instance name
+    assert flat['instances'][7]['name'] == 'outer <0> inner <1> part 1 <1>'
+
+def test_nested_instances_keep_their_root_transforms():
+    assembly = nested_assembly()
+    transforms = {'/'.join(data['path']): data['transform'] for data in assembly['rootAssembly']['occurrences']}
+    flat = flatten_assembly(assembly)['rootAssembly']
+
+    for data in flat['occurrences']:
+        assert data['transform'] == transforms[data['path'][0]]
+    # copies of the same part are posed apart
+    assert transforms['S0/S1/I3'] != transforms['S1/S1/I3']
+
+def test_mates_across_levels():
+    assembly = nested_assembly()
+    flat = flatten_assembly(assembly)['rootAssembly']
+    features = {feature['id']: feature for feature in flat['features']}
+    ids = {data['id'] for data in flat['instances']}
+
+    # every mate ends at flattened parts, whichever level it was defined at
+    assert all(entity['matedOccurrence'][0] in ids for feature in flat['features'] for entity in feature['featureData']['matedEntities'])
+    # the root's mate fastens the first parts of the two outer copies, two levels down
+    assert [entity['matedOccurrence'] for entity in features['F1']['featureData']['matedEntities']] == [['S1/S0/I0'], ['S0/S0/I0']]
+    assert features['F1']['source'] == (None, 'F1')
+    # the outer subassembly's mates fasten its inner copies, one level down, once per outer instance
+    assert [entity['matedOccurrence'] for entity in features['S1/F2']['featureData']['matedEntities']] == [['S1/S2/I0'], ['S1/S0/I0']]
+    assert features['S0/F2']['source'] == features['S1/F2']['source'] == (('d0', 'm0', 'outer', 'default'), 'F2')
+    assert features['S1/S2/M3']['featureData']['matedEntities'][0]['matedOccurrence'] == ['S1/S2/I3']
+    assert features['S1/S2/M3']['source'] == (('d0', 'm0', 'inner', 'default'), 'M3')
+    assert len({feature['source'] for feature in flat['features']}) == 1 + 2 + 5
@@ -0,0 +1,44 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+import batch
+
+def test_empty_manifest(tmp_path: Path, monkeypatch, capsys):
+    manifest = tmp_path / 'manifest.toml'
+    manifest.write_text('models_path = "models"\n')
+    monkeypatch.setattr(sys, 'argv', ['batch.py', str(manifest)])
+
+    with pytest.raises(SystemExit) as exit:
+        batch.main()
+    assert exit.value.code == 2
+    assert 'has no models' in capsys.readouterr().err
+
+def test_invalid_models_are_reported_before_any_import(tmp_path: Path, monkeypatch, capsys):
+    manifest = tmp_path / 'manifest.toml'
+    manifest.write_text(f'''models_path = "{tmp_path / 'models'}"
+[[models]]
+name = "good"
+document = "d0"
+workspace = "w0"
+element = "e0"
+[[models]]
+name = "bogus"
+document = "d0"
+workspace = "w0"
+element = "e0"
+bogus = 1
+[[models]]
+name = "incomplete"
+workspace = "w0"
+''')
+    monkeypatch.setattr(sys, 'argv', ['batch.py', str(manifest)])
+
+    with pytest.raises(SystemExit) as exit:
+        batch.main()
+    assert exit.value.code == 2
+    error = capsys.readouterr().err
+    assert 'model bogus: unrecognized arguments: --bogus 1' in error
+    assert 'model incomplete: missing document, element' in error
+    assert not (tmp_path / 'models').exists()
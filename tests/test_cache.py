@@ -0,0 +1,27 @@
+from pathlib import Path
+
+from cache import ResponseCache
+
+def cache_bytes(path: Path) -> int:
+    return sum(entry.stat().st_size for entry in path.glob('*.bin'))
+
+def test_least_recently_used_are_evicted(tmp_path: Path):
+    cache = ResponseCache(tmp_path, max_bytes=3000)
+    for i in range(3):
+        cache.put(ResponseCache.key(i), bytes(1000))
+    cache.get(ResponseCache.key(0))
+    cache.put(ResponseCache.key(3), bytes(1000))
+
+    assert cache.get(ResponseCache.key(1)) is None
+    assert all(cache.get(ResponseCache.key(i)) is not None for i in (0, 2, 3))
+    assert cache_bytes(tmp_path) <= 3000
+
+def test_shared_directory_stays_bounded(tmp_path: Path):
+    # like the processes of a batch import, neither cache knows what the other stored
+    caches = [ResponseCache(tmp_path, max_bytes=10_000), ResponseCache(tmp_path, max_bytes=10_000)]
+    for i in range(40):
+        caches[i % 2].put(ResponseCache.key(i), bytes(1000))
+        assert cache_bytes(tmp_path) <= 10_000 + 10_000 // 16
+
+    # and either of them still finds what the other stored last
+    assert caches[0].get(ResponseCache.key(39)) == bytes(1000)
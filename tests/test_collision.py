@@ -0,0 +1,27 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from collision import fit_collision, fit_collision_shapes
+from mesh import STL_DTYPE
+from mock_onshape import cylinder_stl
+from onshape import MassProperties, Part
+
+def test_cylinder_fits_a_cylinder(tmp_path: Path):
+    triangles = np.frombuffer(cylinder_stl(256, 1.0), dtype=STL_DTYPE, offset=84)['vertices']
+    shape = fit_collision(triangles, 0.1, Path(tmp_path, 'hull.stl'))
+    assert shape is not None and shape.kind == 'cylinder'
+
+def test_flat_parts_keep_their_mesh(tmp_path: Path):
+    plate = np.array([[[0, 0, 0], [1, 0, 0], [1, 1, 0]], [[0, 0, 0], [1, 1, 0], [0, 1, 0]]], dtype=np.float32)
+    assert fit_collision(plate, 0.1, Path(tmp_path, 'hull.stl')) is None
+    assert not Path(tmp_path, 'hull.stl').exists()
+
+def test_truncated_meshes_are_named(tmp_path: Path):
+    Path(tmp_path, 'good.stl').write_bytes(cylinder_stl(64, 0.5))
+    Path(tmp_path, 'cut.stl').write_bytes(cylinder_stl(64, 0.5)[:1000])
+    mass_props = MassProperties(1.0, np.zeros(3), np.identity(3))
+    parts = {f'I{i}': Part(f'part_{i}', np.identity(4), mass_props, ('d', 'm', 'e', f'P{i}'), mesh) for i, mesh in enumerate(('good.stl', 'cut.stl'))}
+    with pytest.raises(ValueError, match='cut.stl is not a binary stl: 1000 bytes for 64 triangles'):
+        fit_collision_shapes(parts, tmp_path, ['*'], 0.1)
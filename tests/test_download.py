@@ -0,0 +1,45 @@
+import json
+from pathlib import Path
+
+from api import Client
+from cache import ResponseCache
+from mock_onshape import synthetic_assembly
+from onshape import download_part_meshes
+
+def test_not_modified_is_not_cached(mock, tmp_path: Path):
+    cache = ResponseCache(tmp_path / 'cache')
+    client = Client(mock.base_url, '', '', cache=cache)
+    path = tmp_path / 'part.stl'
+
+    etag = client.download_parts_stl('d0', 'm0', 'e0', 'P0', path)
+    assert path.exists() and etag is not None
+
+    # a new microversion with the same mesh, the server answers 304 and nothing is written
+    path.unlink()
+    assert client.download_parts_stl('d0', 'm1', 'e0', 'P0', path, etag=etag) == etag
+    assert not path.exists()
+    assert mock.hits['not modified'] == 1
+    # only the first download and its etag are in the cache
+    assert len(list((tmp_path / 'cache').glob('*.bin'))) == 2
+
+def test_cache_hits_return_the_cached_etag(mock, tmp_path: Path):
+    client = Client(mock.base_url, '', '', cache=ResponseCache(tmp_path / 'cache'))
+    etag = client.download_parts_stl('d0', 'm0', 'e0', 'P0', tmp_path / 'first.stl')
+
+    # whatever etag the caller had, the cached mesh comes with its own
+    for known in (None, '"stale"'):
+        assert client.download_parts_stl('d0', 'm0', 'e0', 'P0', tmp_path / 'again.stl', etag=known) == etag
+    assert mock.hits['download'] == 1 and (tmp_path / 'again.stl').read_bytes() == (tmp_path / 'first.stl').read_bytes()
+
+def test_unchanged_meshes_survive_a_new_microversion(mock, tmp_path: Path):
+    client = Client(mock.base_url, '', '', cache=ResponseCache(tmp_path / 'cache'))
+    meshes_path = tmp_path / 'meshes'
+    meshes_path.mkdir()
+
+    first = download_part_meshes(client, synthetic_assembly(10, 3, microversion='m0'), meshes_path)
+    second = download_part_meshes(client, synthetic_assembly(10, 3, microversion='m1'), meshes_path)
+
+    assert mock.hits['download'] == 3 and mock.hits['not modified'] == 3
+    assert set(first.values()) == set(second.values())
+    assert all(Path(meshes_path, mesh).exists() for mesh in second.values())
+    assert {entry['microversion'] for entry in json.loads((meshes_path / 'manifest.json').read_text()).values()} == {'m1'}
@@ -0,0 +1,38 @@
+import time
+
+import numpy as np
+
+from api import Client
+from mock_onshape import MockOnshape, synthetic_assembly
+from onshape import MassProperties, get_mass_properties, part_definition
+
+def test_one_request_per_definition(mock):
+    assembly = synthetic_assembly(100, 12)
+    mass_props = get_mass_properties(assembly, Client(mock.base_url, '', ''))
+
+    assert mock.hits['massproperties'] == 12
+    assert set(mass_props) == {data['id'] for data in assembly['rootAssembly']['instances']}
+    assert all(mass_props[id].mass == 1.0 and np.allclose(mass_props[id].inertia, np.identity(3)) for id in mass_props)
+
+def test_known_definitions_are_not_fetched(mock):
+    assembly = synthetic_assembly(100, 12)
+    known = {('d0', 'm0', 'e0', f'P{i}'): MassProperties(2.0, np.zeros(3), np.identity(3)) for i in range(4)}
+    mass_props = get_mass_properties(assembly, Client(mock.base_url, '', ''), known=known)
+
+    assert mock.hits['massproperties'] == 8
+    assert all((mass_props[data['id']].mass == 2.0) == (part_definition(data) in known) for data in assembly['rootAssembly']['instances'])
+
+def test_concurrent_fetches_overlap():
+    # 16 definitions at 50 ms each take 0.8 s one at a time
+    assembly = synthetic_assembly(64, 16)
+    with MockOnshape(latency=0.05) as mock:
+        # without a cache every run asks for each definition again
+        client = Client(mock.base_url, '', '', pool_size=16)
+        seconds = []
+        for max_workers in (1, 16):
+            start = time.perf_counter()
+            get_mass_properties(assembly, client, max_workers)
+            seconds.append(time.perf_counter() - start)
+
+    assert mock.hits['massproperties'] == 32
+    assert seconds[0] / seconds[1] > 4
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from model import collect_part_groups, part_group_index
+from onshape import Mate
+
+def list_merge_groups(parts: dict, mates: dict[str, Mate]) -> list[list[str]]:
+    # the original grouping, merging lists, that collect_part_groups replaced
+    groups = list([part] for part in parts.keys())
+
+    def group_index(part: str) -> int:
+        return next(i for i, group in enumerate(groups) if part in group)
+
+    for mate in mates.values():
+        if mate.kind == 'FASTENED':
+            try:
+                parent_group = group_index(mate.parent)
+                child_group = group_index(mate.child)
+            except StopIteration:
+                continue
+            if parent_group != child_group:
+                groups[parent_group].extend(groups[child_group])
+                groups.pop(child_group)
+
+    return groups
+
+def random_mates(ids: list[str], count: int, rng: np.random.Generator, missing: int = 0) -> dict[str, Mate]:
+    # any part to any other in any order, so there are cycles and merges of already merged groups
+    ends = ids + [f'missing_{i}' for i in range(missing)]
+    mates = {}
+    for i in range(count):
+        parent, child = rng.choice(len(ends), 2, replace=False)
+        kind = 'REVOLUTE' if rng.random() < 0.2 else 'FASTENED'
+        mates[f'M{i}'] = Mate(ends[parent], ends[child], kind, np.zeros(3), np.identity(3), {})
+
+    return mates
+
+@pytest.mark.parametrize('seed', range(20))
+def test_matches_the_list_merge(seed: int):
+    rng = np.random.default_rng(seed)
+    ids = [f'I{i}' for i in rng.permutation(int(rng.integers(2, 80)))]
+    parts = dict.fromkeys(ids)
+    mates = random_mates(ids, int(rng.integers(0, 2 * len(ids))), rng)
+
+    groups = collect_part_groups(parts, mates)
+    assert groups == list_merge_groups(parts, mates)
+    assert sorted(part for group in groups for part in group) == sorted(ids)
+    assert all(groups[index].count(part) == 1 for part, index in part_group_index(groups).items())
+
+def test_mates_to_missing_parts_are_reported(capsys):
+    rng = np.random.default_rng(0)
+    ids = [f'I{i}' for i in range(30)]
+    mates = random_mates(ids, 60, rng, missing=5)
+    skipped = [id for id, mate in mates.items() if mate.kind == 'FASTENED' and (mate.parent not in ids or mate.child not in ids)]
+    assert skipped
+
+    groups = collect_part_groups(dict.fromkeys(ids), mates)
+    assert groups == list_merge_groups(dict.fromkeys(ids), mates)
+    assert capsys.readouterr().out == f'Skipping {len(skipped)} fastened mates with parts missing from the assembly: {", ".join(skipped)}\n'
@@ -0,0 +1,75 @@
+from dataclasses import replace
+from pathlib import Path
+
+import numpy as np
+
+import model
+from incremental import ImportState, diff_import
+from model import collect_part_groups, create_link_groups
+from onshape import MassProperties, Mate, Part
+
+def assembly(seed: int = 0) -> tuple[dict[str, Part], dict[str, Mate]]:
+    # three groups of three fastened parts, joined by revolute mates
+    rng = np.random.default_rng(seed)
+    parts = {}
+    for i in range(9):
+        transform = np.identity(4)
+        transform[:3, 3] = rng.uniform(-1, 1, 3)
+        parts[f'I{i}'] = Part(f'part_{i}', transform, MassProperties(float(rng.uniform(0.1, 1)), rng.uniform(-0.05, 0.05, 3), np.diag(rng.uniform(1e-4, 1e-3, 3))), ('d', 'm', 'e', f'P{i}'), f'{i}.stl')
+
+    mates = {f'M{i}': Mate(f'I{i}', f'I{i + 1}', 'REVOLUTE' if i % 3 == 2 else 'FASTENED', np.zeros(3), np.identity(3), {}) for i in range(8)}
+    return parts, mates
+
+def groups_computed(parts: dict[str, Part], mates: dict[str, Mate], group_cache: dict[str, MassProperties], monkeypatch) -> list[list[str]]:
+    computed = []
+    def link_group_mass_properties(grouped_parts, parts):
+        computed.extend(grouped_parts)
+        return original(grouped_parts, parts)
+
+    original = model.link_group_mass_properties
+    monkeypatch.setattr(model, 'link_group_mass_properties', link_group_mass_properties)
+    create_link_groups(collect_part_groups(parts, mates), parts, group_cache)
+    monkeypatch.undo()
+    return computed
+
+def test_only_changed_groups_are_recomputed(tmp_path: Path, monkeypatch):
+    parts, mates = assembly()
+    group_cache = {}
+    assert len(groups_computed(parts, mates, group_cache, monkeypatch)) == 3
+    ImportState.from_import(parts, mates, group_cache).save(tmp_path / 'state.json')
+    previous = ImportState.load(tmp_path / 'state.json')
+
+    assert groups_computed(parts, mates, previous.group_cache(), monkeypatch) == []
+
+    transform = parts['I4'].transform.copy()
+    transform[0, 3] += 0.1
+    moved = parts | {'I4': replace(parts['I4'], transform=transform)}
+    group_cache = previous.group_cache()
+    assert groups_computed(moved, mates, group_cache, monkeypatch) == [['I3', 'I4', 'I5']]
+
+    # the other groups keep their cached entries, the changed one gets a new signature and mass properties
+    before = previous.group_cache()
+    assert len(group_cache) == 3 and len(group_cache.keys() & before.keys()) == 2
+    for signature in group_cache.keys() & before.keys():
+        assert group_cache[signature].to_data() == before[signature].to_data()
+    changed, = group_cache.keys() - before.keys()
+    stale, = before.keys() - group_cache.keys()
+    assert not np.allclose(group_cache[changed].com, before[stale].com)
+
+def test_diff_reports_every_change():
+    parts, mates = assembly()
+    previous = ImportState.from_import(parts, mates, {})
+
+    current_parts = {id: part for id, part in parts.items() if id != 'I8'}
+    current_parts['I9'] = replace(parts['I8'], identifier='part_9')
+    current_parts['I1'] = replace(parts['I1'], definition=('d', 'm', 'e', 'P10'))
+    current_parts['I2'] = replace(parts['I2'], transform=parts['I2'].transform * 2)
+    current_mates = mates | {'M7': replace(mates['M7'], kind='SLIDER'), 'M8': Mate('I8', 'I9', 'FASTENED', np.zeros(3), np.identity(3), {})}
+    del current_mates['M0']
+
+    diff = diff_import(previous, ImportState.from_import(current_parts, current_mates, {}))
+    assert diff.added == ['part_9'] and diff.removed == ['part_8']
+    assert diff.redefined == ['part_1'] and diff.moved == ['part_2']
+    assert sorted(diff.unchanged) == [f'part_{i}' for i in (0, 3, 4, 5, 6, 7)]
+    assert diff.mates_changed == ['M0', 'M7', 'M8']
+    assert diff_import(previous, previous).unchanged == [part.identifier for part in parts.values()]
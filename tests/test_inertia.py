@@ -0,0 +1,21 @@
+import numpy as np
+
+from inertia import condition_inertias
+from main import create_parser
+from onshape import MassProperties
+
+def test_valid_tensors_are_kept():
+    # a tiny but valid part, and one with a negative moment
+    tiny = MassProperties(0.001, np.zeros(3), np.diag([1e-9, 2e-9, 2.5e-9]))
+    invalid = MassProperties(1.0, np.zeros(3), np.diag([-1e-4, 1e-3, 1e-3]))
+    args = create_parser().parse_args(['model', '.', 'd0', 'w0', 'e0'])
+    conditioned, changes = condition_inertias([tiny, invalid], ['tiny', 'invalid'], [(0, 1)], args.min_inertia, args.max_mass_ratio)
+
+    assert conditioned[0] is tiny
+    assert [change.link for change in changes] == ['invalid']
+    assert np.linalg.eigvalsh(conditioned[1].inertia).min() >= 0
+
+def test_min_inertia_is_a_floor():
+    tiny = MassProperties(0.001, np.zeros(3), np.diag([1e-9, 2e-9, 2.5e-9]))
+    conditioned, _ = condition_inertias([tiny], ['tiny'], [], 1e-6)
+    assert np.allclose(np.linalg.eigvalsh(conditioned[0].inertia), 1e-6)
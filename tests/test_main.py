@@ -0,0 +1,28 @@
+import io
+import json
+from contextlib import redirect_stdout
+from pathlib import Path
+
+import pytest
+
+import main
+
+def failing_import(*_):
+    raise RuntimeError('import failed')
+
+def test_trace_of_a_failed_import(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(main, 'run_import', failing_import)
+    args = main.create_parser().parse_args(['model', str(tmp_path / 'models'), 'd0', 'w0', 'e0', '--trace', str(tmp_path / 'traces' / 'trace.json')])
+
+    with pytest.raises(RuntimeError, match='import failed'), redirect_stdout(io.StringIO()):
+        main.import_model(args)
+    assert 'traceEvents' in json.loads((tmp_path / 'traces' / 'trace.json').read_text())
+
+def test_unwritable_trace_keeps_the_import_error(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(main, 'run_import', failing_import)
+    (tmp_path / 'file').touch()
+    args = main.create_parser().parse_args(['model', str(tmp_path / 'models'), 'd0', 'w0', 'e0', '--trace', str(tmp_path / 'file' / 'trace.json')])
+
+    with pytest.raises(RuntimeError, match='import failed'), redirect_stdout(io.StringIO()) as output:
+        main.import_model(args)
+    assert 'Could not write the trace' in output.getvalue()
@@ -0,0 +1,51 @@
+import numpy as np
+from scipy.spatial.transform import Rotation
+
+from model import create_link_groups, link_group_mass_properties
+from onshape import MassProperties, MassPropertiesArray, Part
+
+def random_parts(count: int, seed: int = 0) -> dict[str, Part]:
+    rng = np.random.default_rng(seed)
+    parts = {}
+    for i in range(count):
+        transform = np.identity(4)
+        transform[:3, :3] = Rotation.random(random_state=int(rng.integers(1 << 31))).as_matrix()
+        transform[:3, 3] = rng.uniform(-1, 1, 3)
+        # a random symmetric positive definite tensor, off the principal axes
+        axes = Rotation.random(random_state=int(rng.integers(1 << 31))).as_matrix()
+        inertia = axes @ np.diag(rng.uniform(1e-6, 1e-3, 3)) @ axes.T
+        parts[f'I{i}'] = Part(f'part_{i}', transform, MassProperties(float(rng.uniform(0.01, 2)), rng.uniform(-0.05, 0.05, 3), inertia), ('d', 'm', 'e', f'P{i}'), f'{i}.stl')
+
+    return parts
+
+def composed(group: list[str], parts: dict[str, Part]) -> MassProperties:
+    # one MassProperties at a time, the way link groups were combined before the batched arrays
+    link_frame = [parts[part].mass_props.apply_transform(parts[part].transform) for part in group]
+    mass = sum(props.mass for props in link_frame)
+    com = sum(props.mass * props.com for props in link_frame) / mass
+    return MassProperties(mass, com, sum(props.inertia_at_point(com) for props in link_frame))
+
+def test_batched_matches_composed():
+    parts = random_parts(30)
+    ids = list(parts)
+    grouped_parts = [ids[:1], ids[1:5], ids[5:6], ids[6:20], ids[20:]]
+
+    batched = link_group_mass_properties(grouped_parts, parts)
+    assert len(batched) == len(grouped_parts)
+    for i, group in enumerate(grouped_parts):
+        expected = composed(group, parts)
+        assert np.isclose(batched[i].mass, expected.mass, rtol=1e-12)
+        assert np.allclose(batched[i].com, expected.com, rtol=1e-12, atol=1e-12)
+        assert np.allclose(batched[i].inertia, expected.inertia, rtol=1e-10, atol=1e-15)
+
+    # and through the link groups the sdf is written from
+    for link_group, group in zip(create_link_groups(grouped_parts, parts), grouped_parts):
+        assert np.allclose(link_group.mass_props.inertia, composed(group, parts).inertia, rtol=1e-10, atol=1e-15)
+
+def test_transforms_match_apply_transform():
+    parts = random_parts(10, seed=1)
+    batch = MassPropertiesArray.stack([part.mass_props for part in parts.values()]).apply_transforms(np.array([part.transform for part in parts.values()]))
+    for i, part in enumerate(parts.values()):
+        expected = part.mass_props.apply_transform(part.transform)
+        assert np.allclose(batch[i].com, expected.com, rtol=1e-12, atol=1e-15)
+        assert np.allclose(batch[i].inertia, expected.inertia, rtol=1e-12, atol=1e-18)
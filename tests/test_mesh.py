@@ -0,0 +1,86 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+from scipy.spatial import cKDTree
+
+from mesh import STL_DTYPE, cluster_vertices, decimate, read_obj, read_stl, volume_properties, weld, write_obj, write_stl
+from mock_onshape import cylinder_stl, synthetic_assembly
+from onshape import mesh_mass_properties, part_definition
+
+def plate(size: float = 0.1) -> np.ndarray:
+    # two triangles, no thickness
+    return np.array([[[0, 0, 0], [size, 0, 0], [size, size, 0]], [[0, 0, 0], [size, size, 0], [0, size, 0]]], dtype=np.float32)
+
+def cylinder(triangles: int) -> np.ndarray:
+    return np.frombuffer(cylinder_stl(triangles, 1.0), dtype=STL_DTYPE, offset=84)['vertices']
+
+def test_cylinder_volume():
+    triangles = np.frombuffer(cylinder_stl(256, 1.0), dtype=STL_DTYPE, offset=84)['vertices']
+    volume, centroid, inertia = volume_properties(triangles)
+    assert volume > 0
+    assert np.all(np.isfinite(centroid)) and np.all(np.isfinite(inertia))
+    assert np.allclose(inertia, inertia.T)
+
+@pytest.mark.parametrize('triangles', [plate(), np.empty((0, 3, 3), dtype=np.float32)])
+def test_flat_meshes_have_no_volume(triangles: np.ndarray):
+    with pytest.raises(ValueError, match='no volume'):
+        volume_properties(triangles)
+
+def test_flat_parts_fall_back_to_the_api(tmp_path: Path):
+    assembly = synthetic_assembly(4, 2)
+    definitions = list(dict.fromkeys(part_definition(data) for data in assembly['rootAssembly']['instances']))
+    Path(tmp_path, 'solid.stl').write_bytes(cylinder_stl(64, 0.5))
+    write_stl(Path(tmp_path, 'flat.stl'), plate())
+    meshes = {definitions[0]: 'solid.stl', definitions[1]: 'flat.stl'}
+
+    mass_props = mesh_mass_properties(assembly, meshes, tmp_path, {'*': 1000.0})
+    assert list(mass_props) == [definitions[0]]
+    assert np.isfinite(mass_props[definitions[0]].mass) and read_stl(Path(tmp_path, 'flat.stl')).shape == (2, 3, 3)
+
+@pytest.mark.parametrize('data', [cylinder_stl(64, 0.5)[:-20], cylinder_stl(64, 0.5)[:50], b'solid part\nendsolid part\n'])
+def test_malformed_stls_name_the_mesh(tmp_path: Path, data: bytes):
+    Path(tmp_path, 'broken.stl').write_bytes(data)
+    with pytest.raises(ValueError, match='broken.stl is not a binary stl'):
+        read_stl(Path(tmp_path, 'broken.stl'))
+
+def test_weld_shares_vertices():
+    triangles = cylinder(256)
+    vertices, faces = weld(triangles)
+    # two rings of 64 and the two cap centers
+    assert len(vertices) == 2 * 64 + 2 and faces.shape == (256, 3)
+    assert np.array_equal(vertices[faces], triangles)
+
+def test_obj_round_trip(tmp_path: Path):
+    triangles = cylinder(256)
+    write_obj(Path(tmp_path, 'cylinder.obj'), triangles)
+    assert Path(tmp_path, 'cylinder.obj').read_bytes().count(b'v ') == 2 * 64 + 2
+    assert np.array_equal(read_obj(Path(tmp_path, 'cylinder.obj')), triangles)
+
+@pytest.mark.parametrize('precision', [2, 4, 6])
+def test_obj_precision(tmp_path: Path, precision: int):
+    triangles = np.random.default_rng(precision).random((500, 3, 3)) * 0.2 - 0.1
+    write_obj(Path(tmp_path, 'random.obj'), triangles, precision)
+    loaded = read_obj(Path(tmp_path, 'random.obj'))
+    assert loaded.shape == triangles.shape
+    assert np.abs(loaded - triangles).max() <= 10 ** -precision
+
+@pytest.mark.parametrize('max_triangles', [2000, 500, 100, 20])
+def test_decimate_meets_the_budget(max_triangles: int):
+    triangles = cylinder(4096)
+    decimated = decimate(triangles, max_triangles=max_triangles)
+    assert 0 < len(decimated) <= max_triangles
+    assert decimate(triangles, max_triangles=len(triangles)) is triangles
+
+@pytest.mark.parametrize('tolerance', [0.001, 0.005, 0.02])
+def test_decimate_stays_within_the_tolerance(tolerance: float):
+    triangles = cylinder(4096)
+    vertices, faces = weld(triangles)
+    clustered, clustered_faces = cluster_vertices(vertices, faces, tolerance / np.sqrt(3))
+    # every vertex moves to a cluster within the tolerance, and every cluster is within the tolerance of its vertices
+    assert cKDTree(clustered).query(vertices)[0].max() <= tolerance
+    assert cKDTree(vertices).query(clustered)[0].max() <= tolerance
+    assert len(clustered_faces) < len(faces)
+
+    decimated = decimate(triangles, tolerance=tolerance)
+    assert np.array_equal(decimated, clustered[clustered_faces])
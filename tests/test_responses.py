@@ -0,0 +1,28 @@
+import gc
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from mock_onshape import synthetic_assembly, synthetic_features
+from responses import ASSEMBLY, FEATURES, collection_paused, select
+
+def test_select_matches_the_full_decode():
+    # the fields the import reads come out the same as from json.loads
+    assembly = synthetic_assembly(50, 10, revolute_ratio=0.3, full=True)
+    selected = select(json.dumps(assembly), ASSEMBLY)['rootAssembly']
+
+    assert selected['occurrences'] == [{'path': data['path'], 'transform': data['transform']} for data in assembly['rootAssembly']['occurrences']]
+    assert selected['instances'][0]['partId'] == assembly['rootAssembly']['instances'][0]['partId']
+
+def test_decoding_threads_leave_the_collector_on():
+    text = json.dumps(synthetic_features(synthetic_assembly(200, 10, revolute_ratio=0.5)))
+    assert gc.isenabled()
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda _: select(text, FEATURES), range(200)))
+    assert gc.isenabled()
+
+    with collection_paused():
+        assert not gc.isenabled()
+        with collection_paused():
+            pass
+        assert not gc.isenabled()
+    assert gc.isenabled()
@@ -0,0 +1,53 @@
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import pytest
+import requests
+
+from api import Client
+from mock_onshape import MockOnshape, synthetic_assembly
+from onshape import get_mass_properties
+from scheduler import retry_after
+
+ENDPOINT = '/parts/d/*/m/*/e/*/partid/*/massproperties'
+
+def test_throttled_requests_are_retried():
+    with MockOnshape(throttle_every=3, retry_after=0.05) as mock:
+        client = Client(mock.base_url, '', '')
+        mass_props = get_mass_properties(synthetic_assembly(40, 20), client, max_workers=4)
+
+    assert len(mass_props) == 40
+    # every third of the 29 requests is throttled
+    assert mock.hits['massproperties'] == 20 and mock.hits['throttled'] == 9
+    stats = client.stats.endpoints[ENDPOINT]
+    assert stats.requests == 20 + mock.hits['throttled']
+    assert stats.retries == stats.failures == mock.hits['throttled']
+
+def test_retry_after_is_waited_for():
+    # every other request is throttled for 0.2 s, one at a time that is a wait before each retry
+    with MockOnshape(throttle_every=2, retry_after=0.2) as mock:
+        client = Client(mock.base_url, '', '')
+        start = time.perf_counter()
+        get_mass_properties(synthetic_assembly(5, 5), client, max_workers=1)
+        seconds = time.perf_counter() - start
+
+    assert mock.hits['throttled'] >= 4
+    assert seconds >= mock.hits['throttled'] * 0.2
+
+def test_retries_give_up():
+    with MockOnshape(throttle_every=1, retry_after=0.0) as mock:
+        client = Client(mock.base_url, '', '', max_retries=2)
+        with pytest.raises(requests.HTTPError):
+            client.get_mass_properties('d0', 'm0', 'e0', 'P0')
+
+    assert mock.hits['throttled'] == 3
+    stats = client.stats.endpoints[ENDPOINT]
+    assert (stats.requests, stats.retries, stats.failures) == (3, 2, 3)
+
+def test_retry_after_values():
+    assert retry_after(None) is None
+    assert retry_after('1.5') == 1.5
+    assert retry_after('-3') == 0.0
+    assert 55 < retry_after(format_datetime(datetime.now(timezone.utc) + timedelta(seconds=60), usegmt=True)) <= 60
+    assert retry_after('soon') is None
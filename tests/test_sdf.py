@@ -0,0 +1,60 @@
+import io
+from contextlib import redirect_stdout
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from api import Client
+from gazebo import insert_gazebo_plugins
+from mock_onshape import synthetic_assembly, synthetic_features
+from collision import CollisionShape
+from mesh import read_stl
+from model import SdfOptions, collect_part_groups, create_link_groups, create_sdf, merge_link_group_meshes, model_elements, write_sdf
+from onshape import fetch_assembly
+
+@pytest.fixture
+def model(mock, tmp_path: Path):
+    # a model with rotors for the gazebo plugins to find, and a distinct mesh for each definition
+    mock.assembly = synthetic_assembly(30, 6, revolute_ratio=0.2, rotors=True)
+    mock.stl_triangles = 64
+    mock.features = synthetic_features(mock.assembly)
+    meshes_path = tmp_path / 'meshes'
+    meshes_path.mkdir()
+    with redirect_stdout(io.StringIO()):
+        return fetch_assembly(Client(mock.base_url, '', ''), 'd0', 'w0', 'e0', meshes_path)
+
+@pytest.mark.parametrize('precision', [None, 6])
+def test_streamed_sdf_matches_the_tree(model, tmp_path: Path, precision: int | None):
+    parts, mates = model
+    with redirect_stdout(io.StringIO()):
+        sdf = create_sdf('model', parts, mates, SdfOptions(precision=precision))
+        insert_gazebo_plugins(sdf)
+        sdf.write(tmp_path / 'tree.sdf', pretty_print=True, xml_declaration=True, encoding='utf-8')
+        write_sdf(tmp_path / 'stream.sdf', 'model', model_elements('model', parts, mates, SdfOptions(precision=precision)), insert_gazebo_plugins)
+
+    tree = (tmp_path / 'tree.sdf').read_bytes()
+    assert b'libgazebo_motor_model.so' in tree
+    assert (tmp_path / 'stream.sdf').read_bytes() == tree
+
+def test_merged_meshes_are_the_transformed_parts(model, tmp_path: Path):
+    parts, mates = model
+    meshes_path = tmp_path / 'meshes'
+    with redirect_stdout(io.StringIO()):
+        link_groups = create_link_groups(collect_part_groups(parts, mates), parts)
+    # one part keeps a fitted shape instead, and another collides with a different mesh
+    shaped = next(iter(link_groups[0].parts))
+    other = next(part.mesh for part in parts.values() if part.mesh != parts[shaped].mesh)
+    collision_meshes = {parts[shaped].mesh: other}
+    merged = merge_link_group_meshes(link_groups, meshes_path, collision_meshes, {shaped: CollisionShape('box', [0.1, 0.1, 0.1], np.identity(4).tolist())})
+    assert len(merged) == len(link_groups) and len({visual for visual, _ in merged}) == len(merged)
+
+    for group, (visual, collision) in zip(link_groups, merged):
+        def expected(meshes: dict[str, str]) -> np.ndarray:
+            return np.concatenate([read_stl(meshes_path / meshes.get(part.mesh, part.mesh)) @ part.transform[:3, :3].T + part.transform[:3, 3] - group.mass_props.com for id, part in group.parts.items() if id != shaped or not meshes])
+
+        assert np.allclose(read_stl(meshes_path / visual), expected({}), atol=1e-6)
+        if collision is None:
+            assert list(group.parts) == [shaped]
+        else:
+            assert np.allclose(read_stl(meshes_path / collision), expected(collision_meshes), atol=1e-6)
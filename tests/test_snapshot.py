@@ -0,0 +1,47 @@
+import json
+from dataclasses import fields
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from onshape import MassProperties, Mate, Part
+from snapshot import SNAPSHOT_VERSION, Snapshot, save_snapshot
+
+def assert_equal(a, b):
+    # dataclasses holding arrays, field by field
+    for field in fields(a):
+        x, y = getattr(a, field.name), getattr(b, field.name)
+        if isinstance(x, MassProperties):
+            assert_equal(x, y)
+        elif isinstance(x, np.ndarray):
+            assert np.array_equal(x, y)
+        else:
+            assert x == y, field.name
+
+def test_round_trip(tmp_path: Path):
+    rng = np.random.default_rng(0)
+    parts = {f'S0/I{i}': Part(f'part_{i}', np.vstack((rng.random((3, 4)), [0, 0, 0, 1])), MassProperties(float(rng.random()), rng.random(3), rng.random((3, 3))), ('d0', f'm{i % 2}', 'e0', f'P{i}'), f'{i:016x}.stl', 'mesh' if i == 3 else 'api') for i in range(8)}
+    mates = {f'M{i}': Mate(f'S0/I{i}', f'S0/I{i + 1}', 'REVOLUTE' if i % 3 else 'FASTENED', rng.random(3), rng.random((3, 3)), {'lower': -float(i), 'upper': float(i)}) for i in range(7)}
+    save_snapshot(tmp_path / 'snapshot.npz', parts, mates)
+
+    snapshot = Snapshot(tmp_path / 'snapshot.npz')
+    assert list(snapshot.parts) == list(parts) and list(snapshot.mates) == list(mates)
+    for id, part in parts.items():
+        assert_equal(snapshot.parts[id], part)
+    for id, mate in mates.items():
+        assert_equal(snapshot.mates[id], mate)
+
+def test_empty_round_trip(tmp_path: Path):
+    save_snapshot(tmp_path / 'snapshot.npz', {}, {})
+    snapshot = Snapshot(tmp_path / 'snapshot.npz')
+    assert snapshot.parts == {} and snapshot.mates == {}
+
+def test_other_versions_are_rejected(tmp_path: Path):
+    save_snapshot(tmp_path / 'snapshot.npz', {}, {})
+    arrays = dict(np.load(tmp_path / 'snapshot.npz'))
+    arrays['index'] = np.frombuffer(json.dumps(json.loads(arrays['index'].tobytes()) | {'version': SNAPSHOT_VERSION + 1}).encode(), dtype=np.uint8)
+    np.savez(tmp_path / 'newer.npz', **arrays)
+
+    with pytest.raises(ValueError, match=f'version {SNAPSHOT_VERSION + 1} snapshot'):
+        Snapshot(tmp_path / 'newer.npz')
@@ -0,0 +1,38 @@
+import io
+from contextlib import redirect_stdout
+from pathlib import Path
+
+import pytest
+from lxml import etree
+
+from main import create_parser
+from mock_onshape import synthetic_assembly, synthetic_features
+from model import collect_part_groups, link_group_mass_properties, number
+from snapshot import Snapshot
+from sweep import sweep
+
+# the workers are forked while the mock server's thread runs, which they never touch
+@pytest.mark.filterwarnings('ignore:This process')
+def test_sweep(mock, tmp_path: Path, monkeypatch):
+    monkeypatch.setenv('ONSHAPE_ACCESS_KEY', '')
+    monkeypatch.setenv('ONSHAPE_SECRET_KEY', '')
+    mock.assembly = synthetic_assembly(30, 6, revolute_ratio=0.2, rotors=True)
+    # the airframe finds its rotors by these names
+    for data, name in zip(mock.assembly['rootAssembly']['instances'][5:], ('8x4x3_propeller_ccw_1', '8x4x3_propeller_ccw_2', '8x4x3_propeller_cw_1', '8x4x3_propeller_cw_2')):
+        data['name'] = name
+    mock.features = synthetic_features(mock.assembly)
+    args = create_parser().parse_args(['model', str(tmp_path), 'd0', 'w0', 'e0', '--api-url', mock.base_url, '--cache', str(tmp_path / 'cache'), '--stored-assembly', str(tmp_path / 'stored'), '--sdf-precision', '3'])
+    args.processes, args.airframe = 1, True
+    variants = [{'mass_scale': 1.07}, {'mass_scale': 1.07, 'rotor.moment_constant': 0.02}]
+
+    with redirect_stdout(io.StringIO()):
+        sweep(args, variants)
+
+    # variants are scaled from the import's values, not from the base model's rounded ones
+    snapshot = Snapshot(tmp_path / 'stored' / 'snapshot.npz')
+    expected = link_group_mass_properties(collect_part_groups(snapshot.parts, snapshot.mates), snapshot.parts).inertia[:, 0, 0] * 1.07
+    assert etree.parse(str(tmp_path / 'model_0' / 'model_0.sdf')).xpath('/sdf/model/link/inertial/inertia/ixx/text()') == [number(ixx, 3) for ixx in expected]
+
+    # the airframe keeps its own moment constant unless it is swept
+    assert 'CA_ROTOR0_KM 0.05\n' in (tmp_path / 'model_0' / 'airframe').read_text()
+    assert 'CA_ROTOR0_KM 0.02\n' in (tmp_path / 'model_1' / 'airframe').read_text()
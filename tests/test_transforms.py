@@ -0,0 +1,43 @@
+import itertools
+import warnings
+
+import numpy as np
+import pytest
+from scipy.spatial.transform import Rotation
+
+from transforms import euler_xyz
+
+def angle_error(a: np.ndarray, b: np.ndarray) -> float:
+    # the same angle either side of a half turn
+    difference = np.abs(a - b)
+    return float(np.minimum(difference, 2 * np.pi - difference).max())
+
+def random_rotations() -> np.ndarray:
+    return Rotation.random(1000, random_state=0).as_matrix()
+
+def axis_aligned_rotations() -> np.ndarray:
+    # all 24, exactly, the way cad transforms usually hold them
+    matrices = [np.array(columns) * signs for columns in itertools.permutations(np.identity(3)) for signs in itertools.product([1, -1], repeat=3)]
+    return np.array([matrix for matrix in matrices if np.linalg.det(matrix) > 0], dtype=np.float64)
+
+def gimbal_locked_rotations() -> np.ndarray:
+    rng = np.random.default_rng(0)
+    angles = rng.uniform(-np.pi, np.pi, (1000, 3))
+    angles[:, 1] = np.pi / 2 * rng.choice([-1, 1], 1000)
+    return Rotation.from_euler('xyz', angles).as_matrix()
+
+@pytest.mark.parametrize('rotations', [random_rotations(), axis_aligned_rotations(), gimbal_locked_rotations()], ids=['random', 'axis aligned', 'gimbal locked'])
+def test_matches_scipy(rotations: np.ndarray):
+    with warnings.catch_warnings():
+        # scipy warns about every gimbal lock
+        warnings.simplefilter('ignore')
+        expected = Rotation.from_matrix(rotations).as_euler('xyz')
+
+    angles = euler_xyz(rotations)
+    assert angle_error(angles, expected) < 1e-9
+    # and the angles give back the rotations
+    assert np.allclose(Rotation.from_euler('xyz', angles).as_matrix(), rotations, atol=1e-9)
+
+def test_half_turns_are_positive():
+    assert np.array_equal(euler_xyz(np.diag([1.0, -1.0, -1.0])), [np.pi, 0.0, 0.0])
+    assert not np.signbit(euler_xyz(np.identity(3))).any()
@@ -0,0 +1,72 @@
+import copy
+import io
+import queue
+import threading
+import time
+from contextlib import redirect_stdout
+from pathlib import Path
+
+import pytest
+
+import watch
+from main import create_parser
+from mock_onshape import synthetic_assembly, synthetic_features
+
+@pytest.fixture
+def watcher(mock, tmp_path: Path, monkeypatch):
+    # runs watch in a thread against the mock, yielding the microversions it updated to and the models it wrote
+    monkeypatch.setenv('ONSHAPE_ACCESS_KEY', '')
+    monkeypatch.setenv('ONSHAPE_SECRET_KEY', '')
+    mock.assembly = synthetic_assembly(20, 5, rotors=True)
+    mock.features = synthetic_features(mock.assembly)
+    args = create_parser().parse_args(['model', str(tmp_path), 'd0', 'w0', 'e0', '--api-url', mock.base_url, '--cache', str(tmp_path / 'cache'), '--rate', '10000'])
+    args.interval = 0.02
+
+    written = []
+    write_model = watch.write_model
+    monkeypatch.setattr(watch, 'write_model', lambda *args: (written.append(args[0]), write_model(*args)))
+
+    updates = queue.Queue()
+    stop = threading.Event()
+    with redirect_stdout(io.StringIO()):
+        thread = threading.Thread(target=watch.watch, args=(args, stop, updates.put), daemon=True)
+        thread.start()
+        try:
+            yield updates, written
+        finally:
+            stop.set()
+            thread.join(timeout=30)
+
+    assert not thread.is_alive()
+
+def edit(mock, change):
+    assembly = copy.deepcopy(mock.assembly)
+    change(assembly['rootAssembly'])
+    mock.bump(assembly)
+
+def moved(assembly: dict):
+    assembly['occurrences'][1]['transform'][3] += 0.01
+
+def test_one_regeneration_per_bump(mock, watcher, tmp_path: Path):
+    updates, written = watcher
+    assert updates.get(timeout=30) == 'm0'
+    assert len(written) == 1 and (tmp_path / 'model' / 'model.sdf').exists()
+
+    for i in range(1, 4):
+        edit(mock, moved)
+        assert updates.get(timeout=30) == f'm{i}'
+        assert len(written) == 1 + i
+
+    # polls without a bump change nothing
+    time.sleep(0.2)
+    assert updates.empty() and len(written) == 4
+    assert mock.hits['assembly'] == 4
+
+def test_unchanged_assembly_is_not_rewritten(mock, watcher):
+    updates, written = watcher
+    assert updates.get(timeout=30) == 'm0'
+
+    # an edit elsewhere in the document
+    mock.bump()
+    assert updates.get(timeout=30) == 'm1'
+    assert len(written) == 1
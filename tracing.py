@@ -0,0 +1,139 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass
+from pathlib import Path
+
+# timed spans around the pipeline stages and counters of what they did. nothing is recorded unless a trace has been
+# started, and until then span() hands back a shared no-op context and count() is a single global check.
+# the trace is written in chrome's trace event format, so it opens in chrome://tracing or ui.perfetto.dev
+
+@dataclass
+class Span:
+    path: tuple[str, ...]
+    start: float
+    seconds: float
+    thread: int
+
+class Trace:
+    def __init__(self, profile: str | None = None, profile_memory: str | None = None):
+        # profile and profile_memory name a stage to run under cProfile or tracemalloc, every span of that name
+        # (in the thread that opens it) is included
+        self.spans: list[Span] = []
+        self.counters = Counter()
+        self.memory: dict[str, dict] = {}
+        self._profile_stage = profile
+        self._profiler = cProfile.Profile() if profile is not None else None
+        self._memory_stage = profile_memory
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def span(self, name: str):
+        stack = self._local.__dict__.setdefault('stack', [])
+        stack.append(name)
+        path = tuple(stack)
+        profiled = name == self._profile_stage
+        traced = name == self._memory_stage and not tracemalloc.is_tracing()
+        if traced:
+            tracemalloc.start()
+        if profiled:
+            self._profiler.enable()
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            if profiled:
+                self._profiler.disable()
+            if traced:
+                self._record_memory(name)
+            stack.pop()
+            with self._lock:
+                self.spans.append(Span(path, start - self._origin, seconds, threading.get_ident()))
+
+    def _record_memory(self, name: str):
+        peak = tracemalloc.get_traced_memory()[1]
+        top = tracemalloc.take_snapshot().statistics('lineno')[:10]
+        tracemalloc.stop()
+        if peak >= self.memory.get(name, {}).get('peak_bytes', 0):
+            self.memory[name] = {'peak_bytes': peak, 'top': [{'line': str(stat.traceback[0]), 'bytes': stat.size, 'blocks': stat.count} for stat in top]}
+
+    def count(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def profile_stats(self, limit: int = 20) -> str | None:
+        if self._profiler is None or not self._profiler.getstats():
+            return None
+
+        output = io.StringIO()
+        pstats.Stats(self._profiler, stream=output).sort_stats('cumulative').print_stats(limit)
+        return output.getvalue()
+
+    def write(self, path: Path):
+        threads = {thread: i for i, thread in enumerate(dict.fromkeys(span.thread for span in self.spans))}
+        events = [{'name': span.path[-1], 'cat': '/'.join(span.path[:-1]) or 'import', 'ph': 'X', 'ts': span.start * 1e6, 'dur': span.seconds * 1e6, 'pid': os.getpid(), 'tid': threads[span.thread]} for span in self.spans]
+        data = {'traceEvents': events, 'displayTimeUnit': 'ms', 'otherData': {'counters': dict(self.counters), 'memory': self.memory}}
+
+        path.write_text(json.dumps(data, indent=1))
+
+        if self._profiler is not None and self._profiler.getstats():
+            self._profiler.dump_stats(path.with_suffix(f'.{self._profile_stage.replace(" ", "_")}.prof'))
+
+    def summary(self) -> str:
+        # spans of the same path added up, in the order they first started, indented by depth
+        totals: dict[tuple[str, ...], list] = {}
+        for span in sorted(self.spans, key=lambda span: span.start):
+            total = totals.setdefault(span.path, [0, 0.0])
+            total[0] += 1
+            total[1] += span.seconds
+
+        elapsed = time.perf_counter() - self._origin
+        lines = [f'{"stage":<40} {"calls":>6} {"seconds":>9} {"share":>6}']
+        for path, (calls, seconds) in totals.items():
+            lines.append(f'{"  " * (len(path) - 1) + path[-1]:<40} {calls:>6} {seconds:>9.3f} {seconds / elapsed:>6.1%}')
+        lines.append(f'{"total":<40} {"":>6} {elapsed:>9.3f}')
+
+        if self.counters:
+            lines.append('')
+            lines += [f'{name:<40} {value:>16,}' for name, value in sorted(self.counters.items())]
+
+        for name, memory in self.memory.items():
+            lines.append(f'\nPeak traced memory in {name}: {memory["peak_bytes"] / 1e6:.1f} MB, largest allocations still held at its end:')
+            lines += [f'  {allocation["bytes"] / 1e6:>8.2f} MB  {allocation["line"]}' for allocation in memory['top']]
+
+        if (stats := self.profile_stats()) is not None:
+            lines.append(f'\nProfile of {self._profile_stage}:')
+            lines.append(stats.rstrip())
+
+        return '\n'.join(lines)
+
+_trace: Trace | None = None
+_disabled = nullcontext()
+
+def start_trace(profile: str | None = None, profile_memory: str | None = None) -> Trace:
+    global _trace
+    _trace = Trace(profile, profile_memory)
+    return _trace
+
+def stop_trace() -> Trace | None:
+    global _trace
+    trace, _trace = _trace, None
+    return trace
+
+def span(name: str):
+    return _trace.span(name) if _trace is not None else _disabled
+
+def count(name: str, amount: int = 1):
+    if _trace is not None:
+        _trace.count(name, amount)
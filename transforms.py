@@ -0,0 +1,24 @@
+import numpy as np
+
+# rotation helpers in plain numpy, so writing poses doesn't need scipy
+
+# how close pitch can get to ±90 degrees before roll and yaw are no longer separable, scipy's threshold
+GIMBAL_LOCK = 1e-7
+
+def euler_xyz(rotations: np.ndarray) -> np.ndarray:
+    # extrinsic x, y, z (roll, pitch, yaw) angles of any stack of rotation matrices, matching scipy's
+    # Rotation.from_matrix(rotations).as_euler('xyz') to rounding, including zero yaw at gimbal lock.
+    # half turns are always +pi (scipy's sign depends on the signs of the zeros in the matrix)
+    rotations = np.asarray(rotations, dtype=np.float64)
+    cos_pitch = np.hypot(rotations[..., 0, 0], rotations[..., 1, 0])
+    pitch = np.arctan2(-rotations[..., 2, 0], cos_pitch)
+
+    locked = cos_pitch <= np.sin(GIMBAL_LOCK)
+    # at lock only roll - yaw (pitch up) or roll + yaw (pitch down) is defined, and it shows up in the second column
+    sign = np.where(rotations[..., 2, 0] < 0, 1.0, -1.0)
+    roll = np.where(locked, np.arctan2(sign * rotations[..., 0, 1], rotations[..., 1, 1]), np.arctan2(rotations[..., 2, 1], rotations[..., 2, 2]))
+    yaw = np.where(locked, 0.0, np.arctan2(rotations[..., 1, 0], rotations[..., 0, 0]))
+
+    angles = np.stack((roll, pitch, yaw), axis=-1)
+    # + 0.0 turns -0.0 into 0.0
+    return np.where(angles == -np.pi, np.pi, angles) + 0.0
@@ -0,0 +1,83 @@
+import threading
+import time
+import traceback
+from argparse import Namespace
+from pathlib import Path
+from typing import Callable
+
+from incremental import ImportState, diff_import
+from main import create_client, create_parser, parse_densities, write_model
+from onshape import fetch_assembly
+
+# keeps one process (and api session) alive and regenerates the model whenever the workspace's microversion changes.
+# between changes it keeps the parts, mates and link group mass properties in memory, so an edit only costs the
+# assembly and features requests, the mass properties and meshes of parts that were actually redefined, and the
+# link groups those parts are in. meshes and everything derived from them are cached on disk by content hash
+
+def assembly_changed(diff) -> bool:
+    return any((diff.added, diff.removed, diff.redefined, diff.moved, diff.mates_changed))
+
+def watch(args: Namespace, stop: threading.Event | None = None, on_update: Callable[[str], None] | None = None):
+    # on_update is called with each microversion once its model has been written
+    stop = stop or threading.Event()
+    model_path = Path(args.models_path, args.name)
+    meshes_path = Path(model_path, 'meshes/')
+    meshes_path.mkdir(exist_ok=True, parents=True)
+    sdf_path = Path(model_path, f'{args.name}.sdf')
+    state_path = Path(model_path, '.import_state.json')
+
+    client = create_client(args)
+    densities = parse_densities(args)
+    # warm start from the last import of this model
+    state = ImportState.load(state_path)
+    known_mass_props = state.known_mass_props() if state else {}
+    group_cache = state.group_cache() if state else {}
+
+    microversion = None
+    while not stop.is_set():
+        polled = time.perf_counter()
+        try:
+            current = client.get_current_microversion(args.document, args.workspace)
+            if current != microversion:
+                print(f'Microversion {current}')
+                parts, mates = fetch_assembly(client, args.document, args.workspace, args.element, meshes_path, args.concurrency, known_mass_props, densities)
+                fetched = time.perf_counter()
+
+                # edits elsewhere in the document move the microversion too
+                current_state = ImportState.from_import(parts, mates, {})
+                diff = diff_import(state, current_state) if state else None
+                if diff is None or assembly_changed(diff) or not sdf_path.exists():
+                    if diff is not None:
+                        print(diff)
+                    write_model(args, parts, mates, model_path, group_cache)
+                    state = ImportState.from_import(parts, mates, group_cache)
+                    state.save(state_path)
+                    print(f'Model written {time.perf_counter() - polled:.2f} s after the change was seen (fetch {fetched - polled:.2f} s, model {time.perf_counter() - fetched:.2f} s), the edit was at most {args.interval:g} s before that')
+                else:
+                    print('Assembly unchanged')
+
+                known_mass_props = {part.definition: part.mass_props for part in parts.values() if part.mass_source == 'api'}
+                microversion = current
+                if on_update:
+                    on_update(current)
+        except Exception:
+            # a failed poll or import is retried at the next one, the previous model stays in place
+            traceback.print_exc()
+
+        stop.wait(max(0.0, args.interval - (time.perf_counter() - polled)))
+
+def main():
+    parser = create_parser()
+    parser.description = 'Regenerate a model whenever its Onshape workspace changes'
+    parser.add_argument('--interval', type=float, default=2.0, help='Seconds between microversion checks')
+    args = parser.parse_args()
+    if args.testing or args.offline:
+        parser.error('watching needs the live api')
+
+    try:
+        watch(args)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()